@@ -0,0 +1,171 @@
+from argparse import ArgumentParser, Namespace
+from json import dump
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from tracemalloc import start, stop, get_traced_memory
+from typing import Callable, Optional, Iterable, Any, NamedTuple
+
+from join import join_in_memory, join_streaming, join_sqlite
+from preprocess import _PARSERS, _FORMATTERS, _matching_files
+from synthetic import generate
+
+# Measure the throughput and peak memory of each parser, the joins, and
+# each formatter on synthetic (or given) CSV files, to catch performance
+# regressions offline.
+
+_PREFIXES = ("caracteristiques", "lieux", "vehicules", "usagers")
+
+
+class _Measurement(NamedTuple):
+    stage: str
+    items: int
+    seconds: float
+    items_per_second: float
+    peak_memory_bytes: int
+
+
+def _count(items: Iterable[Any]) -> int:
+    # Consume the items one by one, without holding them, so that the
+    # peak memory of lazy stages is not inflated by their outputs.
+    return sum(1 for _ in items)
+
+
+def _measure(stage: str, run: Callable[[], Iterable[Any]]) -> _Measurement:
+    # Time without tracing memory allocations, as tracing slows down
+    # Python code a lot. Then run again to trace the peak memory.
+    start_time = perf_counter()
+    items = _count(run())
+    seconds = perf_counter() - start_time
+    start()
+    try:
+        _count(run())
+        _, peak_memory = get_traced_memory()
+    finally:
+        stop()
+    return _Measurement(
+        stage=stage,
+        items=items,
+        seconds=seconds,
+        items_per_second=items / seconds if seconds > 0 else 0,
+        peak_memory_bytes=peak_memory,
+    )
+
+
+def _print(measurement: _Measurement) -> None:
+    print(
+        f"{measurement.stage:<45} "
+        f"{measurement.items:>10,} items "
+        f"{measurement.seconds:>8.2f} s "
+        f"{measurement.items_per_second:>12,.0f} items/s "
+        f"{measurement.peak_memory_bytes / 2 ** 20:>10,.1f} MiB"
+    )
+
+
+def benchmark(data_dir: Path) -> list[_Measurement]:
+    files = sorted(data_dir.glob("*.csv"))
+    input_paths = [_matching_files(files, prefix) for prefix in _PREFIXES]
+    measurements: list[_Measurement] = []
+
+    def measure(stage: str, run: Callable[[], Iterable[Any]]) -> None:
+        measurement = _measure(stage, run)
+        _print(measurement)
+        measurements.append(measurement)
+
+    parsed: list[list[Any]] = []
+    for parser_type, paths in zip(_PARSERS, input_paths):
+        parser = parser_type()
+        measure(
+            f"parse {parser.description}",
+            lambda: parser.parse(paths),
+        )
+        parsed.append(list(parser.parse(paths)))
+
+    characteristics, locations, vehicles, persons = parsed
+    measure(
+        "join (memory)",
+        lambda: join_in_memory(
+            characteristics, locations, vehicles, persons
+        ),
+    )
+    measure(
+        "join (streaming)",
+        lambda: join_streaming(
+            characteristics, locations, vehicles, persons
+        ),
+    )
+    measure(
+        "join (sqlite)",
+        lambda: join_sqlite(
+            characteristics, locations, vehicles, persons
+        ),
+    )
+
+    accidents = list(join_in_memory(
+        characteristics, locations, vehicles, persons
+    ))
+    for output_format, formatter_type in _FORMATTERS.items():
+        with TemporaryDirectory() as output_dir:
+            formatter = formatter_type()
+
+            def run() -> Iterable[Any]:
+                formatter.format(accidents, Path(output_dir))
+                return accidents
+
+            measure(f"format {output_format}", run)
+    return measurements
+
+
+def main(
+        data_dir: Optional[Path],
+        accidents_per_year: int,
+        seed: int,
+        output_path: Optional[Path],
+) -> None:
+    with TemporaryDirectory() as temporary_dir:
+        if data_dir is None:
+            data_dir = Path(temporary_dir)
+            generate(data_dir, accidents_per_year, seed=seed)
+        measurements = benchmark(data_dir)
+    if output_path is not None:
+        with output_path.open("w") as file:
+            dump(
+                [measurement._asdict() for measurement in measurements],
+                file,
+                indent=2,
+            )
+
+
+def _parse_args() -> Namespace:
+    parser = ArgumentParser(
+        description="Benchmark the parsers, joins, and formatters."
+    )
+    parser.add_argument(
+        "-d", "--data-dir",
+        type=Path,
+        help="Directory with the yearly CSV files. "
+             "If omitted, synthetic files are generated.",
+    )
+    parser.add_argument(
+        "-n", "--accidents-per-year",
+        type=int,
+        default=10_000,
+        help="Number of synthetic accidents per year. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed for the synthetic data. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-o", "--output",
+        dest="output_path",
+        type=Path,
+        help="JSON file to write the measurements to.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(**vars(_parse_args()))
@@ -1,11 +1,16 @@
-from json import loads
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import new
+from json import loads, load, dump
 from pathlib import Path
-from typing import NamedTuple, Optional
+from typing import NamedTuple, Optional, Any, Mapping
 
 from bs4 import BeautifulSoup
-from requests import get
+from requests import Session
+from requests.adapters import HTTPAdapter
 from tqdm.auto import tqdm
 
+from instrument import stage
+
 # Directory paths.
 PROJECT_DIR = Path(__file__).parent.parent
 DATA_DIR = PROJECT_DIR / "static" / "data"
@@ -16,10 +21,40 @@ CACHE_DIR.mkdir(exist_ok=True)
 # Dataset base URL to fetch available data.
 DATASET_URL = "https://data.gouv.fr/en/datasets/53698f4ca3a729239d2036df/"
 
+# Size of the chunks to stream downloads in.
+_CHUNK_SIZE = 1 << 20
+
+
+def file_digest(path: Path, algorithm: str = "sha256") -> str:
+    digest = new(algorithm)
+    with path.open("rb") as file:
+        while chunk := file.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _Checksum(NamedTuple):
+    algorithm: str
+    value: str
+
 
 class _Artifact(NamedTuple):
     name: str
     url: str
+    size: Optional[int] = None
+    checksum: Optional[_Checksum] = None
+
+
+def _parse_checksum(json: Any) -> Optional[_Checksum]:
+    # Accept both data.gouv.fr's and SPDX's checksum notation.
+    if not isinstance(json, dict):
+        return None
+    algorithm = json.get("type", json.get("algorithm"))
+    value = json.get("value", json.get("checksumValue"))
+    if algorithm is None or value is None:
+        return None
+    algorithm = str(algorithm).lower().removeprefix("checksumalgorithm_")
+    return _Checksum(algorithm, str(value).lower())
 
 
 def _parse_artifact(json: dict) -> Optional[_Artifact]:
@@ -31,11 +66,18 @@ def _parse_artifact(json: dict) -> Optional[_Artifact]:
         return None
     name: str = json["name"]
     name = name.replace("_", "-")
-    return _Artifact(name, json["contentUrl"])
+    size = json.get("contentSize")
+    return _Artifact(
+        name,
+        json["contentUrl"],
+        size=int(size) if str(size).isdigit() else None,
+        checksum=_parse_checksum(json.get("checksum")),
+    )
 
 
-def _get_artifacts() -> list[_Artifact]:
-    response = get(DATASET_URL)
+def _get_artifacts(session: Session, dataset_url: str) -> list[_Artifact]:
+    response = session.get(dataset_url)
+    response.raise_for_status()
     document = BeautifulSoup(response.text, 'html.parser')
     json_string = document.find(id="json_ld").string
     json = loads(json_string)
@@ -56,25 +98,202 @@ def _get_artifacts() -> list[_Artifact]:
     return artifacts
 
 
-def _cache_artifact(artifact: _Artifact) -> Path:
-    path = CACHE_DIR / artifact.name
-    if path.exists():
-        assert path.is_file()
+class _Metadata(NamedTuple):
+    etag: Optional[str]
+    last_modified: Optional[str]
+    size: int
+    mtime_ns: int
+    sha256: str
+    checksum: Optional[_Checksum]
+
+
+def _metadata_path(path: Path) -> Path:
+    return path.with_name(f"{path.name}.json")
+
+
+def _load_metadata(path: Path) -> Optional[_Metadata]:
+    metadata_path = _metadata_path(path)
+    if not metadata_path.exists():
+        return None
+    with metadata_path.open("r") as file:
+        json = load(file)
+    checksum = json["checksum"]
+    return _Metadata(**{
+        **json,
+        "checksum": _Checksum(*checksum) if checksum is not None else None,
+    })
+
+
+def _save_metadata(path: Path, metadata: _Metadata) -> None:
+    metadata_path = _metadata_path(path)
+    temporary_path = metadata_path.with_name(f"{metadata_path.name}.tmp")
+    with temporary_path.open("w") as file:
+        dump(metadata._asdict(), file, indent=2)
+    temporary_path.replace(metadata_path)
+
+
+def cached_file_digest(path: Path) -> str:
+    # Reuse the SHA-256 digest of a cached artifact, unless it changed.
+    metadata = _load_metadata(path)
+    stat = path.stat()
+    if (
+            metadata is not None and
+            metadata.size == stat.st_size and
+            metadata.mtime_ns == stat.st_mtime_ns
+    ):
+        return metadata.sha256
+    return file_digest(path)
+
+
+def _is_intact(path: Path, metadata: _Metadata, verify: bool) -> bool:
+    # Unless verifying, only hash the file again if its size or
+    # modification time changed, so that corruption that preserves both
+    # (e.g., bit rot) goes unnoticed.
+    stat = path.stat()
+    if stat.st_size != metadata.size:
+        return False
+    if stat.st_mtime_ns == metadata.mtime_ns and not verify:
+        return True
+    return file_digest(path) == metadata.sha256
+
+
+def _range_validator(headers: Mapping[str, str]) -> Optional[str]:
+    # Validator to resume a download with. If-Range only accepts strong
+    # entity tags, otherwise the modification date.
+    etag = headers.get("ETag")
+    if etag is not None and not etag.startswith("W/"):
+        return etag
+    return headers.get("Last-Modified")
+
+
+def _download(
+        session: Session,
+        url: str,
+        path: Path,
+        validators: dict[str, str],
+) -> Optional[Mapping[str, str]]:
+    # Stream to a partial file first, and resume it if it already exists
+    # from an interrupted run. Only rename it when complete.
+    # Return the response headers, or None if the file was not modified.
+    partial_path = path.with_name(f"{path.name}.part")
+    # The validator of the partial file's response, if any.
+    validator_path = _metadata_path(partial_path)
+    offset = 0
+    headers = validators
+    if partial_path.exists() and validator_path.exists():
+        offset = partial_path.stat().st_size
+        # Only get the remaining range if the file did not change since,
+        # or the full file otherwise.
+        headers = {
+            "Range": f"bytes={offset}-",
+            "If-Range": validator_path.read_text(),
+        }
+    with session.get(url, headers=headers, stream=True) as response:
+        if response.status_code == 304:
+            return None
+        if response.status_code == 416:
+            # The partial file is invalid, so start over.
+            partial_path.unlink(missing_ok=True)
+            validator_path.unlink(missing_ok=True)
+            return _download(session, url, path, validators)
+        response.raise_for_status()
+        resumed = (
+                offset > 0 and
+                response.status_code == 206 and
+                response.headers.get("Content-Range", "")
+                .startswith(f"bytes {offset}-")
+        )
+        if not resumed:
+            # Partial files without a validator cannot be resumed safely.
+            validator = _range_validator(response.headers)
+            if validator is not None:
+                validator_path.write_text(validator)
+            else:
+                validator_path.unlink(missing_ok=True)
+        with partial_path.open("ab" if resumed else "wb") as file:
+            for chunk in response.iter_content(_CHUNK_SIZE):
+                file.write(chunk)
+    partial_path.replace(path)
+    validator_path.unlink(missing_ok=True)
+    return response.headers
+
+
+def _cache_artifact(
+        session: Session,
+        artifact: _Artifact,
+        cache_dir: Path,
+        verify: bool,
+) -> Path:
+    path = cache_dir / artifact.name
+    metadata = _load_metadata(path) if path.exists() else None
+    validators: dict[str, str] = {}
+    if (
+            metadata is not None and
+            (artifact.size is None or artifact.size == metadata.size) and
+            artifact.checksum == metadata.checksum and
+            _is_intact(path, metadata, verify)
+    ):
+        # Revalidate the intact file, unless the published metadata changed.
+        if metadata.etag is not None:
+            validators["If-None-Match"] = metadata.etag
+        if metadata.last_modified is not None:
+            validators["If-Modified-Since"] = metadata.last_modified
+    headers = _download(session, artifact.url, path, validators)
+    if headers is None:
+        assert metadata is not None
+        mtime_ns = path.stat().st_mtime_ns
+        if mtime_ns != metadata.mtime_ns:
+            _save_metadata(path, metadata._replace(mtime_ns=mtime_ns))
         return path
-    response = get(artifact.url)
-    with path.open("wb") as file:
-        file.write(response.content)
+
+    if artifact.checksum is not None:
+        digest = file_digest(path, artifact.checksum.algorithm)
+        if digest != artifact.checksum.value:
+            path.unlink()
+            raise ValueError(f"Checksum mismatch for {artifact.name}.")
+    stat = path.stat()
+    if artifact.size is not None and artifact.size != stat.st_size:
+        path.unlink()
+        raise ValueError(f"Size mismatch for {artifact.name}.")
+    _save_metadata(path, _Metadata(
+        etag=headers.get("ETag"),
+        last_modified=headers.get("Last-Modified"),
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        sha256=file_digest(path),
+        checksum=artifact.checksum,
+    ))
     return path
 
 
-def cache_artifacts() -> list[Path]:
-    artifacts = _get_artifacts()
-    artifacts = tqdm(
-        artifacts,
-        desc="Downloading artifacts",
-        unit="file"
-    )
-    return [
-        _cache_artifact(artifact)
-        for artifact in artifacts
-    ]
+def cache_artifacts(
+        max_workers: int = 4,
+        dataset_url: str = DATASET_URL,
+        cache_dir: Path = CACHE_DIR,
+        verify: bool = False,
+) -> list[Path]:
+    with Session() as session:
+        # Keep one connection alive for each concurrent download.
+        adapter = HTTPAdapter(
+            pool_connections=max_workers,
+            pool_maxsize=max_workers,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        with stage("download") as download_stage:
+            artifacts = _get_artifacts(session, dataset_url)
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                paths = executor.map(
+                    lambda artifact: _cache_artifact(
+                        session, artifact, cache_dir, verify
+                    ),
+                    artifacts,
+                )
+                paths = list(tqdm(
+                    paths,
+                    desc="Downloading artifacts",
+                    total=len(artifacts),
+                    unit="file",
+                ))
+            download_stage.items = len(paths)
+            return paths
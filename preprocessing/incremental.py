@@ -0,0 +1,213 @@
+from hashlib import sha256
+from json import load, dump
+from pathlib import Path
+from shutil import copyfileobj, rmtree
+from typing import (
+    Collection, Mapping, Optional, Any, Callable, Tuple, Iterable
+)
+
+from pyarrow.parquet import ParquetFile, ParquetWriter
+
+from cache import CACHE_DIR, file_digest
+from join import join_streaming
+from parse.accident import AccidentsJsonlFormatter
+from parse.index import JsonlIndex
+from parse.parquet import AccidentsParquetFormatter, SCHEMAS
+from parse.table_cache import source_version
+
+# Directory of the per-year intermediate outputs.
+YEARS_DIR = CACHE_DIR / "years"
+
+
+def _version(parser_types: Iterable[type]) -> str:
+    # Any change to parsing, joining, or formatting (including the model)
+    # invalidates all years. So do changes of the Parquet schemas (e.g.,
+    # with another version of PyArrow), as files with different schemas
+    # cannot be spliced.
+    digest = sha256(source_version(
+        *parser_types,
+        join_streaming,
+        AccidentsJsonlFormatter,
+        AccidentsParquetFormatter,
+    ).encode())
+    for name, schema in sorted(SCHEMAS.items()):
+        digest.update(name.encode())
+        digest.update(schema.serialize().to_pybytes())
+    return digest.hexdigest()
+
+
+def _fingerprint(path: Path, previous: Optional[dict[str, Any]]) -> dict:
+    # Only hash the file again if its size or modification time changed.
+    stat = path.stat()
+    if (
+            previous is not None and
+            previous["size"] == stat.st_size and
+            previous["mtime_ns"] == stat.st_mtime_ns
+    ):
+        return previous
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": file_digest(path),
+    }
+
+
+def _splice_jsonl(input_paths: list[Path], output_path: Path) -> None:
+    with output_path.open("wb") as output_file:
+        for input_path in input_paths:
+            with input_path.open("rb") as input_file:
+                copyfileobj(input_file, output_file)
+
+
+def _splice_index(input_paths: list[Path], output_path: Path) -> None:
+    # Shift the offsets of each year's index by the preceding years' sizes.
+    index = JsonlIndex()
+    offset = 0
+    for input_path in input_paths:
+        index.extend(JsonlIndex.read(input_path), offset)
+        offset += input_path.with_suffix("").stat().st_size
+    index.write(output_path)
+
+
+def _splice_parquet(input_paths: list[Path], output_path: Path) -> None:
+    # Copy the row groups, so that each year stays one row group.
+    writer: Optional[ParquetWriter] = None
+    try:
+        for input_path in input_paths:
+            input_file = ParquetFile(input_path)
+            if writer is None:
+                writer = ParquetWriter(output_path, input_file.schema_arrow)
+            for index in range(input_file.num_row_groups):
+                writer.write_table(input_file.read_row_group(index))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+# How to splice each file written by each output format.
+_FORMATS: dict[
+    str,
+    Tuple[Tuple[str, Callable[[list[Path], Path], None]], ...]
+] = {
+    "jsonl": (
+        ("accidents.jsonl", _splice_jsonl),
+        ("accidents.jsonl.index", _splice_index),
+    ),
+    "parquet": (
+        ("accidents.parquet", _splice_parquet),
+        ("vehicles.parquet", _splice_parquet),
+        ("persons.parquet", _splice_parquet),
+    ),
+}
+SUPPORTED_FORMATS = _FORMATS.keys()
+
+
+class IncrementalBuild:
+    def __init__(
+            self,
+            inputs: Mapping[int, Collection[Path]],
+            formats: Collection[str],
+            parser_types: Iterable[type],
+            options: Mapping[str, Any],
+            years_dir: Path = YEARS_DIR,
+    ):
+        # Changed options of the formatters (e.g., the JSON backend) also
+        # invalidate all years, as their outputs are spliced together.
+        self._inputs = inputs
+        self._formats = formats
+        self._years_dir = years_dir
+        self._manifest_path = years_dir / "manifest.json"
+        version = _version(parser_types)
+        self._manifest: dict[str, Any] = {
+            "version": version,
+            "options": dict(options),
+            "years": {},
+        }
+        if self._manifest_path.exists():
+            with self._manifest_path.open("r") as file:
+                manifest = load(file)
+            if (
+                    manifest["version"] == version and
+                    manifest.get("options") == self._manifest["options"]
+            ):
+                self._manifest = manifest
+        self._fingerprints: dict[int, dict[str, dict]] = {}
+        for year, paths in inputs.items():
+            previous = self._year_entry(year).get("inputs", {})
+            self._fingerprints[year] = {
+                path.name: _fingerprint(path, previous.get(path.name))
+                for path in paths
+            }
+
+    def _year_entry(self, year: int) -> dict[str, Any]:
+        return self._manifest["years"].get(str(year), {})
+
+    def year_dir(self, year: int) -> Path:
+        return self._years_dir / str(year)
+
+    def _is_outdated(self, year: int) -> bool:
+        entry = self._year_entry(year)
+        if "inputs" not in entry:
+            return True
+        previous = entry["inputs"]
+        current = self._fingerprints[year]
+        if previous.keys() != current.keys():
+            return True
+        if any(
+                previous[name]["sha256"] != current[name]["sha256"]
+                for name in current
+        ):
+            return True
+        return any(
+            output_format not in entry["formats"] or
+            not (self.year_dir(year) / name).exists()
+            for output_format in self._formats
+            for name, _ in _FORMATS[output_format]
+        )
+
+    def outdated_years(self) -> list[int]:
+        outdated_years = []
+        for year in sorted(self._inputs.keys()):
+            if self._is_outdated(year):
+                outdated_years.append(year)
+            else:
+                # Remember new modification times of unchanged files.
+                self._year_entry(year)["inputs"] = self._fingerprints[year]
+        self._save()
+        return outdated_years
+
+    def prepare(self, year: int) -> Path:
+        # Start from an empty directory for the year's outputs.
+        year_dir = self.year_dir(year)
+        if year_dir.exists():
+            rmtree(year_dir)
+        year_dir.mkdir(parents=True)
+        self._manifest["years"].pop(str(year), None)
+        self._save()
+        return year_dir
+
+    def complete(self, year: int) -> None:
+        self._manifest["years"][str(year)] = {
+            "inputs": self._fingerprints[year],
+            "formats": sorted(self._formats),
+        }
+        self._save()
+
+    def _save(self) -> None:
+        self._years_dir.mkdir(exist_ok=True)
+        temporary_path = self._manifest_path.with_suffix(".json.tmp")
+        with temporary_path.open("w") as file:
+            dump(self._manifest, file, indent=2)
+        temporary_path.replace(self._manifest_path)
+
+    def splice(self, output_dir: Path) -> None:
+        years = sorted(self._inputs.keys())
+        if len(years) == 0:
+            return
+        for output_format in self._formats:
+            for name, splice in _FORMATS[output_format]:
+                input_paths = [self.year_dir(year) / name for year in years]
+                output_path = output_dir / name
+                temporary_path = output_path.with_name(f"{name}.tmp")
+                splice(input_paths, temporary_path)
+                temporary_path.replace(output_path)
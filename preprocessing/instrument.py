@@ -0,0 +1,245 @@
+from contextlib import contextmanager
+from json import dump
+from pathlib import Path
+from sys import platform
+from threading import Lock, local
+from time import perf_counter, process_time, thread_time
+from tracemalloc import (
+    start as start_tracing, stop as stop_tracing, is_tracing,
+    get_traced_memory, reset_peak
+)
+from typing import (
+    Iterable, Iterator, NamedTuple, Optional, TypeVar, Any
+)
+
+# Opt-in instrumentation of the stages of a preprocessing run
+# (downloading, parsing, joining, formatting, ...).
+# Stages time themselves exclusively: while a stage runs another stage
+# in the same thread (e.g., when a formatter pulls accidents from the
+# join, which pulls records from the parsers), the inner stage's time is
+# not counted for the outer stage. Multiple formatters run in their own
+# threads and their wall time includes waiting for the join, so compare
+# their CPU time instead.
+
+T = TypeVar("T")
+
+
+class StageReport(NamedTuple):
+    name: str
+    # Number of times the stage ran, e.g., once per year when building
+    # incrementally.
+    runs: int
+    wall_seconds: float
+    # CPU time of the thread that ran the stage.
+    cpu_seconds: float
+    items: int
+    items_per_second: Optional[float]
+    # Peak resident memory of the process when the stage ended (if known).
+    peak_rss_bytes: Optional[int]
+    # Peak traced Python memory while the stage ran (if tracing).
+    peak_traced_bytes: Optional[int]
+
+
+class Stage:
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_rss_bytes: Optional[int] = None
+        self.peak_traced_bytes: Optional[int] = None
+
+
+_enabled = False
+_lock = Lock()
+_stages: list[Stage] = []
+_open_stages: list[Stage] = []
+# Stack of stages currently running in each thread.
+_running = local()
+# Sentinel for exhausted iterators.
+_END: Any = object()
+
+
+def _running_stages() -> list[Stage]:
+    if not hasattr(_running, "stages"):
+        _running.stages = []
+    return _running.stages
+
+
+def _peak_rss() -> Optional[int]:
+    try:
+        from resource import getrusage, RUSAGE_SELF
+    except ImportError:
+        # Not available on Windows.
+        return None
+    peak = getrusage(RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kibibytes elsewhere.
+    return peak if platform == "darwin" else peak * 1024
+
+
+def _update_peak_traced() -> None:
+    # Must be called with the lock held.
+    if not is_tracing():
+        return
+    _, peak = get_traced_memory()
+    for stage in _open_stages:
+        stage.peak_traced_bytes = max(stage.peak_traced_bytes or 0, peak)
+    reset_peak()
+
+
+def _open(stage: Stage) -> None:
+    with _lock:
+        _update_peak_traced()
+        _stages.append(stage)
+        _open_stages.append(stage)
+
+
+def _close(stage: Stage) -> None:
+    with _lock:
+        _update_peak_traced()
+        _open_stages.remove(stage)
+    stage.peak_rss_bytes = _peak_rss()
+
+
+@contextmanager
+def _timed(stage: Stage) -> Iterator[None]:
+    running = _running_stages()
+    running.append(stage)
+    wall_start = perf_counter()
+    cpu_start = thread_time()
+    try:
+        yield
+    finally:
+        wall_seconds = perf_counter() - wall_start
+        cpu_seconds = thread_time() - cpu_start
+        running.pop()
+        stage.wall_seconds += wall_seconds
+        stage.cpu_seconds += cpu_seconds
+        if len(running) > 0:
+            running[-1].wall_seconds -= wall_seconds
+            running[-1].cpu_seconds -= cpu_seconds
+
+
+@contextmanager
+def stage(name: str) -> Iterator[Stage]:
+    # Time a block of code. Set or increase the stage's items while
+    # running it.
+    current = Stage(name)
+    if not _enabled:
+        yield current
+        return
+    _open(current)
+    try:
+        with _timed(current):
+            yield current
+    finally:
+        _close(current)
+
+
+def counted(current: Stage, items: Iterable[T]) -> Iterator[T]:
+    # Count the items consumed by a stage.
+    for item in items:
+        current.items += 1
+        yield item
+
+
+def _instrumented(name: str, items: Iterable[T]) -> Iterator[T]:
+    current = Stage(name)
+    _open(current)
+    try:
+        iterator = iter(items)
+        while True:
+            with _timed(current):
+                item = next(iterator, _END)
+            if item is _END:
+                return
+            current.items += 1
+            yield item
+    finally:
+        _close(current)
+
+
+def instrument(name: str, items: Iterable[T]) -> Iterable[T]:
+    # Time producing the items of a (lazy) iterable, and count them.
+    if not _enabled:
+        return items
+    return _instrumented(name, items)
+
+
+def _reports() -> list[StageReport]:
+    # Merge stages of the same name, in order of their first run.
+    stages: dict[str, list[Stage]] = {}
+    for current in _stages:
+        stages.setdefault(current.name, []).append(current)
+    reports = []
+    for name, runs in stages.items():
+        wall_seconds = sum(run.wall_seconds for run in runs)
+        items = sum(run.items for run in runs)
+        peak_rss_bytes = [
+            run.peak_rss_bytes
+            for run in runs
+            if run.peak_rss_bytes is not None
+        ]
+        peak_traced_bytes = [
+            run.peak_traced_bytes
+            for run in runs
+            if run.peak_traced_bytes is not None
+        ]
+        reports.append(StageReport(
+            name=name,
+            runs=len(runs),
+            wall_seconds=wall_seconds,
+            cpu_seconds=sum(run.cpu_seconds for run in runs),
+            items=items,
+            items_per_second=(
+                items / wall_seconds if wall_seconds > 0 else None
+            ),
+            peak_rss_bytes=max(peak_rss_bytes, default=None),
+            peak_traced_bytes=max(peak_traced_bytes, default=None),
+        ))
+    return reports
+
+
+@contextmanager
+def instrumented_run(
+        report_path: Optional[Path],
+        trace_memory: bool = False,
+) -> Iterator[None]:
+    # Instrument all stages of the run and write a JSON report when done
+    # (or failed). Without a report path, instrumentation is disabled.
+    global _enabled
+    if report_path is None:
+        yield
+        return
+    _enabled = True
+    if trace_memory:
+        # Tracing slows down allocations considerably.
+        start_tracing()
+    _stages.clear()
+    wall_start = perf_counter()
+    cpu_start = process_time()
+    failed = True
+    try:
+        yield
+        failed = False
+    finally:
+        wall_seconds = perf_counter() - wall_start
+        cpu_seconds = process_time() - cpu_start
+        _enabled = False
+        if trace_memory:
+            stop_tracing()
+        with report_path.open("w") as file:
+            dump(
+                {
+                    "failed": failed,
+                    "wall_seconds": wall_seconds,
+                    "cpu_seconds": cpu_seconds,
+                    "peak_rss_bytes": _peak_rss(),
+                    "stages": [
+                        report._asdict()
+                        for report in _reports()
+                    ],
+                },
+                file,
+                indent=2,
+            )
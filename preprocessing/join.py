@@ -0,0 +1,372 @@
+from collections import defaultdict
+from itertools import chain, groupby
+from operator import itemgetter
+from pathlib import Path
+from sqlite3 import connect, Connection
+from tempfile import TemporaryDirectory
+from typing import Optional, Iterable, Iterator, Tuple, Type, NamedTuple
+
+from model import Accident, Vehicle, Person, Location, AccidentId, VehicleId, \
+    VehicleCategory, Characteristic, RecordTable
+from parse.rows import row_fields, compile_row_encoder, compile_row_decoder
+
+
+def _missing_vehicle(vehicle_id: VehicleId) -> Vehicle:
+    # Vehicle of persons, whose vehicle is missing.
+    return Vehicle(
+        *vehicle_id,
+        traffic_direction=None,
+        vehicle_category=VehicleCategory.OTHER,
+        fixed_obstacle=None,
+        mobile_obstacle=None,
+        shock_point=None,
+        primary_manoeuvre=None,
+        engine=None,
+        occupancy=None,
+        persons=[]
+    )
+
+
+def join_in_memory(
+        characteristics: Iterable[Tuple[AccidentId, Characteristic]],
+        locations: Iterable[Tuple[AccidentId, Location]],
+        vehicles: Iterable[Tuple[AccidentId, VehicleId, Vehicle]],
+        persons: Iterable[Tuple[AccidentId, VehicleId, Person]],
+) -> Iterator[Accident]:
+    # Hold the records in compact, array-backed tables, and only index
+    # their rows by accident ID (and vehicle ID).
+    characteristics_table = RecordTable(Characteristic)
+    accident_characteristics: dict[int, int] = {}
+    for (accident_id,), characteristic in characteristics:
+        accident_characteristics[accident_id] = len(characteristics_table)
+        characteristics_table.append(characteristic)
+    locations_table = RecordTable(Location)
+    accident_locations: dict[int, int] = {}
+    for (accident_id,), location in locations:
+        accident_locations[accident_id] = len(locations_table)
+        locations_table.append(location)
+    vehicles_table = RecordTable(Vehicle)
+    accident_vehicles: dict[int, dict[VehicleId, int]] = (
+        defaultdict(lambda: {})
+    )
+    for (accident_id,), vehicle_id, vehicle in vehicles:
+        accident_vehicles[accident_id][vehicle_id] = len(vehicles_table)
+        vehicles_table.append(vehicle)
+    persons_table = RecordTable(Person)
+    accident_persons: dict[int, dict[VehicleId, list[int]]] = (
+        defaultdict(lambda: defaultdict(lambda: []))
+    )
+    for (accident_id,), vehicle_id, person in persons:
+        accident_persons[accident_id][vehicle_id].append(len(persons_table))
+        persons_table.append(person)
+
+    accident_ids_characteristics = set(accident_characteristics.keys())
+    accident_ids_locations = set(accident_locations.keys())
+    assert accident_ids_locations == accident_ids_characteristics
+    accident_ids_vehicles = set(accident_vehicles.keys())
+    assert accident_ids_vehicles.issubset(accident_characteristics)
+    accident_ids_persons = set(accident_persons.keys())
+    assert accident_ids_persons.issubset(accident_ids_vehicles)
+
+    for accident_id, persons_dict in accident_persons.items():
+        vehicles_dict = accident_vehicles[accident_id]
+        persons_vehicle_ids = set(persons_dict.keys())
+        vehicle_ids = set(vehicles_dict.keys())
+        if not persons_vehicle_ids.issubset(vehicle_ids):
+            for vehicle_id in persons_vehicle_ids - vehicle_ids:
+                # Create new vehicle entry.
+                accident_vehicles[accident_id][vehicle_id] = (
+                    len(vehicles_table)
+                )
+                vehicles_table.append(_missing_vehicle(vehicle_id))
+
+    for accident_id in accident_characteristics.keys():
+        yield Accident(
+            accident_id,
+            *characteristics_table[accident_characteristics[accident_id]],
+            *locations_table[accident_locations[accident_id]],
+            vehicles=[
+                vehicles_table[vehicle_index]._replace(
+                    persons=[
+                        persons_table[person_index]
+                        for person_index in (
+                            accident_persons[accident_id][vehicle_id]
+                        )
+                    ]
+                )
+                for vehicle_id, vehicle_index in (
+                    accident_vehicles[accident_id].items()
+                )
+            ],
+        )
+
+
+def accident_year(accident_id: int) -> int:
+    # Accident IDs are prefixed with the year of the accident.
+    return accident_id // 100_000_000
+
+
+def _group_by_year(
+        items: Iterable[Tuple[AccidentId, ...]]
+) -> Iterator[Tuple[int, list[Tuple[AccidentId, ...]]]]:
+    previous_year: Optional[int] = None
+    for year, group in groupby(
+            items,
+            key=lambda item: accident_year(item[0].accident_id),
+    ):
+        # The streams must be sorted by year, i.e., one run per year.
+        assert previous_year is None or year > previous_year
+        previous_year = year
+        yield year, list(group)
+
+
+def join_streaming(
+        characteristics: Iterable[Tuple[AccidentId, Characteristic]],
+        locations: Iterable[Tuple[AccidentId, Location]],
+        vehicles: Iterable[Tuple[AccidentId, VehicleId, Vehicle]],
+        persons: Iterable[Tuple[AccidentId, VehicleId, Person]],
+) -> Iterator[Accident]:
+    # Merge the year-sorted streams and join one year at a time,
+    # so that only one year's records are held in memory.
+    streams = [
+        _group_by_year(items)
+        for items in (characteristics, locations, vehicles, persons)
+    ]
+    heads = [next(stream, None) for stream in streams]
+    while any(head is not None for head in heads):
+        year = min(head[0] for head in heads if head is not None)
+        year_items: list[list[Tuple[AccidentId, ...]]] = []
+        for index, head in enumerate(heads):
+            if head is not None and head[0] == year:
+                year_items.append(head[1])
+                heads[index] = next(streams[index], None)
+            else:
+                year_items.append([])
+        yield from join_in_memory(*year_items)
+
+
+# Staging tables of the SQLite join, with the keys of each record (unless
+# they are fields of the record) and a column for each encoded field.
+# Columns are untyped, such that values are stored exactly as given.
+_SQLITE_TABLES: dict[str, Tuple[Tuple[str, ...], Type[NamedTuple]]] = {
+    "characteristics": (("accident_id",), Characteristic),
+    "locations": (("accident_id",), Location),
+    "vehicles": (("accident_id",), Vehicle),
+    "persons": (("accident_id", "vehicle_name", "vehicle_id"), Person),
+}
+
+# Indexes are created after inserting, which is faster.
+_SQLITE_INDEXES = """
+CREATE INDEX characteristics_accident ON characteristics (accident_id);
+CREATE INDEX locations_accident ON locations (accident_id);
+CREATE INDEX vehicles_vehicle
+    ON vehicles (accident_id, vehicle_name, vehicle_id);
+CREATE INDEX persons_vehicle
+    ON persons (accident_id, vehicle_name, vehicle_id);
+"""
+
+# Same checks as in the in-memory join.
+_SQLITE_CHECKS = {
+    "Locations and characteristics differ.": """
+        SELECT EXISTS (
+            SELECT 1 FROM locations AS l WHERE NOT EXISTS (
+                SELECT 1 FROM characteristics AS c
+                WHERE c.accident_id = l.accident_id
+            )
+        ) OR EXISTS (
+            SELECT 1 FROM characteristics AS c WHERE NOT EXISTS (
+                SELECT 1 FROM locations AS l
+                WHERE l.accident_id = c.accident_id
+            )
+        )
+    """,
+    "Vehicles without characteristics.": """
+        SELECT EXISTS (
+            SELECT 1 FROM vehicles AS v WHERE NOT EXISTS (
+                SELECT 1 FROM characteristics AS c
+                WHERE c.accident_id = v.accident_id
+            )
+        )
+    """,
+    "Persons without vehicles.": """
+        SELECT EXISTS (
+            SELECT 1 FROM persons AS p WHERE NOT EXISTS (
+                SELECT 1 FROM vehicles AS v
+                WHERE v.accident_id = p.accident_id
+            )
+        )
+    """,
+}
+
+# Vehicles of persons, whose vehicle is missing, in order of their first
+# person.
+_SQLITE_MISSING_VEHICLES = """
+SELECT p.accident_id, p.vehicle_name, p.vehicle_id
+FROM persons AS p
+WHERE NOT EXISTS (
+    SELECT 1 FROM vehicles AS v
+    WHERE v.accident_id = p.accident_id
+    AND v.vehicle_name = p.vehicle_name
+    AND v.vehicle_id IS p.vehicle_id
+)
+GROUP BY p.accident_id, p.vehicle_name, p.vehicle_id
+ORDER BY MIN(p.rowid)
+"""
+
+
+def _sqlite_columns(table: str) -> list[str]:
+    keys, item_type = _SQLITE_TABLES[table]
+    return [
+        f'"{column}"'
+        for column in chain(keys, row_fields(item_type))
+    ]
+
+
+def _sqlite_groups(
+        connection: Connection,
+        table: str,
+) -> Iterator[Tuple[int, list[tuple]]]:
+    # Rows of each accident, in ID order and then in insertion order.
+    rows = connection.execute(
+        f"SELECT * FROM {table} ORDER BY accident_id, rowid"
+    )
+    for accident_id, group in groupby(rows, key=itemgetter(0)):
+        yield accident_id, list(group)
+
+
+def join_sqlite(
+        characteristics: Iterable[Tuple[AccidentId, Characteristic]],
+        locations: Iterable[Tuple[AccidentId, Location]],
+        vehicles: Iterable[Tuple[AccidentId, VehicleId, Vehicle]],
+        persons: Iterable[Tuple[AccidentId, VehicleId, Person]],
+        memory_budget: int = 256 << 20,
+        directory: Optional[Path] = None,
+) -> Iterator[Accident]:
+    # Stage the records in an on-disk SQLite database, check and repair
+    # them there, and stream the joined accidents in ID order. Only the
+    # database's page cache (bounded by the memory budget) and one
+    # accident are held in memory.
+    encode_characteristic = compile_row_encoder(Characteristic)
+    encode_location = compile_row_encoder(Location)
+    encode_vehicle = compile_row_encoder(Vehicle)
+    encode_person = compile_row_encoder(Person)
+    decode_characteristic = compile_row_decoder(Characteristic, offset=1)
+    decode_location = compile_row_decoder(Location, offset=1)
+    decode_vehicle = compile_row_decoder(Vehicle, offset=1)
+    decode_person = compile_row_decoder(Person, offset=3)
+    with TemporaryDirectory(dir=directory) as temporary_dir:
+        connection = connect(Path(temporary_dir) / "join.sqlite")
+        try:
+            connection.executescript(f"""
+                PRAGMA journal_mode = OFF;
+                PRAGMA synchronous = OFF;
+                PRAGMA temp_store = FILE;
+                PRAGMA cache_size = -{max(memory_budget >> 10, 1)};
+            """)
+            inserts = {}
+            for table in _SQLITE_TABLES.keys():
+                columns = _sqlite_columns(table)
+                connection.execute(
+                    f"CREATE TABLE {table} ({', '.join(columns)})"
+                )
+                inserts[table] = (
+                    f"INSERT INTO {table} "
+                    f"VALUES ({', '.join('?' * len(columns))})"
+                )
+            with connection:
+                connection.executemany(
+                    inserts["characteristics"],
+                    (
+                        (accident_id, *encode_characteristic(characteristic))
+                        for (accident_id,), characteristic in characteristics
+                    ),
+                )
+                connection.executemany(
+                    inserts["locations"],
+                    (
+                        (accident_id, *encode_location(location))
+                        for (accident_id,), location in locations
+                    ),
+                )
+                connection.executemany(
+                    inserts["vehicles"],
+                    (
+                        (accident_id, *encode_vehicle(vehicle))
+                        for (accident_id,), _, vehicle in vehicles
+                    ),
+                )
+                connection.executemany(
+                    inserts["persons"],
+                    (
+                        (accident_id, *vehicle_id, *encode_person(person))
+                        for (accident_id,), vehicle_id, person in persons
+                    ),
+                )
+                connection.executescript(_SQLITE_INDEXES)
+                for message, check in _SQLITE_CHECKS.items():
+                    (failed,), = connection.execute(check)
+                    assert not failed, message
+                missing_vehicles = connection.execute(
+                    _SQLITE_MISSING_VEHICLES
+                ).fetchall()
+                connection.executemany(
+                    inserts["vehicles"],
+                    (
+                        (
+                            accident_id,
+                            *encode_vehicle(_missing_vehicle(
+                                VehicleId(vehicle_name, vehicle_id)
+                            )),
+                        )
+                        for accident_id, vehicle_name, vehicle_id
+                        in missing_vehicles
+                    ),
+                )
+
+            location_groups = _sqlite_groups(connection, "locations")
+            vehicle_groups = _sqlite_groups(connection, "vehicles")
+            person_groups = _sqlite_groups(connection, "persons")
+            vehicle_group = next(vehicle_groups, None)
+            person_group = next(person_groups, None)
+            for accident_id, characteristic_rows in _sqlite_groups(
+                    connection, "characteristics"
+            ):
+                location_accident_id, location_rows = next(location_groups)
+                assert location_accident_id == accident_id
+                accident_vehicles: dict[VehicleId, Vehicle] = {}
+                if (
+                        vehicle_group is not None and
+                        vehicle_group[0] == accident_id
+                ):
+                    for row in vehicle_group[1]:
+                        accident_vehicles[VehicleId(row[1], row[2])] = (
+                            decode_vehicle(row)
+                        )
+                    vehicle_group = next(vehicle_groups, None)
+                accident_persons: dict[VehicleId, list[Person]] = (
+                    defaultdict(lambda: [])
+                )
+                if (
+                        person_group is not None and
+                        person_group[0] == accident_id
+                ):
+                    for row in person_group[1]:
+                        accident_persons[VehicleId(row[1], row[2])].append(
+                            decode_person(row)
+                        )
+                    person_group = next(person_groups, None)
+                # Later duplicates replace earlier ones, like in the
+                # in-memory join.
+                yield Accident(
+                    accident_id,
+                    *decode_characteristic(characteristic_rows[-1]),
+                    *decode_location(location_rows[-1]),
+                    vehicles=[
+                        vehicle._replace(
+                            persons=accident_persons[vehicle_id]
+                        )
+                        for vehicle_id, vehicle in accident_vehicles.items()
+                    ],
+                )
+        finally:
+            connection.close()
@@ -1,7 +1,13 @@
+from array import array
 from collections.abc import Set, Collection
-from datetime import datetime
+from datetime import datetime, timedelta
 from enum import IntEnum
-from typing import Optional, NamedTuple
+from typing import (
+    Optional, NamedTuple, Any, Callable, Iterable, Iterator, Sequence,
+    Tuple, Type, TypeVar, get_args, get_origin, get_type_hints, overload
+)
+
+from parse.codegen import FunctionCompiler, is_enum, unwrap_optional
 
 
 class Light(IntEnum):
@@ -120,7 +126,7 @@ class Location(NamedTuple):
     upstream_terminal: Optional[int]
     upstream_terminal_distance_meters: Optional[float]
     curvature: Optional[Curvature]
-    central_reservation_width_meters: int
+    central_reservation_width_meters: float
     road_traffic_width_meters: float
 
 
@@ -390,6 +396,290 @@ class Accident(NamedTuple):
     upstream_terminal: Optional[int]
     upstream_terminal_distance_meters: Optional[float]
     curvature: Optional[Curvature]
-    central_reservation_width_meters: int
+    central_reservation_width_meters: float
     road_traffic_width_meters: float
     vehicles: Collection[Vehicle]
+
+
+# Compact, array-backed tables of records, with one column per field:
+# enums as member codes, integers and timestamps (seconds since the epoch)
+# as 64-bit integers, floats as doubles, strings and sets as codes of
+# their distinct values, and collections of children as child tables
+# indexed by offsets. Records are only materialized as named tuples when
+# accessed, by functions compiled for each record type.
+
+_T = TypeVar("_T", bound=tuple)
+
+_NULL_INT = -(1 << 63)
+_EPOCH = datetime(1970, 1, 1)
+_SECOND = timedelta(seconds=1)
+
+# Whether a float column's value is a float, None, or an integer, so that
+# records are restored exactly.
+_FLOAT, _NONE, _INTEGER = range(3)
+
+
+class _Codes(dict):
+    # Code of each distinct value, in order of first occurrence.
+    def __init__(self, values: Iterable[Any] = ()):
+        super().__init__()
+        self.values: list[Any] = []
+        for value in values:
+            self[value]
+
+    def __missing__(self, value: Any) -> int:
+        code = self[value] = len(self.values)
+        self.values.append(value)
+        return code
+
+    def __reduce__(self) -> Tuple[type, tuple]:
+        # Only pickle the values, not the codes.
+        return _Codes, (self.values,)
+
+
+def _append_float(
+        values: array,
+        kinds: bytearray,
+        value: Optional[float],
+) -> None:
+    if value is None:
+        values.append(0)
+        kinds.append(_NONE)
+    else:
+        values.append(value)
+        kinds.append(_FLOAT if isinstance(value, float) else _INTEGER)
+
+
+def _float(value: float, kind: int) -> Optional[float]:
+    if kind == _FLOAT:
+        return value
+    return None if kind == _NONE else int(value)
+
+
+def _null_int(value: int) -> Optional[int]:
+    return None if value == _NULL_INT else value
+
+
+class _Compiler(FunctionCompiler):
+    def __init__(self):
+        super().__init__({
+            "_new": tuple.__new__,
+            "_array": array,
+            "_Codes": _Codes,
+            "_EPOCH": _EPOCH,
+            "_SECOND": _SECOND,
+            "_timedelta": timedelta,
+            "_NULL_INT": _NULL_INT,
+            "_append_float": _append_float,
+            "_float": _float,
+            "_null_int": _null_int,
+        })
+
+    def _field(
+            self,
+            annotation: Any,
+            value: str,
+            columns: Callable[[int], list[str]],
+    ) -> Tuple[list[str], list[str], str]:
+        # Constructors of the field's columns, statements to append the
+        # value, and the expression of the value at the index.
+        annotation, optional = unwrap_optional(annotation)
+        if is_enum(annotation):
+            # Also map None to the code -1, and -1 to the last item, None.
+            codes = self._constant(f"_codes_{annotation.__name__}", {
+                None: -1,
+                **{member: code for code, member in enumerate(annotation)},
+            })
+            members = self._constant(
+                f"_members_{annotation.__name__}", [*annotation, None]
+            )
+            codes_column, = columns(1)
+            return (
+                ['_array("b")'],
+                [f"{codes_column}.append({codes}[{value}])"],
+                f"{members}[{codes_column}[index]]",
+            )
+        elif optional and annotation is not int and annotation is not float \
+                and annotation is not str:
+            raise ValueError(f"Unsupported optional type {annotation}.")
+        elif get_origin(annotation) is Set:
+            codes_column, sets = columns(2)
+            return (
+                ['_array("H")', "_Codes()"],
+                [f"{codes_column}.append({sets}[tuple({value})])"],
+                f"set({sets}.values[{codes_column}[index]])",
+            )
+        elif get_origin(annotation) is Collection:
+            item_type, = get_args(annotation)
+            item_type = self._constant(
+                f"_type_{item_type.__name__}", item_type
+            )
+            self._constant("RecordTable", RecordTable)
+            offsets, children = columns(2)
+            return (
+                ['_array("q", [0])', f"RecordTable({item_type})"],
+                [
+                    f"{children}.extend({value})",
+                    f"{offsets}.append(len({children}))",
+                ],
+                f"{children}[{offsets}[index]:{offsets}[index + 1]]",
+            )
+        elif annotation is datetime:
+            seconds, = columns(1)
+            return (
+                ['_array("q")'],
+                [f"{seconds}.append(({value} - _EPOCH) // _SECOND)"],
+                f"_EPOCH + _timedelta(seconds={seconds}[index])",
+            )
+        elif annotation is float:
+            values, kinds = columns(2)
+            return (
+                ['_array("d")', "bytearray()"],
+                [f"_append_float({values}, {kinds}, {value})"],
+                f"_float({values}[index], {kinds}[index])",
+            )
+        elif annotation is int:
+            values, = columns(1)
+            if optional:
+                return (
+                    ['_array("q")'],
+                    [
+                        f"{values}.append("
+                        f"_NULL_INT if {value} is None else {value})"
+                    ],
+                    f"_null_int({values}[index])",
+                )
+            return (
+                ['_array("q")'],
+                [f"{values}.append({value})"],
+                f"{values}[index]",
+            )
+        elif annotation is str:
+            codes_column, strings = columns(2)
+            return (
+                ['_array("I")', "_Codes()"],
+                [f"{codes_column}.append({strings}[{value}])"],
+                f"{strings}.values[{codes_column}[index]]",
+            )
+        else:
+            raise ValueError(f"Unsupported type {annotation}.")
+
+    def compile(
+            self,
+            item_type: Type[tuple],
+    ) -> Tuple[Callable[[], list], Callable[[list], tuple]]:
+        # Compile a function to create the columns of a table, and
+        # a function to bind the (getter, appender, and length) functions
+        # to the columns.
+        annotations = get_type_hints(item_type)
+        self._constant("_type", item_type)
+        names: list[str] = []
+
+        def columns(count: int) -> list[str]:
+            new_names = [f"c{len(names) + i}" for i in range(count)]
+            names.extend(new_names)
+            return new_names
+
+        constructors: list[str] = []
+        statements: list[str] = []
+        expressions: list[str] = []
+        first_offset = 0
+        for index, field in enumerate(item_type._fields):
+            field_constructors, field_statements, expression = self._field(
+                annotations[field], f"value[{index}]", columns
+            )
+            if index == 0 and get_origin(annotations[field]) is Collection:
+                # Offsets have one more item than the table.
+                first_offset = 1
+            constructors.extend(field_constructors)
+            statements.extend(field_statements)
+            expressions.append(expression)
+        name = item_type.__name__
+        self._define(
+            f"_columns_{name}",
+            f"def _columns_{name}():\n"
+            f"    return [{', '.join(constructors)}]\n",
+        )
+        body = "\n".join(f"        {statement}" for statement in statements)
+        self._define(
+            f"_bind_{name}",
+            f"def _bind_{name}(columns):\n"
+            f"    {', '.join(names)}, = columns\n"
+            f"    def get(index):\n"
+            f"        return _new(_type, ({', '.join(expressions)},))\n"
+            f"    def append(value):\n"
+            f"{body}\n"
+            f"    def length():\n"
+            f"        return len(c0) - {first_offset}\n"
+            f"    return get, append, length\n",
+        )
+        return (
+            self._namespace[f"_columns_{name}"],
+            self._namespace[f"_bind_{name}"],
+        )
+
+
+_compiled: dict[
+    type, Tuple[Callable[[], list], Callable[[list], tuple]]
+] = {}
+
+
+class RecordTable(Sequence[_T]):
+    def __init__(self, item_type: Type[_T], items: Iterable[_T] = ()):
+        self._item_type = item_type
+        if item_type not in _compiled:
+            _compiled[item_type] = _Compiler().compile(item_type)
+        new_columns, _ = _compiled[item_type]
+        self._bind(new_columns())
+        self.extend(items)
+
+    def _bind(self, columns: list) -> None:
+        self._columns = columns
+        _, bind = _compiled[self._item_type]
+        self._get, self.append, self._length = bind(columns)
+
+    def extend(self, items: Iterable[_T]) -> None:
+        append = self.append
+        for item in items:
+            append(item)
+
+    def __len__(self) -> int:
+        return self._length()
+
+    @overload
+    def __getitem__(self, index: int) -> _T:
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[_T]:
+        ...
+
+    def __getitem__(self, index):
+        length = self._length()
+        if isinstance(index, slice):
+            return list(map(self._get, range(*index.indices(length))))
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("Record index out of range.")
+        return self._get(index)
+
+    def __iter__(self) -> Iterator[_T]:
+        return map(self._get, range(self._length()))
+
+    def __getstate__(self) -> Tuple[type, list]:
+        # The compiled functions are compiled again when unpickled.
+        return self._item_type, self._columns
+
+    def __setstate__(self, state: Tuple[type, list]) -> None:
+        self._item_type, columns = state
+        if self._item_type not in _compiled:
+            _compiled[self._item_type] = _Compiler().compile(
+                self._item_type
+            )
+        self._bind(columns)
+
+
+class AccidentTable(RecordTable[Accident]):
+    def __init__(self, accidents: Iterable[Accident] = ()):
+        super().__init__(Accident, accidents)
@@ -1,9 +1,25 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice, chain
 from pathlib import Path
-from typing import Generic, TypeVar, Iterable
+from queue import Queue
+from typing import Generic, TypeVar, Iterable, Iterator, Optional, Sequence
+
+from tqdm.auto import tqdm
+
+from instrument import instrument, stage, counted
+from parse.table_cache import TableCache
+
 
 T = TypeVar("T")
 
+# Sentinel for consumers, if producing the items failed.
+_ABORT: list = []
+
+
+class FormatAborted(Exception):
+    pass
+
 
 class Parser(ABC, Generic[T]):
     @abstractmethod
@@ -11,7 +27,119 @@ class Parser(ABC, Generic[T]):
         pass
 
 
+class CsvParser(Parser[T], ABC):
+    description: str
+
+    def __init__(self, table_cache: Optional[TableCache] = None):
+        self._table_cache = table_cache
+
+    @staticmethod
+    @abstractmethod
+    def _parse_file(
+            path: Path,
+            progress: tqdm,
+    ) -> Iterable[T]:
+        pass
+
+    def _parse_cached(self, path: Path, progress: tqdm) -> Iterable[T]:
+        if self._table_cache is None:
+            return self._parse_file(path, progress)
+        return self._table_cache.parse(self, path, progress)
+
+    def parse(self, input_paths: list[Path]) -> Iterable[T]:
+        progress = tqdm(
+            desc=f"Parsing {self.description}",
+            total=sum(path.stat().st_size for path in input_paths),
+            unit="B",
+            unit_scale=True,
+        )
+        yield from instrument(
+            f"parse {self.description}",
+            chain.from_iterable(
+                self._parse_cached(path, progress)
+                for path in input_paths
+            ),
+        )
+
+
 class Formatter(ABC, Generic[T]):
     @abstractmethod
     def format(self, items: Iterable[T], output_dir: Path) -> None:
         pass
+
+
+class MultiFormatter(Formatter[T]):
+    # Feed the same items to multiple formatters in a single pass.
+    # Each formatter consumes the items in its own thread, from a bounded
+    # queue of chunks, so that items are never buffered in full.
+
+    def __init__(
+            self,
+            formatters: Sequence[Formatter[T]],
+            chunk_size: int = 1000,
+            max_chunks: int = 10,
+    ):
+        self._formatters = formatters
+        self._chunk_size = chunk_size
+        self._max_chunks = max_chunks
+
+    @staticmethod
+    def _format(
+            formatter: Formatter[T],
+            items: Iterable[T],
+            output_dir: Path,
+    ) -> None:
+        with stage(f"format {type(formatter).__name__}") as format_stage:
+            formatter.format(counted(format_stage, items), output_dir)
+
+    @staticmethod
+    def _consume(
+            formatter: Formatter[T],
+            queue: "Queue[Optional[list[T]]]",
+            output_dir: Path,
+    ) -> None:
+        def items() -> Iterator[T]:
+            while (chunk := queue.get()) is not None:
+                if chunk is _ABORT:
+                    # Fail the formatter, so that it does not finalize
+                    # its (incomplete) outputs.
+                    raise FormatAborted()
+                yield from chunk
+
+        iterator = items()
+        try:
+            MultiFormatter._format(formatter, iterator, output_dir)
+        finally:
+            # Drain the queue so that the producer never blocks.
+            try:
+                for _ in iterator:
+                    pass
+            except FormatAborted:
+                pass
+
+    def format(self, items: Iterable[T], output_dir: Path) -> None:
+        if len(self._formatters) == 1:
+            self._format(self._formatters[0], items, output_dir)
+            return
+        queues: list[Queue[Optional[list[T]]]] = [
+            Queue(maxsize=self._max_chunks)
+            for _ in self._formatters
+        ]
+        with ThreadPoolExecutor(max_workers=len(self._formatters)) as pool:
+            futures = [
+                pool.submit(self._consume, formatter, queue, output_dir)
+                for formatter, queue in zip(self._formatters, queues)
+            ]
+            iterator = iter(items)
+            try:
+                while chunk := list(islice(iterator, self._chunk_size)):
+                    for queue in queues:
+                        queue.put(chunk)
+            except BaseException:
+                for queue in queues:
+                    queue.put(_ABORT)
+                raise
+            for queue in queues:
+                queue.put(None)
+            for future in futures:
+                future.result()
@@ -1,50 +1,79 @@
 from datetime import datetime
-from enum import IntEnum
-from json import JSONEncoder, dumps
+from json import dump
 from pathlib import Path
-from typing import Iterable, Any
+from shutil import rmtree
+from typing import (
+    Iterable, Callable, Optional, BinaryIO, Sequence, Collection
+)
 
 from tqdm.auto import tqdm
 
-from model import Accident, Person, Vehicle
+from model import Accident
 from parse import Formatter
+from parse.compress import open_output, check_compressions
+from parse.encode import encode_accident, compile_converter
+from parse.index import JsonlIndex, index_path
+from parse.sample import write_samples
 
+JSON_BACKENDS = ("json", "orjson")
 
-def _convert(o):
-    if isinstance(o, datetime):
-        return o.isoformat()
-    elif isinstance(o, dict):
-        return {
-            k: _convert(v)
-            for k, v in o.items()
-        }
-    elif isinstance(o, list):
-        return [_convert(v) for v in o]
-    elif isinstance(o, set):
-        return _convert(list(o))
-    elif isinstance(o, IntEnum):
-        return o.name
-    elif isinstance(o, (Accident, Vehicle, Person)):
-        return _convert(o._asdict())
-    else:
-        return o
-
-
-class _Encoder(JSONEncoder):
-    def default(self, o: Any) -> Any:
-        if isinstance(o, datetime):
-            return o.isoformat()
-        elif isinstance(o, set):
-            return tuple(o)
-        elif isinstance(o, IntEnum):
-            return o.name
-        elif isinstance(o, (Accident, Vehicle, Person)):
-            return o._asdict()
-        else:
-            return super().default(o)
+# Number of lines to buffer before writing them to the file at once.
+_BUFFER_SIZE = 1000
+
+
+def _write_lines(
+        items: Iterable[Accident],
+        encode: Callable[[Accident], bytes],
+        file: BinaryIO,
+        index: Optional[JsonlIndex] = None,
+) -> None:
+    buffer: list[bytes] = []
+    offset = 0
+    for item in items:
+        line = encode(item)
+        buffer.append(line)
+        if index is not None:
+            index.add(item.accident_id, item.timestamp, offset, len(line))
+            offset += len(line) + 1
+        if len(buffer) >= _BUFFER_SIZE:
+            file.write(b"\n".join(buffer) + b"\n")
+            buffer.clear()
+    if len(buffer) > 0:
+        file.write(b"\n".join(buffer) + b"\n")
+
+
+def _bytes_encoder(backend: str) -> Callable[[Accident], bytes]:
+    # The default backend writes the same JSON as the json module.
+    # The orjson backend is faster, but writes compact JSON
+    # (no spaces after separators, UTF-8 instead of escaped strings).
+    if backend not in JSON_BACKENDS:
+        raise ValueError(f"Unknown JSON backend {backend}.")
+    if backend == "orjson":
+        # Fail early if orjson is not installed.
+        from orjson import dumps
+        convert = compile_converter(Accident)
+        return lambda item: dumps(convert(item))
+    return lambda item: encode_accident(item).encode("ascii")
 
 
 class AccidentsJsonlFormatter(Formatter[Accident]):
+    def __init__(
+            self,
+            backend: str = "json",
+            index: bool = True,
+            samples: Sequence[int] = (),
+            sample_seed: int = 0,
+            stratify_samples: bool = False,
+            compressions: Collection[str] = (),
+    ):
+        self._encode_bytes = _bytes_encoder(backend)
+        check_compressions(compressions)
+        self._compressions = compressions
+        self._index = index
+        self._samples = samples
+        self._sample_seed = sample_seed
+        self._stratify_samples = stratify_samples
+
     def format(
             self,
             items: Iterable[Accident],
@@ -56,13 +85,178 @@ class AccidentsJsonlFormatter(Formatter[Accident]):
             desc="Formatting accidents",
             unit="line",
         )
-        with output_path.open("w") as file:
-            for item in items:
-                item = _convert(item)
-                file.write(f"{dumps(item)}\n")
+        # Also write an index of the lines by accident ID and timestamp.
+        # Samples are read from the written file using the index.
+        index = (
+            JsonlIndex()
+            if self._index or len(self._samples) > 0 else None
+        )
+        with open_output(output_path, self._compressions) as file:
+            _write_lines(items, self._encode_bytes, file, index)
+        if index is not None and self._index:
+            index.write(index_path(output_path))
+        if index is not None:
+            write_samples(
+                output_path,
+                index,
+                self._samples,
+                self._sample_seed,
+                self._stratify_samples,
+                self._compressions,
+            )
+
+
+class _Shard:
+    def __init__(
+            self,
+            path: Path,
+            relative_path: Path,
+            year: int,
+            department: Optional[str],
+            compressions: Collection[str],
+    ):
+        self.path = path
+        self.relative_path = relative_path
+        self.year = year
+        self.department = department
+        self.file = open_output(path, compressions)
+        self.count = 0
+        self.start: Optional[datetime] = None
+        self.end: Optional[datetime] = None
+        self.min_latitude: Optional[float] = None
+        self.min_longitude: Optional[float] = None
+        self.max_latitude: Optional[float] = None
+        self.max_longitude: Optional[float] = None
 
+    def write(self, accident: Accident, line: bytes) -> None:
+        self.file.write(line)
+        self.file.write(b"\n")
+        self.count += 1
+        timestamp = accident.timestamp
+        if self.start is None or timestamp < self.start:
+            self.start = timestamp
+        if self.end is None or timestamp > self.end:
+            self.end = timestamp
+        latitude = accident.latitude
+        longitude = accident.longitude
+        if latitude is not None and longitude is not None:
+            if self.min_latitude is None or latitude < self.min_latitude:
+                self.min_latitude = latitude
+            if self.max_latitude is None or latitude > self.max_latitude:
+                self.max_latitude = latitude
+            if self.min_longitude is None or longitude < self.min_longitude:
+                self.min_longitude = longitude
+            if self.max_longitude is None or longitude > self.max_longitude:
+                self.max_longitude = longitude
+
+    def discard(self) -> None:
+        self.file.discard()
+
+    def close(self) -> dict:
+        self.file.close()
+        return {
+            "path": self.relative_path.as_posix(),
+            "year": self.year,
+            "department": self.department,
+            "count": self.count,
+            "bytes": self.path.stat().st_size,
+            "start": (
+                self.start.isoformat() if self.start is not None else None
+            ),
+            "end": self.end.isoformat() if self.end is not None else None,
+            # Bounding box as ((min. latitude, min. longitude),
+            # (max. latitude, max. longitude)), if any coordinates are known.
+            "bounds": (
+                [
+                    [self.min_latitude, self.min_longitude],
+                    [self.max_latitude, self.max_longitude],
+                ]
+                if self.min_latitude is not None else None
+            ),
+        }
+
+
+class AccidentsShardedJsonlFormatter(Formatter[Accident]):
+    def __init__(
+            self,
+            by_department: bool = False,
+            backend: str = "json",
+            compressions: Collection[str] = (),
+    ):
+        self._by_department = by_department
+        self._encode_bytes = _bytes_encoder(backend)
+        check_compressions(compressions)
+        self._compressions = compressions
+
+    def format(
+            self,
+            items: Iterable[Accident],
+            output_dir: Path
+    ) -> None:
+        # Write one JSONL shard per year (and department) to
+        # accidents/<year>.jsonl (or accidents/<year>/<department>.jsonl),
+        # and list the shards in accidents/manifest.json.
+        shards_dir = output_dir / "accidents"
+        # Write to a temporary directory, so that the previous shards are
+        # kept until all new shards and the manifest are written.
+        temporary_dir = shards_dir.with_name(f"{shards_dir.name}.tmp")
+        if temporary_dir.exists():
+            rmtree(temporary_dir)
+        temporary_dir.mkdir()
+        items = tqdm(
+            items,
+            desc="Formatting accidents to shards",
+            unit="line",
+        )
+        entries: list[dict] = []
+        # Accidents are ordered by year, so only the current year's shards
+        # need to be open at once.
+        shards: dict[Optional[str], _Shard] = {}
+        year: Optional[int] = None
+        try:
+            for accident in items:
+                if accident.timestamp.year != year:
+                    if year is not None and accident.timestamp.year < year:
+                        # The year's shards were already closed.
+                        raise ValueError(
+                            f"Accidents are not ordered by year: "
+                            f"{accident.timestamp.year} after {year}."
+                        )
+                    for shard in shards.values():
+                        entries.append(shard.close())
+                    shards.clear()
+                    year = accident.timestamp.year
+                    if self._by_department:
+                        (temporary_dir / str(year)).mkdir()
+                department = (
+                    accident.department if self._by_department else None
+                )
+                shard = shards.get(department)
+                if shard is None:
+                    relative_path = (
+                        Path("accidents") / str(year) / f"{department}.jsonl"
+                        if department is not None else
+                        Path("accidents") / f"{year}.jsonl"
+                    )
+                    shard = shards[department] = _Shard(
+                        temporary_dir.joinpath(*relative_path.parts[1:]),
+                        relative_path,
+                        year,
+                        department,
+                        self._compressions,
+                    )
+                shard.write(accident, self._encode_bytes(accident))
+        except BaseException:
+            for shard in shards.values():
+                shard.discard()
+            rmtree(temporary_dir)
+            raise
+        for shard in shards.values():
+            entries.append(shard.close())
 
-def _person_json(person: Person) -> dict:
-    json = person._asdict()
-    json["safety_equipment"] = list(json["safety_equipment"])
-    return json
+        entries.sort(key=lambda entry: entry["path"])
+        with (temporary_dir / "manifest.json").open("w") as file:
+            dump({"shards": entries}, file, indent=2)
+        if shards_dir.exists():
+            rmtree(shards_dir)
+        temporary_dir.rename(shards_dir)
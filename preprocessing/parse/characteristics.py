@@ -1,5 +1,4 @@
-from csv import DictReader
-from datetime import datetime
+from datetime import datetime, MAXYEAR
 from pathlib import Path
 from typing import Iterable, Tuple
 
@@ -9,96 +8,70 @@ from model import (
     Characteristic, Light, Intersection, AtmosphericConditions, Collision,
     LocationRegime, AccidentId
 )
-from parse import Parser
-from parse.util import count_lines
+from parse import CsvParser
+from parse.schema import Schema, Layout, Column
 
 
-class CharacteristicsCsvParser(Parser[Tuple[AccidentId, Characteristic]]):
+def _timestamp(
+        year: str,
+        month: str,
+        day: str,
+        hour_minute: str,
+) -> datetime:
+    hour_minute = hour_minute.replace(":", "")
+    assert len(hour_minute) <= 4
+    hour_minute = f"{'0' * (4 - len(hour_minute))}{hour_minute}"
+    assert len(hour_minute) == 4
+    return datetime(
+        year=2000 + int(year),
+        month=int(month),
+        day=int(day),
+        hour=int(hour_minute[0:2]),
+        minute=int(hour_minute[2:4]),
+    )
+
+
+def _decimal(value: str) -> float:
+    return float(value.replace(",", "."))
+
+
+_COLUMNS = {
+    "accident_id": Column("Num_Acc", transform=int),
+    "timestamp": Column(("an", "mois", "jour", "hrmn"), combine=_timestamp),
+    "latitude": Column("lat", nulls=("", "-"), transform=_decimal),
+    "longitude": Column("long", nulls=("", "-"), transform=_decimal),
+    "address": Column("adr", intern=True),
+    "light": Column("lum", enum=Light, null_codes=(-1,)),
+    "intersection": Column("int", enum=Intersection, null_codes=(-1, 0)),
+    "atmospheric_conditions": Column(
+        "atm", nulls=("",), enum=AtmosphericConditions, null_codes=(-1,)
+    ),
+    "collision": Column(
+        "col", nulls=("",), enum=Collision, null_codes=(-1,)
+    ),
+    "location": Column("agg", enum=LocationRegime),
+    "department": Column("dep", intern=True),
+    "commune": Column("com", intern=True),
+}
+
+_SCHEMA: Schema[Tuple[AccidentId, Characteristic]] = Schema(
+    outputs=(AccidentId, Characteristic),
+    layouts=[
+        Layout(range(2009), ",", _COLUMNS),
+        Layout(range(2009, 2010), "\t", _COLUMNS),
+        Layout(range(2010, 2019), ",", _COLUMNS),
+        Layout(range(2019, MAXYEAR + 1), ";", _COLUMNS),
+    ],
+    encoding="latin-1",
+)
+
+
+class CharacteristicsCsvParser(CsvParser[Tuple[AccidentId, Characteristic]]):
+    description = "characteristics"
+
     @staticmethod
     def _parse_file(
             path: Path,
             progress: tqdm,
     ) -> Iterable[Tuple[AccidentId, Characteristic]]:
-        file_year = int(path.name.split("-")[-1].removesuffix(".csv"))
-        delimiter: str
-        if file_year >= 2019:
-            delimiter = ";"
-        elif file_year == 2009:
-            delimiter = "\t"
-        else:
-            delimiter = ","
-        with path.open("r", encoding="latin-1") as file:
-            reader = DictReader(file, delimiter=delimiter, quotechar='"')
-            for row in reader:
-                for key in row:
-                    row[key] = str(row[key]).strip()
-                hour_minute_str = str(row["hrmn"]).replace(":", "")
-                assert len(hour_minute_str) <= 4
-                hour_minute_str = (
-                    f"{'0' * (4 - len(hour_minute_str))}{hour_minute_str}"
-                )
-                assert len(hour_minute_str) == 4
-
-                yield (
-                    AccidentId(
-                        accident_id=int(row["Num_Acc"]),
-                    ),
-                    Characteristic(
-                        timestamp=datetime(
-                            year=2000 + int(row["an"]),
-                            month=int(row["mois"]),
-                            day=int(row["jour"]),
-                            hour=int(hour_minute_str[0:2]),
-                            minute=int(hour_minute_str[2:4]),
-                        ),
-                        latitude=(
-                            float(row["lat"].replace(",", "."))
-                            if row["lat"] not in ["", "-"] else None
-                        ),
-                        longitude=(
-                            float(row["long"].replace(",", "."))
-                            if row["long"] not in ["", "-"] else None
-                        ),
-                        address=str(row["adr"]),
-                        light=(
-                            Light(int(row["lum"]))
-                            if int(row["lum"]) != -1
-                            else None
-                        ),
-                        intersection=(
-                            Intersection(int(row["int"]))
-                            if int(row["int"]) != -1 and int(row["int"]) != 0
-                            else None
-                        ),
-                        atmospheric_conditions=(
-                            AtmosphericConditions(int(row["atm"]))
-                            if row["atm"] != "" and int(row["atm"]) != -1
-                            else None
-                        ),
-                        collision=(
-                            Collision(int(row["col"]))
-                            if row["col"] != "" and int(row["col"]) != -1
-                            else None
-                        ),
-                        location=(
-                            LocationRegime(int(row["agg"]))
-                            if True or row["agg"] != ""
-                            else None
-                        ),
-                        department=str(row["dep"]),
-                        commune=str(row["com"]),
-                    )
-                )
-                progress.update(1)
-
-    def parse(
-            self,
-            input_paths: list[Path]
-    ) -> Iterable[Tuple[AccidentId, Characteristic]]:
-        progress = tqdm(
-            desc="Parsing characteristics",
-            total=count_lines(input_paths) - len(input_paths),
-            unit="line",
-        )
-        for path in input_paths:
-            yield from self._parse_file(path, progress)
+        return _SCHEMA.decode(path, progress)
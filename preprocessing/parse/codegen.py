@@ -0,0 +1,37 @@
+from enum import IntEnum
+from typing import Any, Callable, Mapping, Tuple, Union, get_args, get_origin
+
+# Helpers shared by the code generators of specialized functions (JSON
+# encoders, SQLite row codecs, and CSV decoders) and by the writers that
+# map the model's type hints to column types.
+
+
+def unwrap_optional(annotation: Any) -> Tuple[Any, bool]:
+    # The type of an Optional annotation, and whether it was optional.
+    if get_origin(annotation) is Union:
+        argument, = (
+            argument
+            for argument in get_args(annotation)
+            if argument is not type(None)
+        )
+        return argument, True
+    return annotation, False
+
+
+def is_enum(annotation: Any) -> bool:
+    return isinstance(annotation, type) and issubclass(annotation, IntEnum)
+
+
+class FunctionCompiler:
+    def __init__(self, namespace: Mapping[str, Any]):
+        # Globals of the compiled functions.
+        self._namespace: dict[str, Any] = dict(namespace)
+
+    def _constant(self, name: str, value: Any) -> str:
+        self._namespace[name] = value
+        return name
+
+    def _define(self, name: str, source: str) -> Callable[..., Any]:
+        # Compile the source code of the named function.
+        exec(compile(source, f"<{name}>", "exec"), self._namespace)
+        return self._namespace[name]
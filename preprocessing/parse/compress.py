@@ -0,0 +1,235 @@
+from base64 import b64encode
+from hashlib import sha384
+from io import RawIOBase, BufferedWriter, TextIOWrapper
+from json import dump
+from pathlib import Path
+from shutil import copyfileobj
+from typing import Any, BinaryIO, Callable, Collection, NamedTuple, Optional
+from zlib import compressobj, DEFLATED
+
+from instrument import stage
+
+# Write outputs together with compressed variants (e.g., accidents.jsonl.gz)
+# in the same pass, so that static web servers can serve precompressed
+# files. The sizes and subresource integrity hashes of all variants are
+# written to a sidecar file (e.g., accidents.jsonl.integrity.json).
+
+
+class _Compressor(NamedTuple):
+    compress: Callable[[bytes], bytes]
+    flush: Callable[[], bytes]
+
+
+def _gzip() -> _Compressor:
+    # Window bits of 16 + 15 write a gzip header (without modification
+    # time, so that outputs are reproducible).
+    compressor = compressobj(9, DEFLATED, 16 + 15)
+    return _Compressor(compressor.compress, compressor.flush)
+
+
+def _brotli() -> _Compressor:
+    from brotli import Compressor
+    # The maximum quality of 11 is too slow for the full dataset.
+    compressor = Compressor(quality=9)
+    return _Compressor(compressor.process, compressor.finish)
+
+
+def _zstd() -> _Compressor:
+    from zstandard import ZstdCompressor
+    compressor = ZstdCompressor(level=12).compressobj()
+    return _Compressor(compressor.compress, compressor.flush)
+
+
+# File suffix and compressor factory for each compression.
+COMPRESSIONS: dict[str, tuple[str, Callable[[], _Compressor]]] = {
+    "gzip": ("gz", _gzip),
+    "brotli": ("br", _brotli),
+    "zstd": ("zst", _zstd),
+}
+
+
+def check_compressions(compressions: Collection[str]) -> None:
+    # Fail early if a compression is unknown or its library is missing.
+    for compression in compressions:
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression}.")
+        COMPRESSIONS[compression][1]()
+
+
+def integrity_path(path: Path) -> Path:
+    return path.with_name(f"{path.name}.integrity.json")
+
+
+def _variant_path(path: Path, compression: str) -> Path:
+    return path.with_name(f"{path.name}.{COMPRESSIONS[compression][0]}")
+
+
+def _remove_stale_variants(
+        path: Path,
+        compressions: Collection[str],
+) -> None:
+    # Remove variants of compressions that are no longer requested, so
+    # that they are not served for the new output.
+    for compression in COMPRESSIONS.keys() - set(compressions):
+        _variant_path(path, compression).unlink(missing_ok=True)
+    if len(compressions) == 0:
+        integrity_path(path).unlink(missing_ok=True)
+
+
+class _Variant:
+    def __init__(
+            self,
+            path: Path,
+            compressor: Optional[_Compressor] = None,
+            hashed: bool = True,
+            written: bool = True,
+    ):
+        self.path = path
+        self.temporary_path = path.with_name(f"{path.name}.tmp")
+        self.compressor = compressor
+        # Variants that are not written (e.g., existing files) are hashed.
+        self.file: Optional[BinaryIO] = (
+            self.temporary_path.open("wb") if written else None
+        )
+        self.hash = sha384() if hashed else None
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        if self.file is not None:
+            self.file.write(data)
+        if self.hash is not None:
+            self.hash.update(data)
+        self.size += len(data)
+
+    def close(self) -> dict[str, Any]:
+        if self.file is not None:
+            self.file.close()
+            self.temporary_path.replace(self.path)
+        if self.hash is None:
+            return {"size": self.size}
+        return {
+            "size": self.size,
+            "integrity": f"sha384-{b64encode(self.hash.digest()).decode()}",
+        }
+
+    def discard(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.temporary_path.unlink(missing_ok=True)
+
+
+class _OutputWriter(RawIOBase):
+    # Write to temporary files, which only replace the output (and its
+    # compressed variants) when closed, so that readers never see
+    # a partial output, and existing outputs survive failed runs.
+    def __init__(
+            self,
+            path: Path,
+            compressions: Collection[str],
+            uncompressed: bool = True,
+    ):
+        # Optionally, only write the compressed variants.
+        self._path = path
+        self._compressions = compressions
+        self._integrity = len(compressions) > 0
+        self._variants = [
+            _Variant(path, hashed=self._integrity, written=uncompressed)
+        ] + [
+            _Variant(
+                _variant_path(path, compression),
+                COMPRESSIONS[compression][1](),
+            )
+            for compression in compressions
+        ]
+        self._discarded = False
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self._discarded:
+            return len(data)
+        data = bytes(data)
+        for variant in self._variants:
+            if variant.compressor is None:
+                variant.write(data)
+            else:
+                variant.write(variant.compressor.compress(data))
+        return len(data)
+
+    def discard(self) -> None:
+        if self.closed or self._discarded:
+            return
+        self._discarded = True
+        for variant in self._variants:
+            variant.discard()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        super().close()
+        if self._discarded:
+            return
+        integrity: dict[str, Any] = {}
+        for variant in self._variants:
+            if variant.compressor is not None:
+                variant.write(variant.compressor.flush())
+            integrity[variant.path.name] = variant.close()
+        _remove_stale_variants(self._path, self._compressions)
+        if self._integrity:
+            with integrity_path(self._path).open("w") as file:
+                dump(integrity, file, indent=2)
+
+
+class BinaryOutput(BufferedWriter):
+    # Discard the output instead of writing it if a with statement fails.
+    def discard(self) -> None:
+        self.raw.discard()
+        self.close()
+
+    def __exit__(self, exception_type, *args) -> None:
+        if exception_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class TextOutput(TextIOWrapper):
+    def discard(self) -> None:
+        self.buffer.discard()
+        self.close()
+
+    def __exit__(self, exception_type, *args) -> None:
+        if exception_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+def open_output(
+        path: Path,
+        compressions: Collection[str] = (),
+) -> BinaryOutput:
+    return BinaryOutput(_OutputWriter(path, compressions))
+
+
+def open_text_output(
+        path: Path,
+        compressions: Collection[str] = (),
+) -> TextOutput:
+    return TextOutput(open_output(path, compressions), encoding="utf-8")
+
+
+def compress_file(path: Path, compressions: Collection[str]) -> None:
+    # Compress an existing file, e.g., after splicing incremental builds.
+    if len(compressions) == 0:
+        _remove_stale_variants(path, compressions)
+        return
+    with stage("compress") as compress_stage:
+        # Count bytes as items.
+        compress_stage.items = path.stat().st_size
+        with path.open("rb") as input_file:
+            with BinaryOutput(_OutputWriter(
+                    path, compressions, uncompressed=False
+            )) as output_file:
+                copyfileobj(input_file, output_file)
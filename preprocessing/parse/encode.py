@@ -0,0 +1,128 @@
+from collections.abc import Set, Collection
+from datetime import datetime
+from enum import IntEnum
+from json.encoder import encode_basestring_ascii
+from typing import (
+    Any, Callable, NamedTuple, Type, get_type_hints, get_origin, get_args
+)
+
+from model import Accident
+from parse.codegen import FunctionCompiler, is_enum, unwrap_optional
+
+# Compile encoders for NamedTuple types into specialized functions,
+# that write exactly the same JSON as json.dumps() with default settings
+# would write for the converted dictionaries, but without intermediate
+# objects. Alternatively, compile converters to plain JSON-like objects,
+# e.g., for faster JSON libraries.
+
+
+def _encode_float(value: Any) -> str:
+    # Same as the json module, which also accepts integers here.
+    if not isinstance(value, float):
+        return int.__repr__(value)
+    elif value != value:
+        return "NaN"
+    elif value == float("inf"):
+        return "Infinity"
+    elif value == -float("inf"):
+        return "-Infinity"
+    else:
+        return float.__repr__(value)
+
+
+class _Compiler(FunctionCompiler):
+    def __init__(self, to_json: bool):
+        # Either compile encoders to JSON strings (True)
+        # or converters to plain objects (False).
+        super().__init__({
+            "_encode_string": encode_basestring_ascii,
+            "_encode_int": int.__repr__,
+            "_encode_float": _encode_float,
+        })
+        self._to_json = to_json
+        self._compiled: dict[type, str] = {}
+
+    def _enum_names(self, enum: Type[IntEnum]) -> str:
+        return self._constant(f"_names_{enum.__name__}", {
+            member: (f'"{member.name}"' if self._to_json else member.name)
+            for member in enum
+        })
+
+    def _expression(self, annotation: Any, value: str) -> str:
+        annotation, optional = unwrap_optional(annotation)
+        if optional:
+            null = '"null"' if self._to_json else "None"
+            return (
+                f"({null} if {value} is None else "
+                f"{self._expression(annotation, value)})"
+            )
+        if is_enum(annotation):
+            return f"{self._enum_names(annotation)}[{value}]"
+        elif get_origin(annotation) in (Set, Collection):
+            item_type, = get_args(annotation)
+            item = self._expression(item_type, "item")
+            if self._to_json:
+                return (
+                    f'"[" + ", ".join([{item} for item in {value}]) + "]"'
+                )
+            return f"[{item} for item in {value}]"
+        elif isinstance(annotation, type) and issubclass(annotation, tuple):
+            return f"{self.compile(annotation)}({value})"
+        elif annotation is datetime:
+            if self._to_json:
+                return f'"\\"" + {value}.isoformat() + "\\""'
+            return f"{value}.isoformat()"
+        elif not self._to_json and annotation in (str, int, float):
+            return value
+        elif annotation is str:
+            return f"_encode_string({value})"
+        elif annotation is int:
+            return f"_encode_int({value})"
+        elif annotation is float:
+            return f"_encode_float({value})"
+        else:
+            raise ValueError(f"Unsupported type {annotation}.")
+
+    def compile(self, item_type: Type[NamedTuple]) -> str:
+        # Compile the (nested) item type once and return the function name.
+        if item_type in self._compiled:
+            return self._compiled[item_type]
+        name = f"_encode_{item_type.__name__}"
+        self._compiled[item_type] = name
+        annotations = get_type_hints(item_type)
+        fields = [
+            (field, self._expression(annotations[field], f"value[{index}]"))
+            for index, field in enumerate(item_type._fields)
+        ]
+        if self._to_json:
+            parts = ", ".join(
+                repr(f'{", " if index > 0 else "{"}"{field}": ') +
+                f", {expression}"
+                for index, (field, expression) in enumerate(fields)
+            )
+            body = f'"".join(({parts}, "}}"))'
+        else:
+            body = "{" + ", ".join(
+                f"{field!r}: {expression}"
+                for field, expression in fields
+            ) + "}"
+        self._define(name, f"def {name}(value):\n    return {body}\n")
+        return name
+
+    def function(self, item_type: Type[NamedTuple]) -> Callable[[Any], Any]:
+        return self._namespace[self.compile(item_type)]
+
+
+def compile_encoder(
+        item_type: Type[NamedTuple]
+) -> Callable[[Any], str]:
+    return _Compiler(to_json=True).function(item_type)
+
+
+def compile_converter(
+        item_type: Type[NamedTuple]
+) -> Callable[[Any], dict[str, Any]]:
+    return _Compiler(to_json=False).function(item_type)
+
+
+encode_accident: Callable[[Accident], str] = compile_encoder(Accident)
@@ -0,0 +1,186 @@
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from json import loads
+from mmap import mmap, ACCESS_READ
+from pathlib import Path
+from struct import Struct
+from sys import byteorder
+from typing import Iterator, Optional, Sequence, Union
+
+# Sidecar index of a JSONL file of accidents (<name>.jsonl.index), with
+# the byte offset and length of each accident's line, sorted by accident
+# ID, and a secondary index sorted by timestamp.
+#
+# Layout: header (magic, version, count), then arrays of count 64-bit
+# integers in native (little-endian) byte order: accident IDs, offsets,
+# lengths, and timestamps, sorted by accident ID, followed by the sorted
+# timestamps and the corresponding positions in the ID-sorted arrays.
+
+_MAGIC = b"AIDX"
+_VERSION = 1
+_HEADER = Struct("<4sIQ")
+_ARRAYS = 6
+
+_EPOCH = datetime(1970, 1, 1)
+_SECOND = timedelta(seconds=1)
+
+
+def index_path(path: Path) -> Path:
+    return path.with_name(f"{path.name}.index")
+
+
+def epoch_seconds(timestamp: datetime) -> int:
+    return (timestamp - _EPOCH) // _SECOND
+
+
+class JsonlIndex:
+    def __init__(self):
+        self.ids = array("q")
+        self.offsets = array("q")
+        self.lengths = array("q")
+        self.timestamps = array("q")
+
+    def add(
+            self,
+            accident_id: int,
+            timestamp: datetime,
+            offset: int,
+            length: int,
+    ) -> None:
+        self.ids.append(accident_id)
+        self.offsets.append(offset)
+        self.lengths.append(length)
+        self.timestamps.append(epoch_seconds(timestamp))
+
+    def extend(self, other: "JsonlIndex", offset: int) -> None:
+        # Add the entries of another index, for a file appended at offset.
+        self.ids.extend(other.ids)
+        self.offsets.extend(value + offset for value in other.offsets)
+        self.lengths.extend(other.lengths)
+        self.timestamps.extend(other.timestamps)
+
+    @classmethod
+    def read(cls, path: Path) -> "JsonlIndex":
+        index = cls()
+        with path.open("rb") as file:
+            magic, version, count = _HEADER.unpack(file.read(_HEADER.size))
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError(f"Unsupported index file {path}.")
+            for values in (
+                    index.ids, index.offsets, index.lengths,
+                    index.timestamps,
+            ):
+                values.fromfile(file, count)
+        return index
+
+    def write(self, path: Path) -> None:
+        if byteorder != "little":
+            raise RuntimeError("Index files must be written little-endian.")
+        order = sorted(range(len(self.ids)), key=self.ids.__getitem__)
+        ids = array("q", (self.ids[i] for i in order))
+        if any(ids[i] == ids[i + 1] for i in range(len(ids) - 1)):
+            raise ValueError("Duplicate accident IDs.")
+        timestamps = array("q", (self.timestamps[i] for i in order))
+        time_order = array(
+            "q", sorted(range(len(ids)), key=timestamps.__getitem__)
+        )
+        temporary_path = path.with_name(f"{path.name}.tmp")
+        with temporary_path.open("wb") as file:
+            file.write(_HEADER.pack(_MAGIC, _VERSION, len(ids)))
+            for values in (
+                    ids,
+                    array("q", (self.offsets[i] for i in order)),
+                    array("q", (self.lengths[i] for i in order)),
+                    timestamps,
+                    array("q", (timestamps[i] for i in time_order)),
+                    time_order,
+            ):
+                values.tofile(file)
+        temporary_path.replace(path)
+
+
+def _map(path: Path) -> Union[mmap, bytes]:
+    # Memory-map the file (empty files cannot be mapped).
+    with path.open("rb") as file:
+        if path.stat().st_size == 0:
+            return b""
+        return mmap(file.fileno(), 0, access=ACCESS_READ)
+
+
+class AccidentsReader:
+    # Random access to the accidents of a JSONL file by accident ID or
+    # timestamp, using binary search over the memory-mapped index.
+    def __init__(self, path: Path):
+        self._data = _map(path)
+        self._index = _map(index_path(path))
+        magic, version, count = _HEADER.unpack_from(self._index)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"Unsupported index file {index_path(path)}.")
+        if byteorder != "little":
+            raise RuntimeError("Index files can only be read little-endian.")
+        self._values = memoryview(self._index)[_HEADER.size:].cast("q")
+        values = self._values
+        if len(values) != _ARRAYS * count:
+            raise ValueError(f"Truncated index file {index_path(path)}.")
+        (
+            self._ids, self._offsets, self._lengths, self._timestamps,
+            self._sorted_timestamps, self._time_order,
+        ) = (
+            values[i * count:(i + 1) * count]
+            for i in range(_ARRAYS)
+        )
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _line(self, position: int) -> bytes:
+        offset = self._offsets[position]
+        return self._data[offset:offset + self._lengths[position]]
+
+    def _accidents(self, positions: Iterator[int]) -> Iterator[dict]:
+        for position in positions:
+            yield loads(self._line(position))
+
+    def get_line(self, accident_id: int) -> Optional[bytes]:
+        position = bisect_left(self._ids, accident_id)
+        if position == self._count or self._ids[position] != accident_id:
+            return None
+        return self._line(position)
+
+    def get(self, accident_id: int) -> Optional[dict]:
+        line = self.get_line(accident_id)
+        return loads(line) if line is not None else None
+
+    def range(self, start_id: int, end_id: int) -> Iterator[dict]:
+        # Accidents with start_id <= accident ID < end_id, ordered by ID.
+        return self._accidents(iter(range(
+            bisect_left(self._ids, start_id),
+            bisect_left(self._ids, end_id),
+        )))
+
+    def between(self, start: datetime, end: datetime) -> Iterator[dict]:
+        # Accidents with start <= timestamp < end, ordered by timestamp.
+        positions: Sequence[int] = self._time_order[
+            bisect_left(self._sorted_timestamps, epoch_seconds(start)):
+            bisect_left(self._sorted_timestamps, epoch_seconds(end))
+        ]
+        return self._accidents(iter(positions))
+
+    def close(self) -> None:
+        for view in (
+                self._ids, self._offsets, self._lengths, self._timestamps,
+                self._sorted_timestamps, self._time_order,
+                self._values,
+        ):
+            view.release()
+        for data in (self._data, self._index):
+            if isinstance(data, mmap):
+                data.close()
+
+    def __enter__(self) -> "AccidentsReader":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
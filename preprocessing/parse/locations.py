@@ -1,4 +1,4 @@
-from csv import DictReader
+from datetime import MAXYEAR
 from pathlib import Path
 from typing import Iterable, Tuple
 
@@ -8,108 +8,89 @@ from model import (
     Location, Curvature, Profile, DedicatedLane, TrafficRegime, RoadCategory,
     AccidentId
 )
-from parse import Parser
-from parse.util import count_lines
+from parse import CsvParser
+from parse.schema import Schema, Layout, Column
 
 
-class LocationsCsvParser(Parser[Tuple[AccidentId, Location]]):
+def _road_category(accident_id: str, road_category: str) -> str:
+    if accident_id == "200500068514":
+        assert road_category == ""
+        return "9"
+    return road_category
+
+
+# Some locations have their "pr" and "pr1" columns swapped.
+def _upstream_terminal(pr: str, pr1: str) -> str:
+    return pr1 if "." in pr else pr
+
+
+def _upstream_terminal_distance(pr: str, pr1: str) -> str:
+    return pr if "." in pr else pr1
+
+
+def _remove_parentheses(value: str) -> str:
+    return value.removeprefix("(").removesuffix(")")
+
+
+def _decimal(value: str) -> float:
+    return float(value.replace(",", "."))
+
+
+_COLUMNS = {
+    "accident_id": Column("Num_Acc", transform=int),
+    "road_category": Column(
+        ("Num_Acc", "catr"), combine=_road_category, enum=RoadCategory
+    ),
+    "road": Column("voie", intern=True),
+    "road_index_number": Column(
+        "v1", nulls=("",), transform=int, lookup=True
+    ),
+    "road_index_alpha": Column("v2", nulls=("N/A",), intern=True),
+    "traffic_regime": Column(
+        "circ", nulls=("", "0", "-1"), enum=TrafficRegime
+    ),
+    "lanes_count": Column("nbv", nulls=("",), transform=int, lookup=True),
+    "dedicated_lane": Column("vosp", nulls=("", "-1"), enum=DedicatedLane),
+    "profile": Column("prof", nulls=("", "0", "-1"), enum=Profile),
+    "upstream_terminal": Column(
+        ("pr", "pr1"),
+        combine=_upstream_terminal,
+        nulls=("", "-1"),
+        transform=lambda value: int(_remove_parentheses(value)),
+        lookup=True,
+    ),
+    "upstream_terminal_distance_meters": Column(
+        ("pr", "pr1"),
+        combine=_upstream_terminal_distance,
+        nulls=("", "-1"),
+        transform=lambda value: float(_remove_parentheses(value)),
+        lookup=True,
+    ),
+    "curvature": Column("plan", nulls=("", "0", "-1"), enum=Curvature),
+    "central_reservation_width_meters": Column(
+        "lartpc", nulls=("",), null=0, transform=_decimal, lookup=True
+    ),
+    "road_traffic_width_meters": Column(
+        "larrout", nulls=("",), null=0, transform=_decimal, lookup=True
+    ),
+}
+
+_SCHEMA: Schema[Tuple[AccidentId, Location]] = Schema(
+    outputs=(AccidentId, Location),
+    layouts=[
+        Layout(range(2019), ",", _COLUMNS),
+        Layout(range(2019, MAXYEAR + 1), ";", _COLUMNS),
+    ],
+    encoding="latin-1",
+)
+
+
+class LocationsCsvParser(CsvParser[Tuple[AccidentId, Location]]):
+    description = "locations"
 
     @staticmethod
     def _parse_file(
             path: Path,
             progress: tqdm,
     ) -> Iterable[Tuple[AccidentId, Location]]:
-        file_year = int(path.name.split("-")[-1].removesuffix(".csv"))
-        delimiter: str
-        if file_year >= 2019:
-            delimiter = ";"
-        else:
-            delimiter = ","
-        with path.open("r", encoding="latin-1") as file:
-            reader = DictReader(file, delimiter=delimiter, quotechar='"')
-            for row in reader:
-                for key in row:
-                    row[key] = str(row[key]).strip()
-                if "." in row["pr"]:
-                    row["pr"], row["pr1"] = row["pr1"], row["pr"]
-                if row["Num_Acc"] == "200500068514":
-                    assert row["catr"] == ""
-                    row["catr"] = "9"
-                yield (
-                    AccidentId(
-                        accident_id=int(row["Num_Acc"]),
-                    ),
-                    Location(
-                        road_category=RoadCategory(int(row["catr"])),
-                        road=str(row["voie"]),
-                        road_index_number=(
-                            int(row["v1"])
-                            if row["v1"] != "" else None
-                        ),
-                        road_index_alpha=(
-                            str(row["v2"])
-                            if row["v2"] != "N/A" else None
-                        ),
-                        traffic_regime=(
-                            TrafficRegime(int(row["circ"]))
-                            if row["circ"] not in {"", "0", "-1"} else None
-                        ),
-                        lanes_count=(
-                            int(row["nbv"])
-                            if row["nbv"] != "" else None
-                        ),
-                        dedicated_lane=(
-                            DedicatedLane(int(row["vosp"]))
-                            if row["vosp"] not in {"", "-1"} else None
-                        ),
-                        profile=(
-                            Profile(int(row["prof"]))
-                            if row["prof"] not in {"", "0", "-1"} else None
-                        ),
-                        upstream_terminal=(
-                            int(
-                                str(row["pr"])
-                                .removeprefix("(")
-                                .removesuffix(")")
-                            )
-                            if row["pr"] not in {"", "-1"} else None
-                        ),
-                        upstream_terminal_distance_meters=(
-                            float(
-                                str(row["pr1"])
-                                .removeprefix("(")
-                                .removesuffix(")")
-                            )
-                            if row["pr1"] not in {"", "-1"} else None
-                        ),
-                        curvature=(
-                            Curvature(int(row["plan"]))
-                            if row["plan"] not in {"", "0", "-1"} else None
-                        ),
-                        central_reservation_width_meters=(
-                            float(
-                                str(row["lartpc"]).replace(",", ".")
-                            )
-                            if row["lartpc"] != "" else 0
-                        ),
-                        road_traffic_width_meters=(
-                            float(
-                                str(row["larrout"]).replace(",", ".")
-                            )
-                            if row["larrout"] != "" else 0
-                        ),
-                    )
-                )
-                progress.update(1)
-
-    def parse(
-            self,
-            input_paths: list[Path]
-    ) -> Iterable[Tuple[AccidentId, Location]]:
-        progress = tqdm(
-            desc="Parsing locations",
-            total=count_lines(input_paths) - len(input_paths),
-            unit="line",
-        )
-        for path in input_paths:
-            yield from self._parse_file(path, progress)
+        return _SCHEMA.decode(path, progress)
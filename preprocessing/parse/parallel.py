@@ -0,0 +1,118 @@
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+from pathlib import Path
+from typing import (
+    Optional, Sequence, TypeVar, Tuple, Any, Iterator, Callable
+)
+
+from tqdm.auto import tqdm
+
+from model import RecordTable
+from parse import CsvParser
+
+T = TypeVar("T")
+
+
+def _parse_file(parser: CsvParser[T], path: Path) -> list[RecordTable]:
+    # Return the records' fields in compact, array-backed tables (one per
+    # field of the records), which are much cheaper to hold and to send
+    # back to the main process than the records themselves.
+    tables: list[RecordTable] = []
+    for record in parser._parse_cached(path, tqdm(disable=True)):
+        if len(tables) == 0:
+            tables = [RecordTable(type(field)) for field in record]
+        for table, field in zip(tables, record):
+            table.append(field)
+    return tables
+
+
+def _records(
+        futures: "deque[Future[list[RecordTable]]]",
+        paths: Iterator[Path],
+        submit: Callable[[Path], "Future[list[RecordTable]]"],
+        prefetch: int,
+) -> Iterator[Any]:
+    # Yield the records file by file, and submit the next file whenever
+    # a file's records are taken. The first files are only submitted
+    # once the records are consumed.
+    for path in islice(paths, prefetch):
+        futures.append(submit(path))
+    while len(futures) > 0:
+        tables = futures.popleft().result()
+        for path in islice(paths, 1):
+            futures.append(submit(path))
+        yield from zip(*tables)
+
+
+@contextmanager
+def parse_parallel(
+        jobs: Sequence[Tuple[CsvParser[Any], list[Path]]],
+        max_workers: Optional[int] = None,
+        prefetch: Optional[int] = None,
+) -> Iterator[list[Iterator[Any]]]:
+    # Each file is parsed by one worker. The records of each job are
+    # yielded file by file in input order, so that each parser yields the
+    # same records as when serial. At most prefetch files of each job are
+    # parsed ahead of the consumer (or all files at once, if None), which
+    # bounds the memory of parsed records that are not yet consumed.
+    progress = tqdm(
+        desc="Parsing files",
+        total=sum(path.stat().st_size for _, paths in jobs for path in paths),
+        unit="B",
+        unit_scale=True,
+    )
+    executor = ProcessPoolExecutor(max_workers=max_workers)
+
+    def submitter(
+            parser: CsvParser[Any],
+    ) -> Callable[[Path], "Future[list[RecordTable]]"]:
+        def submit(path: Path) -> "Future[list[RecordTable]]":
+            future = executor.submit(_parse_file, parser, path)
+            size = path.stat().st_size
+            future.add_done_callback(lambda _: progress.update(size))
+            return future
+        return submit
+
+    try:
+        if prefetch is None:
+            # Submit the largest files first to balance the workers' load.
+            tasks = sorted(
+                (
+                    (job_index, path_index, path)
+                    for job_index, (_, paths) in enumerate(jobs)
+                    for path_index, path in enumerate(paths)
+                ),
+                key=lambda task: task[2].stat().st_size,
+                reverse=True,
+            )
+            futures: dict[Tuple[int, int], Future] = {
+                (job_index, path_index): submitter(jobs[job_index][0])(path)
+                for job_index, path_index, path in tasks
+            }
+            yield [
+                _records(
+                    deque(
+                        futures.pop((job_index, path_index))
+                        for path_index in range(len(paths))
+                    ),
+                    iter(()),
+                    submitter(parser),
+                    0,
+                )
+                for job_index, (parser, paths) in enumerate(jobs)
+            ]
+        else:
+            yield [
+                _records(
+                    deque(),
+                    iter(paths),
+                    submitter(parser),
+                    prefetch,
+                )
+                for parser, paths in jobs
+            ]
+    finally:
+        executor.shutdown(cancel_futures=True)
+        progress.close()
@@ -0,0 +1,233 @@
+from collections.abc import Set
+from datetime import datetime
+from enum import IntEnum
+from operator import attrgetter
+from pathlib import Path
+from typing import (
+    Iterable, Any, Callable, NamedTuple, Optional, Sequence, Type,
+    get_type_hints, get_origin, get_args
+)
+
+from pyarrow import (
+    Array, DataType, DictionaryArray, Field, ListArray, Schema, Table,
+    array, dictionary, field, float64, int8, int32, int64, list_, schema,
+    string, timestamp
+)
+from pyarrow.parquet import ParquetWriter
+from tqdm.auto import tqdm
+
+from model import Accident, Person, Vehicle
+from parse import Formatter
+from parse.codegen import is_enum, unwrap_optional
+
+
+class _Column(NamedTuple):
+    field: Field
+    to_array: Callable[[Sequence[Any]], Array]
+
+
+def _enum_type() -> DataType:
+    return dictionary(int8(), string())
+
+
+def _enum_to_array(
+        enum: Type[IntEnum]
+) -> Callable[[Sequence[Optional[IntEnum]]], Array]:
+    # Store enums as small integer codes into a fixed dictionary of names,
+    # so that codes are consistent across row groups and files.
+    members = list(enum)
+    codes = {member: code for code, member in enumerate(members)}
+    names = array([member.name for member in members], type=string())
+
+    def to_array(values: Sequence[Optional[IntEnum]]) -> Array:
+        indices = array(
+            [codes[value] if value is not None else None for value in values],
+            type=int8(),
+        )
+        return DictionaryArray.from_arrays(indices, names)
+
+    return to_array
+
+
+def _enum_set_to_array(
+        enum: Type[IntEnum]
+) -> Callable[[Sequence[Set[IntEnum]]], Array]:
+    enum_to_array = _enum_to_array(enum)
+
+    def to_array(values: Sequence[Set[IntEnum]]) -> Array:
+        offsets = [0]
+        flat_values: list[IntEnum] = []
+        for value in values:
+            flat_values.extend(sorted(value))
+            offsets.append(len(flat_values))
+        return ListArray.from_arrays(
+            array(offsets, type=int32()),
+            enum_to_array(flat_values),
+        )
+
+    return to_array
+
+
+def _column(name: str, annotation: Any) -> _Column:
+    annotation, nullable = unwrap_optional(annotation)
+    if is_enum(annotation):
+        return _Column(
+            field(name, _enum_type(), nullable),
+            _enum_to_array(annotation),
+        )
+    elif get_origin(annotation) is Set:
+        enum, = get_args(annotation)
+        return _Column(
+            field(name, list_(_enum_type()), nullable),
+            _enum_set_to_array(enum),
+        )
+    elif annotation is str:
+        # Strings like departments or vehicle names repeat a lot, so store
+        # them as codes into a dictionary of the row group's strings.
+        return _Column(
+            field(name, dictionary(int32(), string()), nullable),
+            lambda values: array(values, type=string()).dictionary_encode(),
+        )
+    elif annotation is datetime:
+        data_type = timestamp("s")
+    elif annotation is float:
+        data_type = float64()
+    elif annotation is int:
+        data_type = int64()
+    else:
+        raise ValueError(f"Unsupported type {annotation} of field {name}.")
+    return _Column(
+        field(name, data_type, nullable),
+        lambda values: array(values, type=data_type),
+    )
+
+
+def _columns(
+        item_type: Type[NamedTuple],
+        exclude: Set[str] = frozenset(),
+) -> list[_Column]:
+    annotations = get_type_hints(item_type)
+    return [
+        _column(name, annotations[name])
+        for name in item_type._fields
+        if name not in exclude
+    ]
+
+
+_ACCIDENT_COLUMNS = _columns(Accident, exclude={"vehicles"})
+_VEHICLE_COLUMNS = [
+    _column("accident_id", int),
+    *_columns(Vehicle, exclude={"persons"}),
+]
+_PERSON_COLUMNS = [
+    _column("accident_id", int),
+    _column("vehicle_name", str),
+    _column("vehicle_id", Optional[int]),
+    *_columns(Person),
+]
+
+
+def _schema(columns: list[_Column]) -> Schema:
+    return schema([column.field for column in columns])
+
+
+# Arrow schemas of the written files.
+SCHEMAS: dict[str, Schema] = {
+    "accidents.parquet": _schema(_ACCIDENT_COLUMNS),
+    "vehicles.parquet": _schema(_VEHICLE_COLUMNS),
+    "persons.parquet": _schema(_PERSON_COLUMNS),
+}
+
+_accident_values = attrgetter(*(
+    column.field.name for column in _ACCIDENT_COLUMNS
+))
+_vehicle_values = attrgetter(*(
+    column.field.name for column in _VEHICLE_COLUMNS[1:]
+))
+
+
+class _TableWriter:
+    def __init__(self, path: Path, columns: list[_Column]):
+        self._columns = columns
+        self._schema = _schema(columns)
+        # Write to a temporary file, which replaces the output when closed.
+        self._path = path
+        self._temporary_path = path.with_name(f"{path.name}.tmp")
+        self._writer = ParquetWriter(self._temporary_path, self._schema)
+        self._rows: list[tuple] = []
+
+    def append(self, row: tuple) -> None:
+        self._rows.append(row)
+
+    def flush(self) -> None:
+        # Write all buffered rows as one row group.
+        if len(self._rows) == 0:
+            return
+        table = Table.from_arrays(
+            [
+                column.to_array(values)
+                for column, values in zip(self._columns, zip(*self._rows))
+            ],
+            schema=self._schema,
+        )
+        self._writer.write_table(table, row_group_size=len(self._rows))
+        self._rows.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self._writer.close()
+        self._temporary_path.replace(self._path)
+
+    def discard(self) -> None:
+        self._writer.close()
+        self._temporary_path.unlink(missing_ok=True)
+
+
+class AccidentsParquetFormatter(Formatter[Accident]):
+    def format(
+            self,
+            items: Iterable[Accident],
+            output_dir: Path
+    ) -> None:
+        items = tqdm(
+            items,
+            desc="Formatting accidents to Parquet",
+            unit="accident",
+        )
+        accidents = _TableWriter(
+            output_dir / "accidents.parquet", _ACCIDENT_COLUMNS
+        )
+        vehicles = _TableWriter(
+            output_dir / "vehicles.parquet", _VEHICLE_COLUMNS
+        )
+        persons = _TableWriter(
+            output_dir / "persons.parquet", _PERSON_COLUMNS
+        )
+        writers = (accidents, vehicles, persons)
+        try:
+            year: Optional[int] = None
+            for accident in items:
+                # Write one row group per year, so that readers can prune
+                # row groups by timestamp or accident ID.
+                if accident.timestamp.year != year:
+                    for writer in writers:
+                        writer.flush()
+                    year = accident.timestamp.year
+                accidents.append(_accident_values(accident))
+                for vehicle in accident.vehicles:
+                    vehicles.append(
+                        (accident.accident_id, *_vehicle_values(vehicle))
+                    )
+                    for person in vehicle.persons:
+                        persons.append((
+                            accident.accident_id,
+                            vehicle.vehicle_name,
+                            vehicle.vehicle_id,
+                            *person,
+                        ))
+        except BaseException:
+            for writer in writers:
+                writer.discard()
+            raise
+        for writer in writers:
+            writer.close()
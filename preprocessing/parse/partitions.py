@@ -0,0 +1,104 @@
+from collections import Counter
+from json import dump
+from operator import attrgetter
+from pathlib import Path
+from typing import (
+    Iterable, Any, Collection, Optional, Sequence, get_type_hints
+)
+
+from tqdm.auto import tqdm
+
+from model import Accident
+from parse import Formatter
+from parse.codegen import is_enum, unwrap_optional
+from parse.compress import open_text_output, check_compressions
+
+# Number of accidents per combination of all categorical attributes,
+# for the treemaps (see src/Visualization3.elm), so that the hierarchy
+# for any ordered path of attributes can be rolled up from the cube
+# instead of partitioning the raw accidents.
+
+
+def _enum(annotation: Any) -> Optional[type]:
+    annotation, _ = unwrap_optional(annotation)
+    return annotation if is_enum(annotation) else None
+
+
+# Categorical attributes of the accidents, i.e., from the characteristics
+# and the location, but not from the vehicles or persons.
+DIMENSIONS: dict[str, type] = {
+    name: _enum(annotation)
+    for name, annotation in get_type_hints(Accident).items()
+    if _enum(annotation) is not None
+}
+
+_dimension_values = attrgetter(*DIMENSIONS.keys())
+
+
+def roll_up(cube: dict, path: Sequence[str]) -> dict:
+    # Roll up the cube to a tree of counts for the given attribute path.
+    # Each node has the count and a mapping of the child nodes by value.
+    indices = [cube["dimensions"].index(name) for name in path]
+    root: dict = {"count": 0, "children": {}}
+    for *codes, count in cube["cells"]:
+        node = root
+        node["count"] += count
+        for dimension, index in zip(path, indices):
+            code = codes[index]
+            value = cube["values"][dimension][code] if code >= 0 else None
+            node = node["children"].setdefault(
+                value, {"count": 0, "children": {}}
+            )
+            node["count"] += count
+    return root
+
+
+class PartitionsFormatter(Formatter[Accident]):
+    def __init__(self, compressions: Collection[str] = ()):
+        check_compressions(compressions)
+        self._compressions = compressions
+
+    def format(
+            self,
+            items: Iterable[Accident],
+            output_dir: Path
+    ) -> None:
+        items = tqdm(
+            items,
+            desc="Aggregating partitions",
+            unit="accident",
+        )
+        cells: Counter[tuple] = Counter(
+            _dimension_values(accident) for accident in items
+        )
+        codes = [
+            {member: code for code, member in enumerate(enum)}
+            for enum in DIMENSIONS.values()
+        ]
+        output_path = output_dir / "partitions.json"
+        with open_text_output(output_path, self._compressions) as file:
+            dump(
+                {
+                    "dimensions": list(DIMENSIONS.keys()),
+                    # Cells refer to values by their index (-1 for None).
+                    "values": {
+                        name: [member.name for member in enum]
+                        for name, enum in DIMENSIONS.items()
+                    },
+                    "cells": sorted(
+                        [
+                            *(
+                                dimension_codes[value]
+                                if value is not None else -1
+                                for dimension_codes, value in zip(
+                                    codes, values
+                                )
+                            ),
+                            count,
+                        ]
+                        for values, count in cells.items()
+                    ),
+                },
+                file,
+                separators=(",", ":"),
+            )
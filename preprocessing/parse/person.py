@@ -1,4 +1,4 @@
-from csv import DictReader
+from datetime import MAXYEAR
 from itertools import chain
 from pathlib import Path
 from typing import Iterable, FrozenSet, Tuple
@@ -10,11 +10,77 @@ from model import (
     TravelReason, SafetyEquipment, PedestrianLocation, PedestrianAction,
     PedestrianCompany, AccidentId, VehicleId
 )
-from parse import Parser
-from parse.util import count_lines
+from parse import CsvParser
+from parse.schema import Schema, Layout, Column
+from parse.util import parse_vehicle_id
 
 
-class PersonsCsvParser(Parser[Tuple[AccidentId, VehicleId, Person]]):
+def _safety_equipment(values: Iterable[str]) -> FrozenSet[SafetyEquipment]:
+    return frozenset(chain.from_iterable(
+        PersonsCsvParser._equipment(value)
+        for value in values
+    ))
+
+
+def _values(*values: str) -> Tuple[str, ...]:
+    return values
+
+
+_COLUMNS = {
+    "accident_id": Column("Num_Acc", transform=int),
+    "vehicle_id": Column(),
+    "vehicle_name": Column("num_veh", intern=True),
+    "place": Column("place", nulls=("", "0"), enum=Place),
+    "category": Column("catu", nulls=("4",), enum=PersonCategory),
+    "severity": Column("grav", enum=Severity),
+    "sex": Column("sexe", enum=Sex),
+    "birth_year": Column("an_nais", nulls=("",), transform=int, lookup=True),
+    "travel_reason": Column(
+        "trajet", nulls=("", "0", "-1"), enum=TravelReason
+    ),
+    # One character per equipment, copied to a new set for each person.
+    "safety_equipment": Column(
+        "secu", transform=_safety_equipment, lookup=True, finish=set
+    ),
+    "pedestrian_location": Column(
+        "locp", nulls=("", "0", "-1", "9"), enum=PedestrianLocation
+    ),
+    "pedestrian_action": Column(
+        "actp",
+        nulls=("", "0", "-1", "7", "8", "B"),
+        values={"A": PedestrianAction.GETTING_ON_OFF_VEHICLE},
+        enum=PedestrianAction,
+    ),
+    "pedestrian_company": Column(
+        "etatp", nulls=("", "0", "-1"), enum=PedestrianCompany
+    ),
+}
+
+# Vehicle IDs are only given since 2019, and up to three safety
+# equipments in separate columns.
+_COLUMNS_2019 = {
+    **_COLUMNS,
+    "vehicle_id": Column("id_vehicule", transform=parse_vehicle_id),
+    "safety_equipment": Column(
+        ("secu1", "secu2", "secu3"),
+        combine=_values,
+        transform=_safety_equipment,
+        lookup=True,
+        finish=set,
+    ),
+}
+
+_SCHEMA: Schema[Tuple[AccidentId, VehicleId, Person]] = Schema(
+    outputs=(AccidentId, VehicleId, Person),
+    layouts=[
+        Layout(range(2019), ",", _COLUMNS),
+        Layout(range(2019, MAXYEAR + 1), ";", _COLUMNS_2019),
+    ],
+)
+
+
+class PersonsCsvParser(CsvParser[Tuple[AccidentId, VehicleId, Person]]):
+    description = "persons"
 
     @staticmethod
     def _equipment(
@@ -34,91 +100,4 @@ class PersonsCsvParser(Parser[Tuple[AccidentId, VehicleId, Person]]):
             path: Path,
             progress: tqdm,
     ) -> Iterable[Tuple[AccidentId, VehicleId, Person]]:
-        file_year = int(path.name.split("-")[-1].removesuffix(".csv"))
-        delimiter: str
-        if file_year >= 2019:
-            delimiter = ";"
-        else:
-            delimiter = ","
-        with path.open("r") as file:
-            reader = DictReader(file, delimiter=delimiter, quotechar='"')
-            for row in reader:
-                for key in row:
-                    row[key] = str(row[key]).strip()
-                yield (
-                    AccidentId(
-                        accident_id=int(row["Num_Acc"]),
-                    ),
-                    VehicleId(
-                        vehicle_id=(
-                            int(str(row["id_vehicule"]).replace(" ", ""))
-                            if "id_vehicule" in row else None
-                        ),
-                        vehicle_name=str(row["num_veh"]),
-                    ),
-                    Person(
-                        place=(
-                            Place(int(row["place"]))
-                            if row["place"] not in {"", "0"} else None
-                        ),
-                        category=(
-                            PersonCategory(int(row["catu"]))
-                            if row["catu"] != "4" else None
-                        ),
-                        severity=Severity(int(row["grav"])),
-                        sex=Sex(int(row["sexe"])),
-                        birth_year=(
-                            int(row["an_nais"])
-                            if row["an_nais"] != "" else None
-                        ),
-                        travel_reason=(
-                            TravelReason(int(row["trajet"]))
-                            if row["trajet"] not in {"", "0", "-1"} else None
-                        ),
-                        safety_equipment=(
-                            set(chain.from_iterable(
-                                (
-                                    PersonsCsvParser._equipment(str(char))
-                                    for char in str(row["secu"])
-                                )
-                                if "secu" in row else
-                                (
-                                    PersonsCsvParser._equipment(row["secu1"]),
-                                    PersonsCsvParser._equipment(row["secu2"]),
-                                    PersonsCsvParser._equipment(row["secu3"]),
-                                )
-                            ))
-                        ),
-                        pedestrian_location=(
-                            PedestrianLocation(int(row["locp"]))
-                            if row["locp"] not in {
-                                "", "0", "-1", "9"
-                            } else None
-                        ),
-                        pedestrian_action=(
-                            PedestrianAction.GETTING_ON_OFF_VEHICLE
-                            if row["actp"] == "A" else
-                            PedestrianAction(int(row["actp"]))
-                            if row["actp"] not in {
-                                "", "0", "-1", "7", "8", "B"
-                            } else None
-                        ),
-                        pedestrian_company=(
-                            PedestrianCompany(int(row["etatp"]))
-                            if row["etatp"] not in {"", "0", "-1"} else None
-                        ),
-                    )
-                )
-                progress.update(1)
-
-    def parse(
-            self,
-            input_paths: list[Path]
-    ) -> Iterable[Tuple[AccidentId, VehicleId, Person]]:
-        progress = tqdm(
-            desc="Parsing persons",
-            total=count_lines(input_paths) - len(input_paths),
-            unit="line",
-        )
-        for path in input_paths:
-            yield from self._parse_file(path, progress)
+        return _SCHEMA.decode(path, progress)
@@ -0,0 +1,158 @@
+from collections.abc import Set, Collection
+from datetime import datetime
+from enum import IntEnum
+from typing import (
+    AbstractSet, Any, Callable, NamedTuple, Type, get_type_hints, get_origin,
+    get_args
+)
+
+from parse.codegen import FunctionCompiler, is_enum, unwrap_optional
+
+# Compile encoders of NamedTuple types to flat rows of SQLite values
+# (integers, floats, strings, or None), and decoders back to the same
+# NamedTuples, without pickling. Enums are encoded as their integer values,
+# timestamps as ISO strings, and sets of enums as comma-separated values
+# (in iteration order). Collections of child records are not encoded,
+# and are decoded as new, empty lists.
+
+
+def _is_child(annotation: Any) -> bool:
+    if get_origin(annotation) is not Collection:
+        return False
+    item_type, = get_args(annotation)
+    return isinstance(item_type, type) and issubclass(item_type, tuple)
+
+
+def row_fields(
+        item_type: Type[NamedTuple],
+        exclude: AbstractSet[str] = frozenset(),
+) -> list[str]:
+    # Names of the encoded fields, in row order.
+    annotations = get_type_hints(item_type)
+    return [
+        field
+        for field in item_type._fields
+        if not _is_child(annotations[field]) and field not in exclude
+    ]
+
+
+class _SetLookup(dict):
+    # Decode each distinct set of enum values only once.
+    def __init__(self, enum: Type[IntEnum]):
+        super().__init__()
+        self._enum = enum
+
+    def __missing__(self, value: str) -> tuple:
+        members = tuple(
+            self._enum(int(item))
+            for item in value.split(",")
+            if item != ""
+        )
+        self[value] = members
+        return members
+
+
+def _encode_set(value: Set) -> str:
+    return ",".join([str(int(item)) for item in value])
+
+
+class _Compiler(FunctionCompiler):
+    def __init__(self, to_row: bool):
+        # Either compile encoders to rows (True)
+        # or decoders from rows (False).
+        super().__init__({
+            "_new": tuple.__new__,
+            "_encode_set": _encode_set,
+            "_from_iso": datetime.fromisoformat,
+        })
+        self._to_row = to_row
+
+    def _enum_codes(self, enum: Type[IntEnum]) -> str:
+        # Also map None to None, to skip checks for optional enums.
+        if self._to_row:
+            return self._constant(f"_values_{enum.__name__}", {
+                None: None,
+                **{member: member.value for member in enum},
+            })
+        return self._constant(f"_members_{enum.__name__}", {
+            None: None,
+            **{member.value: member for member in enum},
+        })
+
+    def _expression(self, annotation: Any, value: str) -> str:
+        annotation, optional = unwrap_optional(annotation)
+        if optional:
+            # Enums and plain values already map None to None.
+            if is_enum(annotation) or annotation in (str, int, float):
+                return self._expression(annotation, value)
+            return (
+                f"(None if {value} is None else "
+                f"{self._expression(annotation, value)})"
+            )
+        if is_enum(annotation):
+            return f"{self._enum_codes(annotation)}[{value}]"
+        elif get_origin(annotation) is Set:
+            enum, = get_args(annotation)
+            if self._to_row:
+                return f"_encode_set({value})"
+            sets = self._constant(
+                f"_sets_{enum.__name__}", _SetLookup(enum)
+            )
+            return f"set({sets}[{value}])"
+        elif annotation is datetime:
+            if self._to_row:
+                return f"{value}.isoformat()"
+            return f"_from_iso({value})"
+        elif annotation in (str, int, float):
+            return value
+        else:
+            raise ValueError(f"Unsupported type {annotation}.")
+
+    def compile(
+            self,
+            item_type: Type[NamedTuple],
+            offset: int,
+            exclude: AbstractSet[str],
+    ) -> Callable[[Any], Any]:
+        annotations = get_type_hints(item_type)
+        prefix = "_encode" if self._to_row else "_decode"
+        name = f"{prefix}_{item_type.__name__}"
+        expressions = []
+        index = offset
+        for field in item_type._fields:
+            annotation = annotations[field]
+            if _is_child(annotation):
+                if not self._to_row:
+                    expressions.append("[]")
+                continue
+            if field in exclude:
+                continue
+            if self._to_row:
+                value = f"value[{item_type._fields.index(field)}]"
+            else:
+                value = f"row[{index}]"
+                index += 1
+            expressions.append(self._expression(annotation, value))
+        if self._to_row:
+            body = f"({', '.join(expressions)},)"
+            source = f"def {name}(value):\n    return {body}\n"
+        else:
+            self._constant("_type", item_type)
+            body = f"_new(_type, ({', '.join(expressions)},))"
+            source = f"def {name}(row):\n    return {body}\n"
+        return self._define(name, source)
+
+
+def compile_row_encoder(
+        item_type: Type[NamedTuple],
+        exclude: AbstractSet[str] = frozenset(),
+) -> Callable[[Any], tuple]:
+    return _Compiler(to_row=True).compile(item_type, 0, exclude)
+
+
+def compile_row_decoder(
+        item_type: Type[NamedTuple],
+        offset: int = 0,
+) -> Callable[[tuple], Any]:
+    # Decode the fields from the row, starting at the given offset.
+    return _Compiler(to_row=False).compile(item_type, offset, frozenset())
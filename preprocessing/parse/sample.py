@@ -0,0 +1,80 @@
+from collections import defaultdict
+from hashlib import blake2b
+from pathlib import Path
+from typing import Sequence, Collection
+
+from instrument import stage
+from join import accident_year
+from parse.compress import open_output
+from parse.index import JsonlIndex
+
+# Nested, reproducible samples of a JSONL file of accidents. Accidents
+# are ordered by a seeded hash of their ID, and each sample is a prefix
+# of that order, so that smaller samples are contained in larger ones
+# (and are even the first lines of the larger samples' files).
+
+
+def _hash(accident_id: int, seed: int) -> int:
+    # Use the seed's lowest 64 bits (in two's complement), such that
+    # negative seeds are valid, too, and non-negative seeds are unchanged.
+    return int.from_bytes(
+        blake2b(
+            accident_id.to_bytes(8, "little"),
+            digest_size=8,
+            key=(seed & 0xFFFF_FFFF_FFFF_FFFF).to_bytes(8, "little"),
+        ).digest(),
+        "little",
+    )
+
+
+def _sample_order(
+        index: JsonlIndex,
+        seed: int,
+        stratify: bool,
+) -> list[int]:
+    # Positions in the index ordered by sampling priority.
+    hashes = [_hash(accident_id, seed) for accident_id in index.ids]
+    if not stratify:
+        return sorted(range(len(hashes)), key=hashes.__getitem__)
+    # Within each year, spread the accidents evenly over [0, 1) by their
+    # hash rank. Every prefix then contains about the same share of each
+    # year's accidents.
+    year_positions: dict[int, list[int]] = defaultdict(list)
+    for position, accident_id in enumerate(index.ids):
+        year_positions[accident_year(accident_id)].append(position)
+    priorities: list[tuple[float, int]] = [(0.0, 0)] * len(hashes)
+    for positions in year_positions.values():
+        positions.sort(key=hashes.__getitem__)
+        for rank, position in enumerate(positions):
+            priorities[position] = (
+                (rank + 0.5) / len(positions), hashes[position]
+            )
+    return sorted(range(len(hashes)), key=priorities.__getitem__)
+
+
+def sample_path(path: Path, size: int) -> Path:
+    return path.with_name(f"{path.stem}-sample-{size}{path.suffix}")
+
+
+def write_samples(
+        path: Path,
+        index: JsonlIndex,
+        sizes: Sequence[int],
+        seed: int = 0,
+        stratify: bool = False,
+        compressions: Collection[str] = (),
+) -> None:
+    if len(sizes) == 0:
+        return
+    with stage("samples") as samples_stage:
+        order = _sample_order(index, seed, stratify)
+        with path.open("rb") as file:
+            for size in sorted(sizes):
+                output_path = sample_path(path, size)
+                with open_output(output_path, compressions) as sample_file:
+                    for position in order[:size]:
+                        file.seek(index.offsets[position])
+                        sample_file.write(
+                            file.read(index.lengths[position] + 1)
+                        )
+                        samples_stage.items += 1
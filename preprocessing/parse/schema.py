@@ -0,0 +1,233 @@
+from csv import reader
+from enum import IntEnum
+from pathlib import Path
+from types import MappingProxyType
+from typing import (
+    Any, Callable, Collection, Generic, Iterable, Iterator, Mapping,
+    NamedTuple, Optional, Sequence, Tuple, Type, TypeVar, Union
+)
+
+from tqdm.auto import tqdm
+
+from parse.codegen import FunctionCompiler
+from parse.util import open_text, file_year, string_dictionary
+
+# Declarative schemas of the CSV tables, that map the (stripped) values of
+# the source columns of each year's layout to the fields of the parsed
+# records. Each layout is compiled once per file header into a specialized
+# decoder function. Low-cardinality columns (e.g., enums) are decoded with
+# lookup tables from raw strings to values, filled on first sight, instead
+# of parsing, comparing, and constructing each value again. Repeated
+# strings (e.g., departments) are interned in shared dictionaries.
+
+T = TypeVar("T")
+
+
+class Column(NamedTuple):
+    # CSV column to decode the field from, or multiple columns whose values
+    # are combined first. Without a source, the field is always null.
+    source: Union[str, Tuple[str, ...], None] = None
+    combine: Optional[Callable[..., Any]] = None
+    # Raw values that decode to the null value.
+    nulls: Collection[str] = ()
+    null: Any = None
+    # Raw values that decode to fixed values.
+    values: Mapping[Any, Any] = MappingProxyType({})
+    # Transform raw values (by default to integers for enums).
+    transform: Optional[Callable[[Any], Any]] = None
+    # Enum of the transformed codes and codes that decode to null.
+    enum: Optional[Type[IntEnum]] = None
+    null_codes: Collection[int] = ()
+    # Decode each distinct raw value only once. Always used for enums.
+    lookup: bool = False
+    # Share equal decoded strings in the field's dictionary, across files.
+    intern: bool = False
+    # Apply to each decoded value, e.g., to copy mutable values.
+    finish: Optional[Callable[[Any], Any]] = None
+
+
+class Layout(NamedTuple):
+    years: range
+    delimiter: str
+    # Columns of each field of the records.
+    columns: Mapping[str, Column]
+
+
+def _decoder(column: Column) -> Callable[[Any], Any]:
+    transform = column.transform
+    if transform is None and column.enum is not None:
+        transform = int
+    values = {
+        **{null: column.null for null in column.nulls},
+        **column.values,
+    }
+
+    def decode(raw: Any) -> Any:
+        if raw in values:
+            return values[raw]
+        value = raw if transform is None else transform(raw)
+        if column.enum is not None:
+            if value in column.null_codes:
+                return column.null
+            return column.enum(value)
+        return value
+
+    return decode
+
+
+class _Lookup(dict):
+    # Table of decoded values by raw value, filled on first sight.
+    def __init__(self, decode: Callable[[Any], Any]):
+        super().__init__()
+        self._decode = decode
+
+    def __missing__(self, raw: Any) -> Any:
+        value = self[raw] = self._decode(raw)
+        return value
+
+
+class _Compiler(FunctionCompiler):
+    def __init__(self, outputs: Sequence[type], layout: Layout):
+        super().__init__({"_new": tuple.__new__})
+        self._outputs = outputs
+        self._layout = layout
+
+    def _field(
+            self,
+            field: str,
+            column: Column,
+            raws: Sequence[str],
+    ) -> list[str]:
+        # Statements that decode the field from the raw value variables.
+        target = f"f_{field}"
+        if column.source is None:
+            value = self._constant(f"_null_{field}", column.null)
+            lines = [f"{target} = {value}"]
+        else:
+            lines = []
+            raw = raws[0]
+            if column.combine is not None:
+                combine = self._constant(f"_combine_{field}", column.combine)
+                lines.append(f"{target} = {combine}({', '.join(raws)})")
+                raw = target
+            if column.lookup or column.enum is not None:
+                table = self._constant(
+                    f"_table_{field}", _Lookup(_decoder(column))
+                )
+                lines.append(f"{target} = {table}[{raw}]")
+            elif (
+                    len(column.nulls) > 0 or
+                    len(column.values) > 0 or
+                    column.transform is not None
+            ):
+                decode = self._constant(f"_decode_{field}", _decoder(column))
+                lines.append(f"{target} = {decode}({raw})")
+            elif raw != target:
+                lines.append(f"{target} = {raw}")
+            if column.intern:
+                strings = self._constant(
+                    f"_strings_{field}", string_dictionary(field)
+                )
+                lines.append(
+                    f"{target} = {strings}.setdefault({target}, {target})"
+                )
+        if column.finish is not None:
+            finish = self._constant(f"_finish_{field}", column.finish)
+            lines.append(f"{target} = {finish}({target})")
+        return lines
+
+    def compile(
+            self,
+            header: Sequence[str],
+    ) -> Callable[[Iterable[list[str]]], Iterator[Any]]:
+        indices = {source: index for index, source in enumerate(header)}
+        raw_names: dict[str, str] = {}
+        lines = []
+        for field, column in self._layout.columns.items():
+            sources = (
+                () if column.source is None else
+                (column.source,) if isinstance(column.source, str) else
+                column.source
+            )
+            for source in sources:
+                if source not in indices:
+                    raise ValueError(f"Missing column {source}.")
+                if source not in raw_names:
+                    raw_names[source] = f"r_{len(raw_names)}"
+            lines.extend(self._field(
+                field, column, [raw_names[source] for source in sources]
+            ))
+        outputs = ", ".join(
+            f"_new({self._constant(f'_{output.__name__}', output)}, "
+            f"({''.join(f'f_{field}, ' for field in output._fields)}))"
+            for output in self._outputs
+        )
+        strips = [
+            f"{name} = row[{indices[source]}].strip()"
+            for source, name in raw_names.items()
+        ]
+        source = "\n".join([
+            "def _decode(rows):",
+            "    for row in rows:",
+            "        if len(row) == 0:",
+            "            continue",
+            f"        if len(row) != {len(header)}:",
+            "            raise ValueError(",
+            f"                'Expected {len(header)} fields, got '",
+            "                f'{len(row)}.'",
+            "            )",
+            *(f"        {line}" for line in strips + lines),
+            f"        yield {outputs}",
+            "",
+        ])
+        return self._define("_decode", source)
+
+
+class Schema(Generic[T]):
+    def __init__(
+            self,
+            outputs: Sequence[type],
+            layouts: Sequence[Layout],
+            encoding: Optional[str] = None,
+    ):
+        # Decode records into tuples of the output NamedTuple types,
+        # whose fields are taken from the columns of the same name.
+        fields = {field for output in outputs for field in output._fields}
+        for layout in layouts:
+            if set(layout.columns.keys()) != fields:
+                raise ValueError(
+                    f"Columns do not match fields in {layout.years}."
+                )
+        self._outputs = outputs
+        self._layouts = layouts
+        self._encoding = encoding
+        self._decoders: dict[
+            Tuple[int, Tuple[str, ...]],
+            Callable[[Iterable[list[str]]], Iterator[T]],
+        ] = {}
+
+    def _layout_index(self, year: int) -> int:
+        for index, layout in enumerate(self._layouts):
+            if year in layout.years:
+                return index
+        raise ValueError(f"No layout for year {year}.")
+
+    def decode(self, path: Path, progress: tqdm) -> Iterator[T]:
+        index = self._layout_index(file_year(path))
+        layout = self._layouts[index]
+        with open_text(path, progress, self._encoding) as file:
+            rows = reader(file, delimiter=layout.delimiter, quotechar='"')
+            header = tuple(next(rows, ()))
+            if len(header) == 0:
+                return
+            key = (index, header)
+            if key not in self._decoders:
+                self._decoders[key] = _Compiler(
+                    self._outputs, layout
+                ).compile(header)
+            try:
+                yield from self._decoders[key](rows)
+            except ValueError as error:
+                raise ValueError(
+                    f"Invalid row in {path} at line {rows.line_num}: {error}"
+                ) from error
@@ -0,0 +1,228 @@
+from datetime import datetime
+from enum import IntEnum
+from itertools import count
+from pathlib import Path
+from re import sub
+from sqlite3 import connect, Connection
+from typing import (
+    AbstractSet, Any, Iterable, NamedTuple, Type, get_type_hints, get_args
+)
+
+from tqdm.auto import tqdm
+
+from model import Accident, Person, Vehicle
+from parse import Formatter
+from parse.codegen import is_enum, unwrap_optional
+from parse.rows import compile_row_encoder, row_fields
+from parse.util import tile_position
+
+# Normalized, indexed SQLite database of the accidents, their vehicles,
+# and their persons (written to accidents.sqlite), to run filtered queries
+# without scanning the JSONL file. Enums are stored as integer codes
+# (their values), with a lookup table of names for each enum, and each
+# accident is assigned the tile of a spatial grid (see parse/tiles.py).
+
+
+def _enum_table(enum: Type[IntEnum]) -> str:
+    # E.g., road_category for RoadCategory.
+    return sub(r"(?<!^)(?=[A-Z])", "_", enum.__name__).lower()
+
+
+def _enums(item_types: Iterable[Type[NamedTuple]]) -> list[Type[IntEnum]]:
+    enums: dict[Type[IntEnum], None] = {}
+    for item_type in item_types:
+        for annotation in get_type_hints(item_type).values():
+            for argument in (annotation, *get_args(annotation)):
+                if is_enum(argument):
+                    enums[argument] = None
+    return list(enums.keys())
+
+
+def _declaration(name: str, annotation: Any) -> str:
+    annotation, optional = unwrap_optional(annotation)
+    constraint = "" if optional else " NOT NULL"
+    if is_enum(annotation):
+        return (
+            f"{name} INTEGER{constraint} "
+            f"REFERENCES {_enum_table(annotation)} (code)"
+        )
+    elif annotation is datetime:
+        # ISO 8601, as understood by SQLite's date and time functions.
+        return f"{name} TEXT{constraint}"
+    elif annotation is float:
+        return f"{name} REAL{constraint}"
+    elif annotation is int:
+        return f"{name} INTEGER{constraint}"
+    elif annotation is str:
+        return f"{name} TEXT{constraint}"
+    else:
+        raise ValueError(f"Unsupported type {annotation} of field {name}.")
+
+
+def _declarations(
+        item_type: Type[NamedTuple],
+        exclude: AbstractSet[str] = frozenset(),
+) -> list[str]:
+    # Same columns and order as the rows of the compiled row encoder.
+    annotations = get_type_hints(item_type)
+    return [
+        _declaration(name, annotations[name])
+        for name in row_fields(item_type, exclude)
+    ]
+
+
+_ENUMS = _enums((Accident, Vehicle, Person))
+
+_TABLES = {
+    "accidents": [
+        "accident_id INTEGER PRIMARY KEY",
+        *_declarations(Accident, exclude={"accident_id"}),
+        "tile_x INTEGER",
+        "tile_y INTEGER",
+    ],
+    "vehicles": [
+        "vehicle_key INTEGER PRIMARY KEY",
+        "accident_id INTEGER NOT NULL REFERENCES accidents (accident_id)",
+        *_declarations(Vehicle),
+    ],
+    "persons": [
+        "person_key INTEGER PRIMARY KEY",
+        "vehicle_key INTEGER NOT NULL REFERENCES vehicles (vehicle_key)",
+        "accident_id INTEGER NOT NULL REFERENCES accidents (accident_id)",
+        *_declarations(Person, exclude={"safety_equipment"}),
+    ],
+    "persons_safety_equipment": [
+        "person_key INTEGER NOT NULL REFERENCES persons (person_key)",
+        "safety_equipment INTEGER NOT NULL "
+        "REFERENCES safety_equipment (code)",
+    ],
+    "metadata": [
+        "key TEXT PRIMARY KEY",
+        "value",
+    ],
+}
+
+# Indexes are created after loading, which is faster.
+_INDEXES = """
+CREATE INDEX accidents_timestamp ON accidents (timestamp);
+CREATE INDEX accidents_department_commune ON accidents (department, commune);
+CREATE INDEX accidents_road_category ON accidents (road_category);
+CREATE INDEX accidents_tile ON accidents (tile_x, tile_y);
+CREATE INDEX vehicles_accident ON vehicles (accident_id);
+CREATE INDEX persons_vehicle ON persons (vehicle_key);
+CREATE INDEX persons_accident ON persons (accident_id);
+CREATE INDEX persons_severity ON persons (severity);
+CREATE INDEX persons_safety_equipment_person
+    ON persons_safety_equipment (person_key);
+"""
+
+_encode_accident = compile_row_encoder(Accident)
+_encode_vehicle = compile_row_encoder(Vehicle)
+_encode_person = compile_row_encoder(Person, exclude={"safety_equipment"})
+
+
+def _insert(connection: Connection, table: str, rows: list[tuple]) -> None:
+    placeholders = ", ".join("?" * len(_TABLES[table]))
+    connection.executemany(
+        f"INSERT INTO {table} VALUES ({placeholders})", rows
+    )
+    rows.clear()
+
+
+class AccidentsSqliteFormatter(Formatter[Accident]):
+    def __init__(
+            self,
+            tile_zoom: int = 10,
+            batch_size: int = 10_000,
+            cache_size: int = 64 << 20,
+    ):
+        self._tile_zoom = tile_zoom
+        self._batch_size = batch_size
+        self._cache_size = cache_size
+
+    def _load(self, connection: Connection, items: Iterable[Accident]) -> None:
+        rows: dict[str, list[tuple]] = {table: [] for table in _TABLES}
+        for enum in _ENUMS:
+            connection.execute(
+                f"CREATE TABLE {_enum_table(enum)} "
+                f"(code INTEGER PRIMARY KEY, name TEXT NOT NULL)"
+            )
+            connection.executemany(
+                f"INSERT INTO {_enum_table(enum)} VALUES (?, ?)",
+                ((member.value, member.name) for member in enum),
+            )
+        for table, columns in _TABLES.items():
+            connection.execute(f"CREATE TABLE {table} ({', '.join(columns)})")
+        rows["metadata"].append(("tile_zoom", self._tile_zoom))
+
+        vehicle_keys = count(1)
+        person_keys = count(1)
+        for accident in items:
+            if accident.latitude is None or accident.longitude is None:
+                tile = (None, None)
+            else:
+                tile = tile_position(
+                    accident.latitude, accident.longitude, self._tile_zoom
+                )
+            rows["accidents"].append((*_encode_accident(accident), *tile))
+            for vehicle in accident.vehicles:
+                vehicle_key = next(vehicle_keys)
+                rows["vehicles"].append((
+                    vehicle_key,
+                    accident.accident_id,
+                    *_encode_vehicle(vehicle),
+                ))
+                for person in vehicle.persons:
+                    person_key = next(person_keys)
+                    rows["persons"].append((
+                        person_key,
+                        vehicle_key,
+                        accident.accident_id,
+                        *_encode_person(person),
+                    ))
+                    rows["persons_safety_equipment"].extend(
+                        (person_key, equipment.value)
+                        for equipment in person.safety_equipment
+                    )
+            # Insert in batches, to bound memory usage.
+            if len(rows["accidents"]) >= self._batch_size:
+                for table, table_rows in rows.items():
+                    _insert(connection, table, table_rows)
+        for table, table_rows in rows.items():
+            _insert(connection, table, table_rows)
+        connection.executescript(_INDEXES)
+
+    def format(
+            self,
+            items: Iterable[Accident],
+            output_dir: Path
+    ) -> None:
+        items = tqdm(
+            items,
+            desc="Formatting accidents to SQLite",
+            unit="accident",
+        )
+        path = output_dir / "accidents.sqlite"
+        # Load into a temporary file, so that readers never see a partial
+        # database, without journaling, and in a single transaction.
+        temporary_path = path.with_name(f"{path.name}.tmp")
+        temporary_path.unlink(missing_ok=True)
+        connection = connect(temporary_path)
+        try:
+            connection.executescript(f"""
+                PRAGMA journal_mode = OFF;
+                PRAGMA synchronous = OFF;
+                PRAGMA locking_mode = EXCLUSIVE;
+                PRAGMA cache_size = -{max(self._cache_size >> 10, 1)};
+            """)
+            with connection:
+                self._load(connection, items)
+            # Collect statistics for the query planner.
+            connection.execute("ANALYZE")
+            connection.execute("PRAGMA journal_mode = DELETE")
+        except BaseException:
+            connection.close()
+            temporary_path.unlink(missing_ok=True)
+            raise
+        connection.close()
+        temporary_path.replace(path)
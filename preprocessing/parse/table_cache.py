@@ -0,0 +1,248 @@
+from array import array
+from ast import Import, ImportFrom, parse, walk
+from contextlib import contextmanager
+from functools import cache
+from gc import disable, enable, isenabled
+from hashlib import sha256
+from importlib.util import find_spec
+from inspect import getmodule
+from itertools import chain, repeat
+from os import utime
+from pathlib import Path
+from pickle import dump, load, HIGHEST_PROTOCOL, UnpicklingError
+from typing import (
+    Any, Iterable, Iterator, Sequence, Tuple, NamedTuple, Optional
+)
+
+from tqdm.auto import tqdm
+
+from cache import CACHE_DIR, cached_file_digest
+
+# Cache of the records parsed from each CSV file, so that warm rebuilds
+# (e.g., after changing the join or an output format) skip parsing.
+# Entries are pickled column by column, which is much faster to load than
+# pickled records, and keyed by the parser, the parser's version, and
+# the CSV file's digest. The least recently used entries are evicted when
+# the cache grows too large. Pickled entries are only safe to load from a
+# trusted cache directory.
+
+# Directory of the cached tables.
+TABLES_DIR = CACHE_DIR / "tables"
+
+_PREPROCESSING_DIR = Path(__file__).resolve().parent.parent
+
+
+def _local_path(name: str) -> Optional[Path]:
+    # Source file of the module, if it is part of the preprocessing code.
+    try:
+        top_level_spec = find_spec(name.partition(".")[0])
+        if (
+                top_level_spec is None or
+                not top_level_spec.has_location or
+                _PREPROCESSING_DIR not in
+                Path(top_level_spec.origin).resolve().parents
+        ):
+            return None
+        spec = find_spec(name)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.has_location:
+        return None
+    return Path(spec.origin).resolve()
+
+
+def _imported_names(path: Path) -> Iterator[str]:
+    # Modules imported anywhere in the file (and the imported names, which
+    # might be submodules).
+    for node in walk(parse(path.read_bytes(), str(path))):
+        if isinstance(node, Import):
+            for alias in node.names:
+                yield alias.name
+        elif isinstance(node, ImportFrom) and node.module is not None:
+            yield node.module
+            for alias in node.names:
+                yield f"{node.module}.{alias.name}"
+
+
+def _local_sources(paths: Iterable[Path]) -> set[Path]:
+    # The files and the preprocessing modules they import, transitively.
+    sources: set[Path] = set()
+    pending = list(paths)
+    while len(pending) > 0:
+        path = pending.pop()
+        if path in sources:
+            continue
+        sources.add(path)
+        for name in _imported_names(path):
+            # Importing a submodule also imports its parent packages.
+            parts = name.split(".")
+            for end in range(1, len(parts) + 1):
+                imported_path = _local_path(".".join(parts[:end]))
+                if imported_path is not None:
+                    pending.append(imported_path)
+    return sources
+
+
+def source_version(*values: Any) -> str:
+    # Hash the source code of the preprocessing modules defining the
+    # values, and of the preprocessing modules they import (transitively).
+    paths = []
+    for value in values:
+        module = getmodule(value)
+        path = getattr(module, "__file__", None)
+        if path is not None and _local_path(module.__name__) is not None:
+            paths.append(Path(path).resolve())
+    digest = sha256()
+    for path in sorted(_local_sources(paths)):
+        digest.update(path.relative_to(_PREPROCESSING_DIR).as_posix().encode())
+        digest.update(b"\0")
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+@cache
+def parser_version(parser_type: type) -> str:
+    # Any change to the parsing code invalidates the cached tables.
+    return source_version(*parser_type.__mro__)
+
+
+@contextmanager
+def _paused_gc() -> Iterator[None]:
+    # Creating many tuples would repeatedly trigger the garbage collector,
+    # although they cannot form reference cycles.
+    gc_enabled = isenabled()
+    disable()
+    try:
+        yield
+    finally:
+        if gc_enabled:
+            enable()
+
+
+class _DictionaryColumn(NamedTuple):
+    # Distinct values and the code of each row's value.
+    values: list
+    codes: array
+    # Type to copy mutable values with for each row (list or set).
+    copy: Optional[type]
+
+
+# Mutable values are copied from immutable dictionary values.
+_IMMUTABLE = {list: tuple, set: frozenset}
+
+
+def _encode_column(column: Sequence) -> Any:
+    # Encode repeated values only once, like the lookup tables of the
+    # decoders do.
+    types = set(map(type, column))
+    copy: Optional[type] = None
+    if len(types) == 1 and types <= _IMMUTABLE.keys():
+        copy, = types
+        column = list(map(_IMMUTABLE[copy], column))
+    # Key mixed numbers by type, too, as e.g. 0 == 0.0 == False.
+    typed = sum(issubclass(type_, (int, float)) for type_ in types) > 1
+    keys = list(zip(map(type, column), column)) if typed else column
+    try:
+        distinct_keys = list(dict.fromkeys(keys))
+    except TypeError:
+        # Unhashable values.
+        return column
+    if copy is None and len(distinct_keys) > len(column) // 2:
+        return column
+    codes = {key: code for code, key in enumerate(distinct_keys)}
+    return _DictionaryColumn(
+        [value for _, value in distinct_keys] if typed else distinct_keys,
+        array("I", map(codes.__getitem__, keys)),
+        copy,
+    )
+
+
+def _decode_column(column: Any) -> Iterable:
+    if not isinstance(column, _DictionaryColumn):
+        return column
+    values = map(column.values.__getitem__, column.codes)
+    if column.copy is None:
+        return values
+    return map(column.copy, values)
+
+
+def _to_columns(records: Sequence[tuple]) -> Tuple[list[type], list]:
+    # Transpose records (tuples of NamedTuples) to the columns of the
+    # NamedTuples' fields.
+    if len(records) == 0:
+        return [], []
+    types = [type(part) for part in records[0]]
+    with _paused_gc():
+        columns = zip(*(
+            chain.from_iterable(record)
+            for record in records
+        ))
+        return types, [_encode_column(column) for column in columns]
+
+
+def _from_columns(types: list[type], columns: list) -> list[tuple]:
+    parts = []
+    start = 0
+    for part_type in types:
+        end = start + len(part_type._fields)
+        parts.append(map(
+            tuple.__new__,
+            repeat(part_type),
+            zip(*map(_decode_column, columns[start:end])),
+        ))
+        start = end
+    with _paused_gc():
+        return list(zip(*parts))
+
+
+class TableCache:
+    def __init__(self, max_bytes: int, cache_dir: Path = TABLES_DIR):
+        self._max_bytes = max_bytes
+        self._cache_dir = cache_dir
+
+    def _entry_path(self, parser: Any, path: Path) -> Path:
+        parser_type = type(parser)
+        return self._cache_dir / (
+            f"{parser_type.__name__}-"
+            f"{parser_version(parser_type)[:16]}-"
+            f"{cached_file_digest(path)[:32]}.pickle"
+        )
+
+    def evict(self) -> None:
+        # Keep the most recently used entries that fit into the cache.
+        entries = []
+        for entry_path in self._cache_dir.glob("*.pickle"):
+            try:
+                entries.append((entry_path, entry_path.stat()))
+            except FileNotFoundError:
+                # Evicted concurrently.
+                continue
+        entries.sort(key=lambda entry: entry[1].st_mtime_ns, reverse=True)
+        total_bytes = 0
+        for entry_path, stat in entries:
+            total_bytes += stat.st_size
+            if total_bytes > self._max_bytes:
+                entry_path.unlink(missing_ok=True)
+
+    def parse(self, parser: Any, path: Path, progress: tqdm) -> Iterable:
+        entry_path = self._entry_path(parser, path)
+        try:
+            with entry_path.open("rb") as file:
+                records = _from_columns(*load(file))
+            # Mark the entry as recently used.
+            utime(entry_path)
+            progress.update(path.stat().st_size)
+            return records
+        except FileNotFoundError:
+            pass
+        except (EOFError, UnpicklingError, ValueError):
+            # Truncated or corrupted entry, e.g., if the disk was full.
+            entry_path.unlink(missing_ok=True)
+        records = list(parser._parse_file(path, progress))
+        self._cache_dir.mkdir(exist_ok=True)
+        temporary_path = entry_path.with_name(f"{entry_path.name}.tmp")
+        with temporary_path.open("wb") as file:
+            dump(_to_columns(records), file, protocol=HIGHEST_PROTOCOL)
+        temporary_path.replace(entry_path)
+        self.evict()
+        return records
@@ -0,0 +1,149 @@
+from collections import Counter
+from json import dump
+from pathlib import Path
+from typing import Iterable, NamedTuple, Optional, Tuple, Collection
+
+from tqdm.auto import tqdm
+
+from model import Accident, Severity, Sex, TravelReason
+from parse import Formatter
+from parse.compress import open_text_output, check_compressions
+from parse.util import tile_position
+
+# Quadtree of spatial tiles for the stick figures visualization
+# (see src/Visualization2.elm). At zoom level z, longitudes and latitudes
+# are divided into 2^z columns and rows (rows counted from the north),
+# so that any grid can be approximated by reading the tiles of the
+# closest zoom level.
+
+
+class _Profile(NamedTuple):
+    # Features of a person's stick figure.
+    severity: Severity
+    sex: Sex
+    birth_year: Optional[int]
+    travel_reason: Optional[TravelReason]
+    safety_equipment_count: int
+    vehicle_persons_count: int
+
+
+class _Tile:
+    def __init__(self):
+        self.accidents = 0
+        self.latitude_sum = 0.0
+        self.longitude_sum = 0.0
+        self.profiles: Counter[_Profile] = Counter()
+
+    def merge(self, other: "_Tile") -> None:
+        self.accidents += other.accidents
+        self.latitude_sum += other.latitude_sum
+        self.longitude_sum += other.longitude_sum
+        self.profiles.update(other.profiles)
+
+    def to_json(self, x: int, y: int) -> dict:
+        return {
+            "x": x,
+            "y": y,
+            "accidents": self.accidents,
+            "persons": sum(self.profiles.values()),
+            # Mean coordinates of the accidents in the tile.
+            "latitude": self.latitude_sum / self.accidents,
+            "longitude": self.longitude_sum / self.accidents,
+            # Distinct stick figures and how many persons they represent.
+            "profiles": [
+                [
+                    profile.severity.name,
+                    profile.sex.name,
+                    profile.birth_year,
+                    (
+                        profile.travel_reason.name
+                        if profile.travel_reason is not None else None
+                    ),
+                    profile.safety_equipment_count,
+                    profile.vehicle_persons_count,
+                    count,
+                ]
+                for profile, count in sorted(
+                    self.profiles.items(),
+                    key=lambda item: (-item[1], str(item[0])),
+                )
+            ],
+        }
+
+
+def _profiles(accident: Accident) -> Iterable[_Profile]:
+    for vehicle in accident.vehicles:
+        for person in vehicle.persons:
+            yield _Profile(
+                severity=person.severity,
+                sex=person.sex,
+                birth_year=person.birth_year,
+                travel_reason=person.travel_reason,
+                safety_equipment_count=len(person.safety_equipment),
+                vehicle_persons_count=len(vehicle.persons),
+            )
+
+
+class TilesFormatter(Formatter[Accident]):
+    def __init__(
+            self,
+            max_zoom: int = 10,
+            compressions: Collection[str] = (),
+    ):
+        self._max_zoom = max_zoom
+        check_compressions(compressions)
+        self._compressions = compressions
+
+    def format(
+            self,
+            items: Iterable[Accident],
+            output_dir: Path
+    ) -> None:
+        items = tqdm(
+            items,
+            desc="Aggregating tiles",
+            unit="accident",
+        )
+        # Aggregate accidents into the tiles of the highest zoom level.
+        tiles: dict[Tuple[int, int], _Tile] = {}
+        for accident in items:
+            if accident.latitude is None or accident.longitude is None:
+                continue
+            position = tile_position(
+                accident.latitude, accident.longitude, self._max_zoom
+            )
+            tile = tiles.get(position)
+            if tile is None:
+                tile = tiles[position] = _Tile()
+            tile.accidents += 1
+            tile.latitude_sum += accident.latitude
+            tile.longitude_sum += accident.longitude
+            tile.profiles.update(_profiles(accident))
+
+        tiles_dir = output_dir / "tiles"
+        tiles_dir.mkdir(exist_ok=True)
+        for zoom in range(self._max_zoom, -1, -1):
+            with open_text_output(
+                    tiles_dir / f"{zoom}.json", self._compressions
+            ) as file:
+                dump(
+                    {
+                        "zoom": zoom,
+                        "tiles": [
+                            tile.to_json(x, y)
+                            for (x, y), tile in sorted(tiles.items())
+                        ],
+                    },
+                    file,
+                    separators=(",", ":"),
+                )
+            # Merge each 4 tiles into their parent tile.
+            parent_tiles: dict[Tuple[int, int], _Tile] = {}
+            for (x, y), tile in tiles.items():
+                parent_position = (x >> 1, y >> 1)
+                parent_tile = parent_tiles.get(parent_position)
+                if parent_tile is None:
+                    parent_tiles[parent_position] = tile
+                else:
+                    parent_tile.merge(tile)
+            tiles = parent_tiles
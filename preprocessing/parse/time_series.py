@@ -0,0 +1,130 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from json import dump
+from pathlib import Path
+from typing import Iterable, Callable, Collection
+
+from tqdm.auto import tqdm
+
+from model import Accident, Severity
+from parse import Formatter
+from parse.compress import open_text_output, check_compressions
+
+# Counts per time bucket for the severity time series visualization
+# (see src/Visualization1.elm), so that the frontend does not need to
+# bucket the raw accidents whenever a control changes.
+
+# Counted persons, same as the dimensions of the visualization.
+DIMENSIONS = (
+    "unharmed",
+    "injured",
+    "killed",
+    "killed_or_injured",
+    "persons",
+)
+
+# Truncate a date to the start of its week, month, quarter, or year
+# like the retain* functions in src/TimeUtils.elm.
+AGGREGATES: dict[str, Callable[[date], date]] = {
+    "week": lambda day: day - timedelta(days=day.weekday()),
+    "month": lambda day: day.replace(day=1),
+    "quarter": lambda day: date(day.year, (day.month - 1) // 3 * 3 + 1, 1),
+    "year": lambda day: date(day.year, 1, 1),
+}
+
+GROUPS = ("never", "year")
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_LEAP_YEAR = 2000
+_MILLIS_PER_DAY = 24 * 60 * 60 * 1000
+
+
+def epoch_millis(day: date) -> int:
+    # Milliseconds since the epoch (UTC), like Elm's Posix.
+    return (day.toordinal() - _EPOCH_ORDINAL) * _MILLIS_PER_DAY
+
+
+def epoch_millis_year_zero(day: date) -> int:
+    # Like removeYear in src/TimeUtils.elm, move the date to year 0
+    # (a leap year), which Python's dates cannot represent.
+    days_before_year_one = 366
+    ordinal = (
+        day.replace(year=_LEAP_YEAR).toordinal() -
+        date(_LEAP_YEAR, 1, 1).toordinal() +
+        date(1, 1, 1).toordinal() -
+        days_before_year_one
+    )
+    return (ordinal - _EPOCH_ORDINAL) * _MILLIS_PER_DAY
+
+
+def _counts(accident: Accident) -> list[int]:
+    unharmed = injured = killed = persons = 0
+    for vehicle in accident.vehicles:
+        for person in vehicle.persons:
+            persons += 1
+            if person.severity == Severity.UNHARMED:
+                unharmed += 1
+            elif person.severity == Severity.KILLED:
+                killed += 1
+            else:
+                injured += 1
+    return [unharmed, injured, killed, killed + injured, persons]
+
+
+class TimeSeriesFormatter(Formatter[Accident]):
+    def __init__(self, compressions: Collection[str] = ()):
+        check_compressions(compressions)
+        self._compressions = compressions
+
+    def format(
+            self,
+            items: Iterable[Accident],
+            output_dir: Path
+    ) -> None:
+        items = tqdm(
+            items,
+            desc="Aggregating time series",
+            unit="accident",
+        )
+        # Sum of counts per aggregate, group, and bucket timestamp.
+        buckets: dict[str, dict[str, dict[int, list[int]]]] = {
+            aggregate: {
+                group: defaultdict(lambda: [0] * len(DIMENSIONS))
+                for group in GROUPS
+            }
+            for aggregate in AGGREGATES.keys()
+        }
+        for accident in items:
+            counts = _counts(accident)
+            day = accident.timestamp.date()
+            for aggregate, truncate in AGGREGATES.items():
+                truncated_day = truncate(day)
+                for group, key in (
+                        ("never", epoch_millis(truncated_day)),
+                        ("year", epoch_millis_year_zero(truncated_day)),
+                ):
+                    bucket = buckets[aggregate][group][key]
+                    for index, count in enumerate(counts):
+                        bucket[index] += count
+
+        output_path = output_dir / "time-series.json"
+        with open_text_output(output_path, self._compressions) as file:
+            dump(
+                {
+                    "dimensions": DIMENSIONS,
+                    "aggregates": {
+                        aggregate: {
+                            group: [
+                                [timestamp, *bucket]
+                                for timestamp, bucket in sorted(
+                                    group_buckets.items()
+                                )
+                            ]
+                            for group, group_buckets in groups.items()
+                        }
+                        for aggregate, groups in buckets.items()
+                    },
+                },
+                file,
+                separators=(",", ":"),
+            )
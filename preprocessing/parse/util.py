@@ -1,10 +1,69 @@
+from collections import defaultdict
+from io import RawIOBase, BufferedReader, TextIOWrapper
 from pathlib import Path
-from typing import Iterable
+from typing import Optional, BinaryIO, Tuple
 
+from tqdm.auto import tqdm
 
-def count_lines(file_paths: Iterable[Path]) -> int:
-    num_lines = 0
-    for path in file_paths:
-        with path.open("r", encoding="latin-1") as file:
-            num_lines += sum(1 for _ in file)
-    return num_lines
+# Dictionaries of the distinct strings of each field, shared by all files
+# and parsers, such that repeated strings (e.g., departments or vehicle
+# names) are one object for all records.
+_STRING_DICTIONARIES: defaultdict[str, dict[str, str]] = defaultdict(dict)
+
+
+def string_dictionary(field: str) -> dict[str, str]:
+    return _STRING_DICTIONARIES[field]
+
+
+def file_year(path: Path) -> int:
+    return int(path.name.split("-")[-1].removesuffix(".csv"))
+
+
+def parse_vehicle_id(value: str) -> int:
+    # Vehicle IDs are grouped by non-breaking spaces.
+    return int(value.replace("\xa0", ""))
+
+
+def tile_position(
+        latitude: float,
+        longitude: float,
+        zoom: int,
+) -> Tuple[int, int]:
+    # Column and row of the spatial tile (see parse/tiles.py). At zoom
+    # level z, longitudes and latitudes are divided into 2^z columns and
+    # rows (rows counted from the north).
+    size = 1 << zoom
+    x = int((longitude + 180) / 360 * size)
+    y = int((90 - latitude) / 180 * size)
+    return min(max(x, 0), size - 1), min(max(y, 0), size - 1)
+
+
+class _ProgressReader(RawIOBase):
+    def __init__(self, file: BinaryIO, progress: tqdm):
+        self._file = file
+        self._progress = progress
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = self._file.readinto(buffer)
+        self._progress.update(size)
+        return size
+
+    def close(self) -> None:
+        self._file.close()
+        super().close()
+
+
+def open_text(
+        path: Path,
+        progress: tqdm,
+        encoding: Optional[str] = None,
+) -> TextIOWrapper:
+    # Open a text file like Path.open() does, but report the bytes read,
+    # so that progress can be tracked without counting lines beforehand.
+    return TextIOWrapper(
+        BufferedReader(_ProgressReader(path.open("rb"), progress)),
+        encoding=encoding,
+    )
@@ -1,4 +1,4 @@
-from csv import DictReader
+from datetime import MAXYEAR
 from pathlib import Path
 from typing import Iterable, Tuple
 
@@ -8,98 +8,62 @@ from model import (
     Vehicle, TrafficDirection, VehicleCategory, FixedObstacle,
     MobileObstacle, ShockPoint, Manoeuvre, Engine, VehicleId, AccidentId
 )
-from parse import Parser
-from parse.util import count_lines
+from parse import CsvParser
+from parse.schema import Schema, Layout, Column
+from parse.util import parse_vehicle_id
 
 
-class VehiclesCsvParser(Parser[Tuple[AccidentId, VehicleId, Vehicle]]):
+_COLUMNS = {
+    "accident_id": Column("Num_Acc", transform=int),
+    "vehicle_id": Column(),
+    "vehicle_name": Column("num_veh", intern=True),
+    "traffic_direction": Column(
+        "senc", nulls=("", "0", "-1"), enum=TrafficDirection
+    ),
+    "vehicle_category": Column(
+        "catv",
+        nulls=("0", "-1"),
+        values={"19": VehicleCategory(40)},
+        enum=VehicleCategory,
+    ),
+    "fixed_obstacle": Column(
+        "obs", nulls=("", "00", "0", "-1"), enum=FixedObstacle
+    ),
+    "mobile_obstacle": Column(
+        "obsm", nulls=("", "0", "-1"), enum=MobileObstacle
+    ),
+    "shock_point": Column("choc", nulls=("", "0", "-1"), enum=ShockPoint),
+    "primary_manoeuvre": Column(
+        "manv", nulls=("", "00", "0", "-1"), enum=Manoeuvre
+    ),
+    "engine": Column(),
+    "occupancy": Column("occutc", nulls=("",), transform=int, lookup=True),
+    # New list of persons for each vehicle.
+    "persons": Column(null=(), finish=list),
+}
+
+# Vehicle IDs and engines are only given since 2019.
+_COLUMNS_2019 = {
+    **_COLUMNS,
+    "vehicle_id": Column("id_vehicule", transform=parse_vehicle_id),
+    "engine": Column("motor", nulls=("0", "-1"), enum=Engine),
+}
+
+_SCHEMA: Schema[Tuple[AccidentId, VehicleId, Vehicle]] = Schema(
+    outputs=(AccidentId, VehicleId, Vehicle),
+    layouts=[
+        Layout(range(2019), ",", _COLUMNS),
+        Layout(range(2019, MAXYEAR + 1), ";", _COLUMNS_2019),
+    ],
+)
+
+
+class VehiclesCsvParser(CsvParser[Tuple[AccidentId, VehicleId, Vehicle]]):
+    description = "vehicles"
 
     @staticmethod
     def _parse_file(
             path: Path,
             progress: tqdm,
     ) -> Iterable[Tuple[AccidentId, VehicleId, Vehicle]]:
-        file_year = int(path.name.split("-")[-1].removesuffix(".csv"))
-        delimiter: str
-        if file_year >= 2019:
-            delimiter = ";"
-        else:
-            delimiter = ","
-        with path.open("r") as file:
-            reader = DictReader(file, delimiter=delimiter, quotechar='"')
-            for row in reader:
-                for key in row:
-                    row[key] = str(row[key]).strip()
-                if row["catv"] == "19":
-                    row["catv"] = "40"
-                yield (
-                    AccidentId(
-                        accident_id=int(row["Num_Acc"]),
-                    ),
-                    VehicleId(
-                        vehicle_id=(
-                            int(str(row["id_vehicule"]).replace(" ", ""))
-                            if "id_vehicule" in row else None
-                        ),
-                        vehicle_name=str(row["num_veh"]),
-                    ),
-                    Vehicle(
-                        vehicle_id=(
-                            int(str(row["id_vehicule"]).replace(" ", ""))
-                            if "id_vehicule" in row else None
-                        ),
-                        vehicle_name=str(row["num_veh"]),
-                        traffic_direction=(
-                            TrafficDirection(int(row["senc"]))
-                            if row["senc"] not in {"", "0", "-1"} else None
-                        ),
-                        vehicle_category=(
-                            VehicleCategory(int(row["catv"]))
-                            if row["catv"] not in {"0", "-1"} else None
-                        ),
-                        fixed_obstacle=(
-                            FixedObstacle(int(row["obs"]))
-                            if (
-                                    row["obs"] not in {"", "00", "0", "-1"}
-                            ) else None
-                        ),
-                        mobile_obstacle=(
-                            MobileObstacle(int(row["obsm"]))
-                            if row["obsm"] not in {"", "0", "-1"} else None
-                        ),
-                        shock_point=(
-                            ShockPoint(int(row["choc"]))
-                            if row["choc"] not in {"", "0", "-1"} else None
-                        ),
-                        primary_manoeuvre=(
-                            Manoeuvre(int(row["manv"]))
-                            if (
-                                    row["manv"] not in {"", "00", "0", "-1"}
-                            ) else None
-                        ),
-                        engine=(
-                            Engine(int(row["motor"]))
-                            if (
-                                    "motor" in row and
-                                    row["motor"] not in {"0", "-1"}
-                            ) else None
-                        ),
-                        occupancy=(
-                            int(row["occutc"])
-                            if row["occutc"] != "" else None
-                        ),
-                        persons=[],
-                    )
-                )
-                progress.update(1)
-
-    def parse(
-            self, input_paths: list[Path]
-    ) -> Iterable[Tuple[AccidentId, VehicleId, Vehicle]]:
-        progress = tqdm(
-            desc="Parsing vehicles",
-            total=count_lines(input_paths) - len(input_paths),
-            unit="line",
-        )
-        for path in input_paths:
-            yield from self._parse_file(path, progress)
+        return _SCHEMA.decode(path, progress)
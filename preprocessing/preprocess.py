@@ -1,13 +1,33 @@
+from argparse import ArgumentParser, Namespace
 from collections import defaultdict
+from contextlib import contextmanager
+from itertools import groupby
+from os import cpu_count
 from pathlib import Path
+from typing import Optional, Iterable, Iterator, Tuple, Type, Sequence, Any
 
-from cache import cache_artifacts, DATA_DIR
-from model import Accident, Vehicle, Person, Location, AccidentId, VehicleId, \
-    VehicleCategory, Characteristic
-from parse.accident import AccidentsJsonlFormatter
+from cache import cache_artifacts, DATA_DIR, CACHE_DIR
+from incremental import IncrementalBuild, SUPPORTED_FORMATS, YEARS_DIR
+from instrument import instrument, instrumented_run
+from join import join_in_memory, join_streaming, join_sqlite, accident_year
+from model import Accident
+from parse import CsvParser, Formatter, MultiFormatter
+from parse.accident import (
+    AccidentsJsonlFormatter, AccidentsShardedJsonlFormatter, JSON_BACKENDS
+)
 from parse.characteristics import CharacteristicsCsvParser
+from parse.compress import COMPRESSIONS, compress_file
+from parse.index import JsonlIndex, index_path
 from parse.locations import LocationsCsvParser
+from parse.parallel import parse_parallel
+from parse.parquet import AccidentsParquetFormatter
+from parse.partitions import PartitionsFormatter
 from parse.person import PersonsCsvParser
+from parse.sample import write_samples
+from parse.sqlite import AccidentsSqliteFormatter
+from parse.table_cache import TableCache
+from parse.tiles import TilesFormatter
+from parse.time_series import TimeSeriesFormatter
 from parse.vehicle import VehiclesCsvParser
 
 
@@ -20,88 +40,403 @@ def _matches_file(file: Path, prefix: str) -> bool:
     return stem.isnumeric()
 
 
+def _file_year(file: Path) -> int:
+    return int(file.stem.split("-")[-1])
+
+
 def _matching_files(files: list[Path], prefix: str) -> list[Path]:
-    return [
-        file
-        for file in files
-        if _matches_file(file, prefix)
+    return sorted(
+        (
+            file
+            for file in files
+            if _matches_file(file, prefix)
+        ),
+        key=_file_year,
+    )
+
+
+# Parsers for characteristics, locations, vehicles, and persons.
+_PARSERS: Tuple[Type[CsvParser[Any]], ...] = (
+    CharacteristicsCsvParser,
+    LocationsCsvParser,
+    VehiclesCsvParser,
+    PersonsCsvParser,
+)
+
+_FORMATTERS: dict[str, Type[Formatter[Accident]]] = {
+    "jsonl": AccidentsJsonlFormatter,
+    "parquet": AccidentsParquetFormatter,
+    "partitions": PartitionsFormatter,
+    "shards": AccidentsShardedJsonlFormatter,
+    "sqlite": AccidentsSqliteFormatter,
+    "tiles": TilesFormatter,
+    "time-series": TimeSeriesFormatter,
+}
+
+
+def _formatter(
+        output_format: str,
+        json_backend: str,
+        shard_by_department: bool,
+        samples: Sequence[int],
+        sample_seed: int,
+        stratify_samples: bool,
+        compressions: Sequence[str],
+) -> Formatter[Accident]:
+    if output_format == "jsonl":
+        return AccidentsJsonlFormatter(
+            backend=json_backend,
+            samples=samples,
+            sample_seed=sample_seed,
+            stratify_samples=stratify_samples,
+            compressions=compressions,
+        )
+    elif output_format == "shards":
+        return AccidentsShardedJsonlFormatter(
+            by_department=shard_by_department,
+            backend=json_backend,
+            compressions=compressions,
+        )
+    elif output_format == "parquet":
+        # Parquet files are already compressed.
+        return AccidentsParquetFormatter()
+    elif output_format == "sqlite":
+        # SQLite databases are queried in place, so are not compressed.
+        return AccidentsSqliteFormatter()
+    return _FORMATTERS[output_format](compressions=compressions)
+
+
+@contextmanager
+def _parse(
+        input_paths: Sequence[list[Path]],
+        workers: int,
+        table_cache: Optional[TableCache],
+        bounded: bool = False,
+) -> Iterator[list[Iterable[Any]]]:
+    # Parse lazily, file by file. For joins with bounded memory, parallel
+    # workers parse only as many files of each table ahead of the join as
+    # there are workers.
+    jobs = [
+        (parser_type(table_cache), paths)
+        for parser_type, paths in zip(_PARSERS, input_paths)
     ]
+    if workers == 1:
+        yield [
+            parser.parse(paths)
+            for parser, paths in jobs
+        ]
+        return
+    max_workers = workers if workers > 0 else cpu_count() or 1
+    with parse_parallel(
+            jobs,
+            max_workers=max_workers,
+            prefetch=max_workers if bounded else None,
+    ) as parsed:
+        yield [
+            instrument(f"parse {parser.description} (parallel)", records)
+            for (parser, _), records in zip(jobs, parsed)
+        ]
 
 
-def main() -> None:
-    files: list[Path] = cache_artifacts()
-    characteristics = CharacteristicsCsvParser().parse(
-        _matching_files(files, "caracteristiques")
-    )
-    locations = LocationsCsvParser().parse(_matching_files(files, "lieux"))
-    vehicles = VehiclesCsvParser().parse(_matching_files(files, "vehicules"))
-    persons = PersonsCsvParser().parse(_matching_files(files, "usagers"))
-
-    accident_characteristics: dict[AccidentId, Characteristic] = {
-        accident_id: characteristic
-        for accident_id, characteristic in characteristics
-    }
-    accident_locations: dict[AccidentId, Location] = {
-        accident_id: location
-        for accident_id, location in locations
-    }
-    accident_vehicles: dict[AccidentId, dict[VehicleId, Vehicle]] = (
-        defaultdict(lambda: {})
-    )
-    for accident_id, vehicle_id, vehicle in vehicles:
-        accident_vehicles[accident_id][vehicle_id] = vehicle
-    accident_persons: dict[AccidentId, dict[VehicleId, list[Person]]] = (
-        defaultdict(lambda: defaultdict(lambda: []))
-    )
-    for accident_id, vehicle_id, person in persons:
-        accident_persons[accident_id][vehicle_id].append(person)
-
-    accident_ids_characteristics = set(accident_characteristics.keys())
-    accident_ids_locations = set(accident_locations.keys())
-    assert accident_ids_locations == accident_ids_characteristics
-    accident_ids_vehicles = set(accident_vehicles.keys())
-    assert accident_ids_vehicles.issubset(accident_characteristics)
-    accident_ids_persons = set(accident_persons.keys())
-    assert accident_ids_persons.issubset(accident_ids_vehicles)
-
-    for accident_id, persons_dict in accident_persons.items():
-        vehicles_dict = accident_vehicles[accident_id]
-        persons_vehicle_ids = set(persons_dict.keys())
-        vehicle_ids = set(vehicles_dict.keys())
-        if not persons_vehicle_ids.issubset(vehicle_ids):
-            for vehicle_id in persons_vehicle_ids - vehicle_ids:
-                # Create new vehicle entry.
-                accident_vehicles[accident_id][vehicle_id] = Vehicle(
-                    *vehicle_id,
-                    traffic_direction=None,
-                    vehicle_category=VehicleCategory.OTHER,
-                    fixed_obstacle=None,
-                    mobile_obstacle=None,
-                    shock_point=None,
-                    primary_manoeuvre=None,
-                    engine=None,
-                    occupancy=None,
-                    persons=[]
-                )
-
-    accidents = [
-        Accident(
-            *accident_id,
-            *accident_characteristics[accident_id],
-            *accident_locations[accident_id],
-            vehicles=[
-                vehicle._replace(
-                    persons=accident_persons[accident_id][vehicle_id]
-                )
-                for vehicle_id, vehicle in (
-                    accident_vehicles[accident_id].items()
-                )
-            ],
+def _build_incremental(
+        input_paths: Sequence[list[Path]],
+        workers: int,
+        table_cache: Optional[TableCache],
+        formats: Sequence[str],
+        json_backend: str,
+        output_dir: Path,
+        years_dir: Path,
+) -> list[int]:
+    # Rebuild the outdated years and splice all years' outputs into the
+    # output directory. Returns the rebuilt years.
+    inputs: dict[int, list[Path]] = defaultdict(list)
+    for paths in input_paths:
+        for path in paths:
+            inputs[_file_year(path)].append(path)
+    build = IncrementalBuild(
+        inputs,
+        formats,
+        _PARSERS,
+        options={"json_backend": json_backend},
+        years_dir=years_dir,
+    )
+    # Sample and compress only once after splicing.
+    formatter = MultiFormatter([
+        _formatter(
+            output_format,
+            json_backend=json_backend,
+            shard_by_department=False,
+            samples=(),
+            sample_seed=0,
+            stratify_samples=False,
+            compressions=(),
         )
-        for accident_id in accident_ids_characteristics
+        for output_format in formats
+    ])
+    outdated_years = build.outdated_years()
+    print(f"Rebuilding {len(outdated_years)} of {len(inputs)} years.")
+    if len(outdated_years) > 0:
+        with _parse(
+                [
+                    [
+                        path
+                        for path in paths
+                        if _file_year(path) in outdated_years
+                    ]
+                    for paths in input_paths
+                ],
+                workers,
+                table_cache,
+                bounded=True,
+        ) as parsed:
+            accidents = instrument(
+                "join (streaming)", join_streaming(*parsed)
+            )
+            remaining_years = set(outdated_years)
+            for year, year_accidents in groupby(
+                    accidents,
+                    key=lambda accident: accident_year(accident.accident_id),
+            ):
+                remaining_years.remove(year)
+                formatter.format(year_accidents, build.prepare(year))
+                build.complete(year)
+        # Years without any accidents still get (empty) outputs.
+        for year in sorted(remaining_years):
+            formatter.format([], build.prepare(year))
+            build.complete(year)
+    build.splice(output_dir)
+    return outdated_years
+
+
+def main(
+        workers: int = 1,
+        join: str = "memory",
+        formats: Sequence[str] = ("jsonl",),
+        incremental: bool = False,
+        downloads: int = 4,
+        verify_downloads: bool = False,
+        json_backend: str = "json",
+        shard_by_department: bool = False,
+        samples: Sequence[int] = (),
+        sample_seed: int = 0,
+        stratify_samples: bool = False,
+        compressions: Sequence[str] = (),
+        table_cache_size: int = 1024,
+        join_memory: int = 256,
+) -> None:
+    if join == "sqlite" and workers != 1 and not incremental:
+        # Each worker holds a whole file's records, which would break the
+        # SQLite join's memory bound.
+        raise ValueError("The SQLite join cannot parse with multiple workers.")
+    files: list[Path] = cache_artifacts(
+        max_workers=downloads,
+        verify=verify_downloads,
+    )
+    table_cache: Optional[TableCache] = None
+    if table_cache_size > 0:
+        table_cache = TableCache(max_bytes=table_cache_size << 20)
+        # Apply a lowered size limit right away.
+        table_cache.evict()
+    input_paths = [
+        _matching_files(files, "caracteristiques"),
+        _matching_files(files, "lieux"),
+        _matching_files(files, "vehicules"),
+        _matching_files(files, "usagers"),
     ]
-    AccidentsJsonlFormatter().format(accidents, DATA_DIR)
+    if "jsonl" not in formats and len(samples) > 0:
+        raise ValueError("Samples can only be written with the jsonl format.")
+    if incremental:
+        unsupported_formats = set(formats) - SUPPORTED_FORMATS
+        if len(unsupported_formats) > 0:
+            raise ValueError(
+                f"Cannot build formats incrementally: {unsupported_formats}"
+            )
+        _build_incremental(
+            input_paths,
+            workers,
+            table_cache,
+            formats,
+            json_backend,
+            DATA_DIR,
+            YEARS_DIR,
+        )
+        jsonl_path = DATA_DIR / "accidents.jsonl"
+        if "jsonl" in formats:
+            compress_file(jsonl_path, compressions)
+        if len(samples) > 0:
+            write_samples(
+                jsonl_path,
+                JsonlIndex.read(index_path(jsonl_path)),
+                samples,
+                sample_seed,
+                stratify_samples,
+                compressions,
+            )
+        return
+
+    formatter = MultiFormatter([
+        _formatter(
+            output_format,
+            json_backend,
+            shard_by_department,
+            samples,
+            sample_seed,
+            stratify_samples,
+            compressions,
+        )
+        for output_format in formats
+    ])
+    with _parse(
+            input_paths,
+            workers,
+            table_cache,
+            bounded=join != "memory",
+    ) as (characteristics, locations, vehicles, persons):
+        accidents: Iterable[Accident]
+        if join == "streaming":
+            accidents = join_streaming(
+                characteristics, locations, vehicles, persons
+            )
+        elif join == "sqlite":
+            accidents = join_sqlite(
+                characteristics, locations, vehicles, persons,
+                memory_budget=join_memory << 20,
+                directory=CACHE_DIR,
+            )
+        else:
+            accidents = join_in_memory(
+                characteristics, locations, vehicles, persons
+            )
+        formatter.format(instrument(f"join ({join})", accidents), DATA_DIR)
+
+
+def _parse_args(args: Optional[list[str]] = None) -> Namespace:
+    parser = ArgumentParser(
+        description="Preprocess the French road accidents dataset."
+    )
+    parser.add_argument(
+        "--downloads",
+        type=int,
+        default=4,
+        help="Number of concurrent downloads. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--verify-downloads",
+        action="store_true",
+        help="Hash all cached downloads again to detect corrupted files. "
+             "By default, only files whose size or modification time "
+             "changed are hashed again.",
+    )
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes to parse the CSV files with. "
+             "Use 0 for one worker per CPU core. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-j", "--join",
+        choices=["memory", "streaming", "sqlite"],
+        default="memory",
+        help="Join the parsed records in memory, stream them "
+             "year by year to bound memory usage to a single year, or "
+             "stage them in an on-disk SQLite database to bound memory "
+             "usage regardless of the number of years (in accident ID "
+             "order). (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--join-memory",
+        type=int,
+        default=256,
+        help="Memory budget in MiB of the SQLite join's page cache. "
+             "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "-f", "--format",
+        dest="formats",
+        nargs="+",
+        choices=sorted(_FORMATTERS.keys()),
+        default=["jsonl"],
+        help="Output formats to write. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--json-backend",
+        choices=JSON_BACKENDS,
+        default="json",
+        help="JSON library to write the JSONL file with. The orjson backend "
+             "is faster, but writes compact JSON. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--shard-by-department",
+        action="store_true",
+        help="Write one shard per year and department instead of one "
+             "shard per year with the shards format.",
+    )
+    parser.add_argument(
+        "-s", "--samples",
+        type=int,
+        nargs="+",
+        default=[],
+        help="Sizes of nested random samples of the JSONL file to write, "
+             "e.g., 1000 10000 100000.",
+    )
+    parser.add_argument(
+        "--sample-seed",
+        type=int,
+        default=0,
+        help="Seed for the samples. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--stratify-samples",
+        action="store_true",
+        help="Sample the same share of accidents from each year.",
+    )
+    parser.add_argument(
+        "-c", "--compress",
+        dest="compressions",
+        nargs="+",
+        choices=sorted(COMPRESSIONS.keys()),
+        default=[],
+        help="Also write compressed variants of the outputs (except "
+             "Parquet), with their integrity hashes. Brotli and Zstandard "
+             "require the brotli and zstandard packages.",
+    )
+    parser.add_argument(
+        "-i", "--incremental",
+        action="store_true",
+        help="Only rebuild the years whose CSV files changed since the "
+             "last incremental run and splice them into the outputs. "
+             "Always joins year by year.",
+    )
+    parser.add_argument(
+        "--table-cache-size",
+        type=int,
+        default=1024,
+        help="Maximum size in MiB of the cache of parsed CSV files. "
+             "Warm runs load parsed files from the cache instead of "
+             "parsing them again. Use 0 to disable. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--report",
+        dest="report_path",
+        type=Path,
+        help="Write a JSON report of the time, throughput, and memory "
+             "usage of each stage (download, parse, join, format) to "
+             "this file.",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Also trace the peak Python memory of each stage in the "
+             "report. Slows down preprocessing.",
+    )
+    return parser.parse_args(args)
 
 
 if __name__ == "__main__":
-    main()
+    _arguments = vars(_parse_args())
+    with instrumented_run(
+            _arguments.pop("report_path"),
+            _arguments.pop("trace_memory"),
+    ):
+        main(**_arguments)
@@ -0,0 +1,480 @@
+from argparse import ArgumentParser, Namespace
+from array import array
+from asyncio import (
+    StreamReader, StreamWriter, get_running_loop, run, start_server
+)
+from datetime import date, datetime
+from functools import lru_cache
+from gzip import compress
+from json import dumps, loads
+from logging import getLogger
+from math import nan
+from pathlib import Path
+from typing import Any, Callable, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from numpy import (
+    ndarray, arange, argsort, bincount, clip, floor, frombuffer, int8,
+    int32, int64, float64, isnan, searchsorted, unique
+)
+from tqdm.auto import tqdm
+
+from cache import DATA_DIR
+from model import Severity
+from parse.index import epoch_seconds
+from parse.partitions import DIMENSIONS as PARTITION_DIMENSIONS, roll_up
+from parse.time_series import (
+    AGGREGATES, GROUPS, DIMENSIONS, epoch_millis, epoch_millis_year_zero
+)
+
+# Local HTTP server that answers aggregate queries over the preprocessed
+# accidents, so that the frontend neither downloads nor aggregates the
+# raw accidents: time series buckets (like time-series.json), spatial
+# grid cells (like tiles/<zoom>.json), and partition trees (like the
+# roll-ups of partitions.json), each filtered by a time range and bounds.
+# The accidents are loaded once into columns sorted by timestamp, such
+# that time ranges are found by binary search and bounds are filtered
+# vectorized. Responses are cached and gzipped if the client accepts it.
+
+_MAX_ZOOM = 20
+
+_logger = getLogger(__name__)
+
+_UNHARMED, _INJURED, _KILLED, _KILLED_OR_INJURED, _PERSONS = (
+    DIMENSIONS.index(dimension)
+    for dimension in (
+        "unharmed", "injured", "killed", "killed_or_injured", "persons"
+    )
+)
+
+
+def _counts(accident: dict) -> list[int]:
+    # Same counts as for the time series, from an accident's JSON.
+    counts = [0] * len(DIMENSIONS)
+    for vehicle in accident["vehicles"]:
+        for person in vehicle["persons"]:
+            counts[_PERSONS] += 1
+            if person["severity"] == Severity.UNHARMED.name:
+                counts[_UNHARMED] += 1
+            elif person["severity"] == Severity.KILLED.name:
+                counts[_KILLED] += 1
+            else:
+                counts[_INJURED] += 1
+    counts[_KILLED_OR_INJURED] = counts[_KILLED] + counts[_INJURED]
+    return counts
+
+
+class AccidentsIndex:
+    def __init__(self, path: Path):
+        # Partition codes are the members' indices (-1 for None),
+        # like in partitions.json.
+        partition_codes = [
+            {member.name: code for code, member in enumerate(enum)}
+            for enum in PARTITION_DIMENSIONS.values()
+        ]
+        seconds = array("q")
+        days = array("i")
+        latitudes = array("d")
+        longitudes = array("d")
+        counts = array("i")
+        codes = array("b")
+        with path.open("rb") as file:
+            for line in tqdm(file, desc="Loading accidents", unit="accident"):
+                accident = loads(line)
+                timestamp = datetime.fromisoformat(accident["timestamp"])
+                seconds.append(epoch_seconds(timestamp))
+                days.append(timestamp.toordinal())
+                latitude = accident["latitude"]
+                longitude = accident["longitude"]
+                latitudes.append(nan if latitude is None else latitude)
+                longitudes.append(nan if longitude is None else longitude)
+                counts.extend(_counts(accident))
+                codes.extend(
+                    dimension_codes.get(accident[name], -1)
+                    for name, dimension_codes in zip(
+                        PARTITION_DIMENSIONS.keys(), partition_codes
+                    )
+                )
+
+        order = argsort(frombuffer(seconds, dtype=int64), kind="stable")
+        self._seconds: ndarray = frombuffer(seconds, dtype=int64)[order]
+        self._latitudes: ndarray = frombuffer(latitudes, dtype=float64)[order]
+        self._longitudes: ndarray = (
+            frombuffer(longitudes, dtype=float64)[order]
+        )
+        self._counts: ndarray = frombuffer(counts, dtype=int32).reshape(
+            -1, len(DIMENSIONS)
+        )[order]
+        self._codes: ndarray = frombuffer(codes, dtype=int8).reshape(
+            -1, len(PARTITION_DIMENSIONS)
+        )[order]
+        # Distinct days, and each accident's index into them, so that
+        # time buckets are computed once per day.
+        self._days, self._day_indices = unique(
+            frombuffer(days, dtype=int32)[order], return_inverse=True
+        )
+        self._bucket_keys: dict[Tuple[str, str], ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self._seconds)
+
+    def select(
+            self,
+            start: Optional[datetime] = None,
+            end: Optional[datetime] = None,
+            bounds: Optional[Tuple[float, float, float, float]] = None,
+    ) -> ndarray:
+        # Positions of the accidents with start <= timestamp < end, within
+        # the bounds (south, west, north, east), if given.
+        first = (
+            0 if start is None else
+            searchsorted(self._seconds, epoch_seconds(start), side="left")
+        )
+        last = (
+            len(self) if end is None else
+            searchsorted(self._seconds, epoch_seconds(end), side="left")
+        )
+        positions = arange(first, max(first, last))
+        if bounds is not None:
+            south, west, north, east = bounds
+            latitudes = self._latitudes[first:last]
+            longitudes = self._longitudes[first:last]
+            # Comparisons with NaN (i.e., no coordinates) are false.
+            positions = positions[
+                (latitudes >= south) & (latitudes <= north) &
+                (longitudes >= west) & (longitudes <= east)
+            ]
+        return positions
+
+    def _day_bucket_keys(self, aggregate: str, group: str) -> ndarray:
+        # Bucket timestamp of each distinct day.
+        keys = self._bucket_keys.get((aggregate, group))
+        if keys is None:
+            truncate = AGGREGATES[aggregate]
+            millis = (
+                epoch_millis if group == "never" else epoch_millis_year_zero
+            )
+            keys = self._bucket_keys[(aggregate, group)] = frombuffer(
+                array("q", (
+                    millis(truncate(date.fromordinal(day)))
+                    for day in self._days.tolist()
+                )),
+                dtype=int64,
+            )
+        return keys
+
+    def time_series(
+            self,
+            positions: ndarray,
+            aggregate: str,
+            group: str,
+    ) -> dict:
+        keys, bucket_indices = unique(
+            self._day_bucket_keys(aggregate, group)[
+                self._day_indices[positions]
+            ],
+            return_inverse=True,
+        )
+        counts = self._counts[positions]
+        sums = [
+            bincount(bucket_indices, counts[:, index], len(keys))
+            for index in range(len(DIMENSIONS))
+        ]
+        return {
+            "dimensions": DIMENSIONS,
+            "buckets": [
+                [key, *map(int, bucket)]
+                for key, *bucket in zip(keys.tolist(), *sums)
+            ],
+        }
+
+    def grid(self, positions: ndarray, zoom: int) -> dict:
+        # Same tiles as in tiles/<zoom>.json.
+        latitudes = self._latitudes[positions]
+        longitudes = self._longitudes[positions]
+        located = ~isnan(latitudes) & ~isnan(longitudes)
+        latitudes = latitudes[located]
+        longitudes = longitudes[located]
+        size = 1 << zoom
+        xs = clip(
+            floor((longitudes + 180) / 360 * size).astype(int64), 0, size - 1
+        )
+        ys = clip(
+            floor((90 - latitudes) / 180 * size).astype(int64), 0, size - 1
+        )
+        cells, cell_indices, accidents = unique(
+            xs * size + ys, return_inverse=True, return_counts=True
+        )
+        latitude_sums = bincount(cell_indices, latitudes, len(cells))
+        longitude_sums = bincount(cell_indices, longitudes, len(cells))
+        counts = self._counts[positions[located]]
+        sums = [
+            bincount(cell_indices, counts[:, index], len(cells))
+            for index in range(len(DIMENSIONS))
+        ]
+        return {
+            "zoom": zoom,
+            "dimensions": DIMENSIONS,
+            "tiles": [
+                {
+                    "x": cell // size,
+                    "y": cell % size,
+                    "accidents": cell_accidents,
+                    # Mean coordinates of the accidents in the tile.
+                    "latitude": latitude_sum / cell_accidents,
+                    "longitude": longitude_sum / cell_accidents,
+                    "counts": list(map(int, cell_counts)),
+                }
+                for (
+                    cell, cell_accidents, latitude_sum, longitude_sum,
+                    *cell_counts,
+                ) in zip(
+                    cells.tolist(), accidents.tolist(),
+                    latitude_sums.tolist(), longitude_sums.tolist(), *sums,
+                )
+            ],
+        }
+
+    def partitions(self, positions: ndarray, path: Sequence[str]) -> dict:
+        cells, counts = unique(
+            self._codes[positions], axis=0, return_counts=True
+        )
+        cube = {
+            "dimensions": list(PARTITION_DIMENSIONS.keys()),
+            "values": {
+                name: [member.name for member in enum]
+                for name, enum in PARTITION_DIMENSIONS.items()
+            },
+            "cells": [
+                [*cell, count]
+                for cell, count in zip(cells.tolist(), counts.tolist())
+            ],
+        }
+        return roll_up(cube, path)
+
+
+def _datetime(value: Optional[str]) -> Optional[datetime]:
+    if value is None:
+        return None
+    timestamp = datetime.fromisoformat(value)
+    # Accidents have local times, without time zone.
+    if timestamp.tzinfo is not None:
+        raise ValueError(f"Time {value} must not have a time zone.")
+    return timestamp
+
+
+def _bounds(
+        value: Optional[str]
+) -> Optional[Tuple[float, float, float, float]]:
+    if value is None:
+        return None
+    south, west, north, east = map(float, value.split(","))
+    return south, west, north, east
+
+
+def _choice(value: Optional[str], choices: Sequence[str]) -> str:
+    if value is None:
+        return choices[0]
+    if value not in choices:
+        raise ValueError(f"Unknown value {value}, expected one of {choices}.")
+    return value
+
+
+class AggregateServer:
+    def __init__(self, index: AccidentsIndex, cache_size: int = 256):
+        self._index = index
+        self._routes: dict[str, Callable[[dict[str, str]], Any]] = {
+            "/time-series": self._time_series,
+            "/grid": self._grid,
+            "/partitions": self._partitions,
+        }
+        # Cache the (compressed) responses of the most recent queries.
+        self._response: Callable[
+            [str, Tuple[Tuple[str, str], ...], bool], Tuple[int, bytes]
+        ] = lru_cache(maxsize=cache_size)(self._uncached_response)
+
+    def _select(self, parameters: dict[str, str]) -> ndarray:
+        return self._index.select(
+            start=_datetime(parameters.get("start")),
+            end=_datetime(parameters.get("end")),
+            bounds=_bounds(parameters.get("bounds")),
+        )
+
+    def _time_series(self, parameters: dict[str, str]) -> dict:
+        return self._index.time_series(
+            self._select(parameters),
+            aggregate=_choice(
+                parameters.get("aggregate"), list(AGGREGATES.keys())
+            ),
+            group=_choice(parameters.get("group"), GROUPS),
+        )
+
+    def _grid(self, parameters: dict[str, str]) -> dict:
+        zoom = int(parameters.get("zoom", "10"))
+        if not 0 <= zoom <= _MAX_ZOOM:
+            raise ValueError(f"Zoom must be between 0 and {_MAX_ZOOM}.")
+        return self._index.grid(self._select(parameters), zoom)
+
+    def _partitions(self, parameters: dict[str, str]) -> dict:
+        path = parameters.get("path", "")
+        dimensions = path.split(",") if path != "" else []
+        for dimension in dimensions:
+            _choice(dimension, list(PARTITION_DIMENSIONS.keys()))
+        return self._index.partitions(self._select(parameters), dimensions)
+
+    def _uncached_response(
+            self,
+            path: str,
+            query: Tuple[Tuple[str, str], ...],
+            gzip: bool,
+    ) -> Tuple[int, bytes]:
+        route = self._routes.get(path)
+        if route is None:
+            status, result = 404, {"error": f"Unknown path {path}."}
+        else:
+            try:
+                status, result = 200, route(dict(query))
+            except ValueError as error:
+                status, result = 400, {"error": str(error)}
+        body = dumps(result, separators=(",", ":")).encode()
+        if gzip:
+            # Without modification time, so that responses are reproducible.
+            body = compress(body, compresslevel=6, mtime=0)
+        return status, body
+
+    async def _respond(
+            self,
+            method: str,
+            target: str,
+            headers: dict[str, str],
+    ) -> Tuple[int, bytes, bool]:
+        gzip = "gzip" in headers.get("accept-encoding", "")
+        if method == "":
+            return 400, b'{"error":"Malformed request."}', False
+        elif method != "GET":
+            return 405, b'{"error":"Only GET requests are supported."}', False
+        url = urlsplit(target)
+        # Normalize the query, such that equal queries share cache entries.
+        query = tuple(sorted(parse_qsl(url.query)))
+        # Aggregate in a worker thread, to keep serving other connections.
+        try:
+            status, body = await get_running_loop().run_in_executor(
+                None, self._response, url.path, query, gzip
+            )
+        except Exception:
+            # Not cached, so that the query is retried.
+            _logger.exception(f"Failed to respond to {target}.")
+            return 500, b'{"error":"Internal server error."}', False
+        return status, body, gzip
+
+    async def handle(self, reader: StreamReader, writer: StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if request_line == b"":
+                    break
+                headers: dict[str, str] = {}
+                while (line := await reader.readline()) not in (
+                        b"\r\n", b"\n", b""
+                ):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = (
+                        request_line.decode("latin-1").split()
+                    )
+                except ValueError:
+                    # Malformed request line.
+                    method, target, version = "", "", "HTTP/1.0"
+                status, body, gzip = await self._respond(
+                    method, target, headers
+                )
+                # Keep HTTP/1.1 connections open, unless asked otherwise.
+                keep_alive = (
+                    version == "HTTP/1.1" and method == "GET" and
+                    headers.get("connection", "").lower() != "close"
+                )
+                head = [
+                    f"HTTP/1.1 {status} {_REASONS[status]}",
+                    "Content-Type: application/json",
+                    f"Content-Length: {len(body)}",
+                    "Vary: Accept-Encoding",
+                    # Allow the frontend's development server to query.
+                    "Access-Control-Allow-Origin: *",
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}",
+                ]
+                if gzip:
+                    head.append("Content-Encoding: gzip")
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode())
+                writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+}
+
+
+async def _serve(server: AggregateServer, host: str, port: int) -> None:
+    async with await start_server(server.handle, host, port) as tcp_server:
+        print(f"Serving aggregates on http://{host}:{port}/")
+        await tcp_server.serve_forever()
+
+
+def main(
+        input_path: Path,
+        host: str,
+        port: int,
+        cache_size: int,
+) -> None:
+    server = AggregateServer(AccidentsIndex(input_path), cache_size)
+    try:
+        run(_serve(server, host, port))
+    except KeyboardInterrupt:
+        pass
+
+
+def _parse_args() -> Namespace:
+    parser = ArgumentParser(
+        description="Serve aggregates of the preprocessed accidents locally."
+    )
+    parser.add_argument(
+        "-i", "--input",
+        dest="input_path",
+        type=Path,
+        default=DATA_DIR / "accidents.jsonl",
+        help="JSONL file of the preprocessed accidents. "
+             "(default: %(default)s)",
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="Host to bind to. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-p", "--port",
+        type=int,
+        default=8001,
+        help="Port to bind to. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=256,
+        help="Number of responses to cache. (default: %(default)s)",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(**vars(_parse_args()))
@@ -0,0 +1,319 @@
+from argparse import ArgumentParser, Namespace
+from csv import writer, QUOTE_ALL
+from pathlib import Path
+from random import Random
+from typing import Optional, Sequence, Any
+
+# Generate synthetic yearly CSV files that look like the original
+# datasets, including their quirks, to test and benchmark preprocessing
+# offline:
+# - delimiters: "," before 2019, tab for the 2009 characteristics,
+#   and ";" since 2019,
+# - latin-1 encoded characteristics and locations,
+# - times as "hmm" before 2019 and "hh:mm" since 2019,
+# - coordinates as scaled integers before 2019 (or missing),
+#   and with decimal commas since 2019,
+# - swapped "pr" and "pr1" columns in some locations,
+# - vehicle IDs ("id_vehicule", with non-breaking spaces) and the engine
+#   ("motor") only since 2019,
+# - safety equipment as one "secu" code before 2019 and as "secu1",
+#   "secu2", "secu3" since 2019,
+# - persons referring to vehicles that are missing,
+# - values with surrounding white space.
+
+YEARS = range(2005, 2021)
+
+_ADDRESSES = (
+    "", "rue de la Paix", "Route de l'Église", "Boulevard Saint-Michel",
+    "Avenue des Champs-Élysées", "CD 12 ", "Chemin du Moulin", "N 7",
+)
+_DEPARTMENTS = ("75", "13", "69", "2A", "2B", "590", "330", "971")
+_COMMUNES = ("056", "117", "12", "001", "350")
+_ROADS = ("", "D 12", "A6", "N7", "RUE DE LA REPUBLIQUE")
+
+
+def _pad(value: Any, random: Random) -> Any:
+    # Some values are padded with white space.
+    if isinstance(value, str) and value and random.random() < 0.05:
+        return f" {value}"
+    return value
+
+
+class _YearGenerator:
+    def __init__(self, year: int, random: Random):
+        self._year = year
+        self._random = random
+        self._recent = year >= 2019
+
+    def _choice(
+            self,
+            *values: Any,
+            weights: Optional[Sequence[int]] = None,
+    ) -> Any:
+        value, = self._random.choices(values, weights=weights)
+        return value
+
+    def characteristics(self, accident_id: int) -> list[Any]:
+        minutes = self._random.randrange(24 * 60)
+        hour_minute = (
+            f"{minutes // 60:02d}:{minutes % 60:02d}"
+            if self._recent else
+            str(minutes // 60 * 100 + minutes % 60)
+        )
+        latitude: Any
+        longitude: Any
+        if self._recent:
+            latitude = f"{self._random.uniform(42, 51):.5f}"
+            longitude = f"{self._random.uniform(-4, 8):.5f}"
+            latitude = latitude.replace(".", ",")
+            longitude = longitude.replace(".", ",")
+            if self._random.random() < 0.05:
+                latitude = longitude = self._choice("", "-")
+        elif self._random.random() < 0.5:
+            latitude = round(self._random.uniform(42, 51) * 100_000)
+            longitude = round(self._random.uniform(-4, 8) * 100_000)
+        else:
+            latitude = longitude = ""
+        return [
+            accident_id,
+            self._random.randint(1, 28),
+            self._random.randint(1, 12),
+            self._year % 100,
+            hour_minute,
+            self._choice(1, 2, 3, 4, 5, -1, weights=(60, 8, 10, 2, 18, 2)),
+            self._choice(*_DEPARTMENTS),
+            self._choice(*_COMMUNES),
+            self._choice(1, 2, weights=(30, 70)),
+            self._choice(
+                0, 1, 2, 3, 6, 9, -1, weights=(5, 60, 10, 10, 8, 5, 2)
+            ),
+            self._choice("", -1, 1, 2, 8, 9, weights=(1, 1, 80, 10, 4, 4)),
+            self._choice("", -1, 1, 3, 6, 7, weights=(1, 1, 10, 20, 60, 8)),
+            self._choice(*_ADDRESSES),
+            latitude,
+            longitude,
+        ]
+
+    def location(self, accident_id: int) -> list[Any]:
+        pr = self._choice("", "-1", "12", "(3)")
+        pr1 = self._choice("", "-1", "250", "(400)")
+        if self._random.random() < 0.1:
+            # Swapped columns.
+            pr, pr1 = "1.5", "7"
+        return [
+            accident_id,
+            self._choice(
+                1, 2, 3, 4, 5, 6, 7, 9, weights=(5, 10, 35, 40, 2, 2, 4, 2)
+            ),
+            self._choice(*_ROADS),
+            self._choice("", 0, 1, 2),
+            self._choice("N/A", "", "A", "B", weights=(70, 20, 5, 5)),
+            self._choice(
+                "", 0, -1, 1, 2, 3, 4, weights=(2, 2, 1, 30, 60, 3, 2)
+            ),
+            self._choice("", 1, 2, 3, 4),
+            self._choice("", -1, 0, 1, 2, 3, weights=(5, 2, 85, 3, 3, 2)),
+            self._choice(
+                "", 0, -1, 1, 2, 3, 4, weights=(2, 2, 1, 80, 10, 3, 2)
+            ),
+            pr,
+            pr1,
+            self._choice(
+                "", 0, -1, 1, 2, 3, 4, weights=(2, 2, 1, 70, 12, 12, 1)
+            ),
+            self._choice("", "0", "1,5", "3", weights=(50, 40, 5, 5)),
+            self._choice("", "60", "7,5", "0", weights=(30, 30, 30, 10)),
+        ]
+
+    def _vehicle_id(self, vehicle_id: int) -> str:
+        return (
+            f"{vehicle_id // 1_000_000}\xa0"
+            f"{vehicle_id // 1000 % 1000:03d}\xa0"
+            f"{vehicle_id % 1000:03d}"
+        )
+
+    def vehicle(
+            self,
+            accident_id: int,
+            vehicle_id: int,
+            vehicle_name: str,
+    ) -> list[Any]:
+        return [
+            accident_id,
+            *([self._vehicle_id(vehicle_id)] if self._recent else []),
+            vehicle_name,
+            self._choice("", 0, -1, 1, 2, 3),
+            self._choice(
+                0, -1, 1, 7, 19, 33, 99, weights=(1, 1, 8, 70, 1, 14, 5)
+            ),
+            self._choice("", "00", 0, -1, 1, 17, weights=(2, 2, 80, 2, 10, 4)),
+            self._choice("", 0, -1, 1, 2, 9, weights=(2, 20, 2, 10, 60, 6)),
+            self._choice("", 0, -1, 1, 9),
+            self._choice("", "00", 0, -1, 1, 26),
+            *([self._choice(0, -1, 1, 6)] if self._recent else []),
+            self._choice("", 0, 3, weights=(60, 38, 2)),
+        ]
+
+    def person(
+            self,
+            accident_id: int,
+            vehicle_id: int,
+            vehicle_name: str,
+    ) -> list[Any]:
+        safety_equipment = (
+            [
+                self._choice(-1, 0, 1, 2, 7, 8, 9, 11),
+                self._choice(-1, 0, 3),
+                self._choice(-1, 0, 4, 5, 6),
+            ]
+            if self._recent else
+            [self._choice("", "11", "21", "93", "70", "8", "0")]
+        )
+        return [
+            accident_id,
+            *([self._vehicle_id(vehicle_id)] if self._recent else []),
+            vehicle_name,
+            self._choice("", 0, 1, 2, 10),
+            self._choice(1, 2, 3, 4, weights=(70, 20, 9, 1)),
+            self._choice(1, 2, 3, 4, weights=(40, 3, 15, 42)),
+            self._choice(1, 2, weights=(68, 32)),
+            self._choice("", *range(1920, 2015)),
+            self._choice("", 0, -1, 1, 5, 9),
+            *safety_equipment,
+            self._choice("", 0, -1, 9, 1, 8),
+            self._choice("", 0, -1, 7, 8, "B", "A", 1, 9),
+            self._choice("", 0, -1, 1, 3),
+        ]
+
+
+def _headers(year: int) -> dict[str, list[str]]:
+    recent = year >= 2019
+    vehicle_id = ["id_vehicule"] if recent else []
+    return {
+        "caracteristiques": [
+            "Num_Acc", "jour", "mois", "an", "hrmn", "lum", "dep", "com",
+            "agg", "int", "atm", "col", "adr", "lat", "long",
+        ],
+        "lieux": [
+            "Num_Acc", "catr", "voie", "v1", "v2", "circ", "nbv", "vosp",
+            "prof", "pr", "pr1", "plan", "lartpc", "larrout",
+        ],
+        "vehicules": [
+            "Num_Acc", *vehicle_id, "num_veh", "senc", "catv", "obs",
+            "obsm", "choc", "manv", *(["motor"] if recent else []), "occutc",
+        ],
+        "usagers": [
+            "Num_Acc", *vehicle_id, "num_veh", "place", "catu", "grav",
+            "sexe", "an_nais", "trajet",
+            *(["secu1", "secu2", "secu3"] if recent else ["secu"]),
+            "locp", "actp", "etatp",
+        ],
+    }
+
+
+def _delimiter(name: str, year: int) -> str:
+    if year >= 2019:
+        return ";"
+    elif year == 2009 and name == "caracteristiques":
+        return "\t"
+    else:
+        return ","
+
+
+def _encoding(name: str) -> str:
+    if name in ("caracteristiques", "lieux"):
+        return "latin-1"
+    return "utf-8"
+
+
+def generate(
+        output_dir: Path,
+        accidents_per_year: int,
+        years: Sequence[int] = YEARS,
+        seed: int = 0,
+) -> list[Path]:
+    output_dir.mkdir(parents=True, exist_ok=True)
+    random = Random(seed)
+    paths: list[Path] = []
+    for year in years:
+        generator = _YearGenerator(year, random)
+        rows: dict[str, list[list[Any]]] = {
+            name: [] for name in _headers(year)
+        }
+        vehicle_id = 100_000_000 + year * 1000
+        for index in range(accidents_per_year):
+            accident_id = year * 100_000_000 + index + 1
+            rows["caracteristiques"].append(
+                generator.characteristics(accident_id)
+            )
+            rows["lieux"].append(generator.location(accident_id))
+            vehicles = []
+            for vehicle_index in range(random.randint(1, 3)):
+                vehicle_id += 1
+                vehicle_name = f"{chr(ord('A') + vehicle_index)}01"
+                vehicles.append((vehicle_id, vehicle_name))
+                rows["vehicules"].append(
+                    generator.vehicle(accident_id, vehicle_id, vehicle_name)
+                )
+            for _ in range(random.randint(0, 4)):
+                person_vehicle_id, person_vehicle_name = random.choice(
+                    vehicles
+                )
+                if random.random() < 0.05:
+                    # Person of a vehicle that is missing.
+                    person_vehicle_id = 999_000_000 + index
+                    person_vehicle_name = "Z99"
+                rows["usagers"].append(generator.person(
+                    accident_id, person_vehicle_id, person_vehicle_name
+                ))
+        for name, header in _headers(year).items():
+            path = output_dir / f"{name}-{year}.csv"
+            with path.open("w", encoding=_encoding(name), newline="") as file:
+                csv_writer = writer(
+                    file,
+                    delimiter=_delimiter(name, year),
+                    quoting=QUOTE_ALL,
+                    lineterminator="\n",
+                )
+                csv_writer.writerow(header)
+                csv_writer.writerows(
+                    [_pad(value, random) for value in row]
+                    for row in rows[name]
+                )
+            paths.append(path)
+    return paths
+
+
+def _parse_args() -> Namespace:
+    parser = ArgumentParser(
+        description="Generate synthetic CSV files of road accidents."
+    )
+    parser.add_argument(
+        "output_dir",
+        type=Path,
+        help="Directory to write the CSV files to.",
+    )
+    parser.add_argument(
+        "-n", "--accidents-per-year",
+        type=int,
+        default=1000,
+        help="Number of accidents per year. (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-y", "--years",
+        type=int,
+        nargs="+",
+        default=list(YEARS),
+        help="Years to generate files for. (default: 2005 to 2020)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the random generator. (default: %(default)s)",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    generate(**vars(_parse_args()))
@@ -0,0 +1,35 @@
+from pathlib import Path
+from sys import path as sys_path
+from typing import Any, Iterable
+
+from pytest import fixture
+
+# Import the preprocessing modules like the scripts do.
+sys_path.insert(0, str(Path(__file__).parent.parent))
+
+from join import join_in_memory  # noqa: E402
+from model import Accident  # noqa: E402
+from preprocess import _PARSERS, _matching_files  # noqa: E402
+from synthetic import generate  # noqa: E402
+
+# Prefixes of the characteristics, locations, vehicles, and persons files.
+_PREFIXES = ("caracteristiques", "lieux", "vehicules", "usagers")
+
+
+def parse(input_paths: list[list[Path]]) -> list[Iterable[Any]]:
+    return [
+        parser_type().parse(paths)
+        for parser_type, paths in zip(_PARSERS, input_paths)
+    ]
+
+
+@fixture(scope="session")
+def input_paths(tmp_path_factory) -> list[list[Path]]:
+    # Few accidents of each year, to cover all years' file formats.
+    files = generate(tmp_path_factory.mktemp("csv"), accidents_per_year=20)
+    return [_matching_files(files, prefix) for prefix in _PREFIXES]
+
+
+@fixture(scope="session")
+def accidents(input_paths: list[list[Path]]) -> list[Accident]:
+    return list(join_in_memory(*parse(input_paths)))
@@ -0,0 +1,289 @@
+from hashlib import sha1, sha256
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps
+from os import utime
+from pathlib import Path
+from threading import Lock, Thread
+from time import sleep
+from typing import Iterator, NamedTuple, Optional
+
+from pytest import fixture, raises
+from requests import RequestException
+
+from cache import cache_artifacts
+
+# Local stand-in for the dataset page and its files, with entity tags,
+# conditional and range requests, and persistent connections.
+
+
+class _Request(NamedTuple):
+    path: str
+    headers: dict[str, str]
+    status: int
+    client: tuple
+
+
+class _Server(ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.files: dict[str, bytes] = {}
+        # Published checksums that differ from the files' checksums.
+        self.wrong_checksums: set[str] = set()
+        # Files whose next response is cut off after half of the body.
+        self.truncate: set[str] = set()
+        self.requests: list[_Request] = []
+        self.lock = Lock()
+        self.active = 0
+        self.max_active = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def file_requests(self, name: str) -> list[_Request]:
+        return [
+            request
+            for request in self.requests
+            if request.path == f"/files/{name}"
+        ]
+
+    def page(self) -> bytes:
+        distribution = [
+            {
+                "name": name.replace("-", "_"),
+                "fileFormat": "text/csv",
+                "contentUrl": f"{self.url}/files/{name}",
+                "contentSize": str(len(content)),
+                "checksum": {
+                    "type": "sha1",
+                    "value": sha1(
+                        content + b"x"
+                        if name in self.wrong_checksums else
+                        content
+                    ).hexdigest(),
+                },
+            }
+            for name, content in self.files.items()
+        ]
+        distribution.append({
+            "name": "description.pdf",
+            "fileFormat": "application/pdf",
+            "contentUrl": f"{self.url}/files/description.pdf",
+        })
+        json = dumps({
+            "license": "https://example.com/license",
+            "distribution": distribution,
+        })
+        return (
+            f'<html><script id="json_ld" type="application/ld+json">'
+            f'{json}</script></html>'
+        ).encode()
+
+
+def _etag(content: bytes) -> str:
+    return f'"{sha256(content).hexdigest()[:16]}"'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: _Server
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _send(
+            self,
+            status: int,
+            body: bytes = b"",
+            headers: Optional[dict[str, str]] = None,
+            truncate: bool = False,
+    ) -> None:
+        with self.server.lock:
+            self.server.requests.append(_Request(
+                self.path, dict(self.headers), status, self.client_address
+            ))
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if truncate:
+            # Close the connection in the middle of the body.
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+        else:
+            self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        if self.path == "/dataset/":
+            self._send(200, self.server.page(), {"Content-Type": "text/html"})
+            return
+        name = self.path.removeprefix("/files/")
+        content = self.server.files.get(name)
+        if content is None:
+            self._send(404)
+            return
+        with self.server.lock:
+            self.server.active += 1
+            self.server.max_active = max(
+                self.server.max_active, self.server.active
+            )
+            truncate = name in self.server.truncate
+            self.server.truncate.discard(name)
+        # Overlap concurrent downloads.
+        sleep(0.05)
+        with self.server.lock:
+            self.server.active -= 1
+        etag = _etag(content)
+        headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304, headers={"ETag": etag})
+            return
+        range_ = self.headers.get("Range")
+        if range_ is not None and self.headers.get("If-Range") == etag:
+            start = int(range_.removeprefix("bytes=").removesuffix("-"))
+            if start >= len(content):
+                self._send(416, headers={
+                    "Content-Range": f"bytes */{len(content)}",
+                })
+                return
+            self._send(206, content[start:], {
+                **headers,
+                "Content-Range":
+                    f"bytes {start}-{len(content) - 1}/{len(content)}",
+            })
+            return
+        self._send(200, content, headers, truncate)
+
+
+@fixture
+def server() -> Iterator[_Server]:
+    server = _Server()
+    # Larger than a download chunk, to stream it in multiple chunks.
+    server.files["usagers-2020.csv"] = b"a;b\n" + b"1;2\n" * (1 << 19)
+    server.files["vehicules-2020.csv"] = b"a;b\n" + b"3;4\n" * 1000
+    server.files["lieux-2020.csv"] = b"a;b\n5;6\n"
+    thread = Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def _cache(
+        server: _Server,
+        cache_dir: Path,
+        verify: bool = False,
+) -> dict[str, bytes]:
+    paths = cache_artifacts(
+        max_workers=3,
+        dataset_url=f"{server.url}/dataset/",
+        cache_dir=cache_dir,
+        verify=verify,
+    )
+    return {path.name: path.read_bytes() for path in paths}
+
+
+def test_download(server: _Server, tmp_path: Path):
+    assert _cache(server, tmp_path) == server.files
+    # Downloaded concurrently, over at most one connection per worker.
+    assert server.max_active > 1
+    assert len({request.client for request in server.requests}) <= 3
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(
+        name
+        for file_name in server.files
+        for name in (file_name, f"{file_name}.json")
+    )
+
+
+def test_revalidate(server: _Server, tmp_path: Path):
+    _cache(server, tmp_path)
+    mtime_ns = (tmp_path / "lieux-2020.csv").stat().st_mtime_ns
+    server.requests.clear()
+    assert _cache(server, tmp_path) == server.files
+    for name in server.files:
+        request, = server.file_requests(name)
+        assert request.status == 304
+        assert request.headers["If-None-Match"] == \
+               _etag(server.files[name])
+    assert (tmp_path / "lieux-2020.csv").stat().st_mtime_ns == mtime_ns
+
+    # Changed files are downloaded again.
+    server.files["lieux-2020.csv"] = b"a;b\n7;8\n"
+    server.requests.clear()
+    assert _cache(server, tmp_path) == server.files
+    request, = server.file_requests("lieux-2020.csv")
+    assert request.status == 200
+
+
+def test_checksum_mismatch(server: _Server, tmp_path: Path):
+    server.wrong_checksums.add("lieux-2020.csv")
+    with raises(ValueError, match="Checksum mismatch"):
+        _cache(server, tmp_path)
+    assert not (tmp_path / "lieux-2020.csv").exists()
+
+
+def test_verify(server: _Server, tmp_path: Path):
+    _cache(server, tmp_path)
+    # Corrupt a file without changing its size or modification time.
+    path = tmp_path / "lieux-2020.csv"
+    stat = path.stat()
+    path.write_bytes(b"a;b\n5;7\n")
+    utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert _cache(server, tmp_path)["lieux-2020.csv"] == b"a;b\n5;7\n"
+    assert _cache(server, tmp_path, verify=True) == server.files
+
+
+def test_resume(server: _Server, tmp_path: Path):
+    name = "usagers-2020.csv"
+    server.truncate.add(name)
+    with raises(RequestException):
+        _cache(server, tmp_path)
+    partial_path = tmp_path / f"{name}.part"
+    offset = partial_path.stat().st_size
+    assert 0 < offset < len(server.files[name])
+
+    server.requests.clear()
+    assert _cache(server, tmp_path) == server.files
+    request, = server.file_requests(name)
+    assert request.status == 206
+    assert request.headers["Range"] == f"bytes={offset}-"
+    assert request.headers["If-Range"] == _etag(server.files[name])
+    assert not partial_path.exists()
+    assert not (tmp_path / f"{name}.part.json").exists()
+
+
+def test_resume_changed(server: _Server, tmp_path: Path):
+    name = "usagers-2020.csv"
+    server.truncate.add(name)
+    with raises(RequestException):
+        _cache(server, tmp_path)
+    # The file changed since the interrupted download.
+    server.files[name] = b"a;b\n" + b"9;9\n" * (1 << 19)
+    server.requests.clear()
+    assert _cache(server, tmp_path) == server.files
+    request, = server.file_requests(name)
+    assert request.status == 200
+
+
+def test_resume_invalid_range(server: _Server, tmp_path: Path):
+    name = "lieux-2020.csv"
+    content = server.files[name]
+    # A partial file that is longer than the file.
+    (tmp_path / f"{name}.part").write_bytes(content * 2)
+    (tmp_path / f"{name}.part.json").write_text(_etag(content))
+    assert _cache(server, tmp_path) == server.files
+    assert [
+        request.status for request in server.file_requests(name)
+    ] == [416, 200]
+
+
+def test_resume_without_validator(server: _Server, tmp_path: Path):
+    name = "lieux-2020.csv"
+    (tmp_path / f"{name}.part").write_bytes(b"x;y\n")
+    assert _cache(server, tmp_path) == server.files
+    request, = server.file_requests(name)
+    assert "Range" not in request.headers
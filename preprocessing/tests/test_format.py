@@ -0,0 +1,64 @@
+from pathlib import Path
+from typing import Iterator
+
+from pytest import mark, raises
+
+from model import Accident
+from parse import MultiFormatter
+from parse.accident import (
+    AccidentsJsonlFormatter, AccidentsShardedJsonlFormatter
+)
+from parse.parquet import AccidentsParquetFormatter
+from parse.sqlite import AccidentsSqliteFormatter
+from parse.time_series import TimeSeriesFormatter
+
+
+def _formatter() -> MultiFormatter:
+    return MultiFormatter(
+        [
+            AccidentsJsonlFormatter(compressions=("gzip",)),
+            AccidentsShardedJsonlFormatter(),
+            AccidentsParquetFormatter(),
+            AccidentsSqliteFormatter(),
+            TimeSeriesFormatter(compressions=("gzip",)),
+        ],
+        chunk_size=10,
+    )
+
+
+def _files(directory: Path) -> dict[Path, bytes]:
+    return {
+        path.relative_to(directory): path.read_bytes()
+        for path in directory.rglob("*")
+        if path.is_file()
+    }
+
+
+def test_abort(accidents: list[Accident], tmp_path: Path):
+    _formatter().format(accidents, tmp_path)
+    files = _files(tmp_path)
+
+    def failing() -> Iterator[Accident]:
+        yield from accidents[:len(accidents) // 2]
+        raise RuntimeError()
+
+    # The previous outputs are kept, without any temporary files.
+    with raises(RuntimeError):
+        _formatter().format(failing(), tmp_path)
+    assert _files(tmp_path) == files
+
+
+@mark.parametrize("by_department", [False, True])
+def test_shards_unordered(
+        accidents: list[Accident],
+        tmp_path: Path,
+        by_department: bool,
+):
+    formatter = AccidentsShardedJsonlFormatter(by_department=by_department)
+    formatter.format(accidents, tmp_path)
+    files = _files(tmp_path)
+    # A year must not be continued after a later year.
+    unordered = [*accidents, accidents[0]]
+    with raises(ValueError, match="not ordered by year"):
+        formatter.format(unordered, tmp_path)
+    assert _files(tmp_path) == files
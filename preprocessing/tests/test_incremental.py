@@ -0,0 +1,107 @@
+from os import utime
+from pathlib import Path
+from shutil import copy
+
+from pyarrow.parquet import read_table
+from pytest import importorskip, mark
+
+from conftest import parse
+from join import join_streaming
+from parse import MultiFormatter
+from parse.accident import AccidentsJsonlFormatter
+from parse.parquet import AccidentsParquetFormatter
+from preprocess import _build_incremental, _file_year
+from synthetic import YEARS
+
+_FORMATS = ("jsonl", "parquet")
+
+
+def _copy(input_paths: list[list[Path]], directory: Path) -> list[list[Path]]:
+    directory.mkdir()
+    return [
+        [Path(copy(path, directory)) for path in paths]
+        for paths in input_paths
+    ]
+
+
+def _build(
+        input_paths: list[list[Path]],
+        tmp_path: Path,
+        json_backend: str = "json",
+        workers: int = 1,
+) -> list[int]:
+    output_dir = tmp_path / "output"
+    output_dir.mkdir(exist_ok=True)
+    return _build_incremental(
+        input_paths,
+        workers,
+        None,
+        _FORMATS,
+        json_backend,
+        output_dir,
+        tmp_path / "years",
+    )
+
+
+def _assert_full_build(
+        input_paths: list[list[Path]],
+        tmp_path: Path,
+        json_backend: str = "json",
+):
+    # The spliced outputs equal the outputs of a full build.
+    full_dir = tmp_path / "full"
+    full_dir.mkdir(exist_ok=True)
+    MultiFormatter([
+        AccidentsJsonlFormatter(backend=json_backend),
+        AccidentsParquetFormatter(),
+    ]).format(join_streaming(*parse(input_paths)), full_dir)
+    output_dir = tmp_path / "output"
+    for name in ("accidents.jsonl", "accidents.jsonl.index"):
+        assert (output_dir / name).read_bytes() == \
+               (full_dir / name).read_bytes()
+    for name in ("accidents.parquet", "vehicles.parquet", "persons.parquet"):
+        assert read_table(output_dir / name).equals(
+            read_table(full_dir / name)
+        )
+
+
+@mark.parametrize("workers", [1, 2])
+def test_splice(
+        input_paths: list[list[Path]],
+        tmp_path: Path,
+        workers: int,
+):
+    assert _build(input_paths, tmp_path, workers=workers) == list(YEARS)
+    _assert_full_build(input_paths, tmp_path)
+
+
+def test_outdated_years(input_paths: list[list[Path]], tmp_path: Path):
+    input_paths = _copy(input_paths, tmp_path / "csv")
+    _build(input_paths, tmp_path)
+    jsonl = (tmp_path / "output" / "accidents.jsonl").read_bytes()
+
+    # Nothing changed, only a modification time.
+    path = input_paths[0][0]
+    utime(path, ns=(0, 0))
+    assert _build(input_paths, tmp_path) == []
+    assert (tmp_path / "output" / "accidents.jsonl").read_bytes() == jsonl
+
+    # One year's file changed.
+    with path.open("ab") as file:
+        file.write(b"\n")
+    assert _build(input_paths, tmp_path) == [_file_year(path)]
+
+    # The cached years are invalidated if a required output is missing.
+    year = _file_year(input_paths[0][-1])
+    (tmp_path / "years" / str(year) / "persons.parquet").unlink()
+    assert _build(input_paths, tmp_path) == [year]
+    _assert_full_build(input_paths, tmp_path)
+
+
+def test_json_backend(input_paths: list[list[Path]], tmp_path: Path):
+    importorskip("orjson")
+    _build(input_paths, tmp_path)
+    # Years written with another JSON backend cannot be spliced.
+    assert _build(input_paths, tmp_path, "orjson") == list(YEARS)
+    _assert_full_build(input_paths, tmp_path, "orjson")
+    assert _build(input_paths, tmp_path, "orjson") == []
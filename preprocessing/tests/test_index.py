@@ -0,0 +1,75 @@
+from datetime import datetime
+from json import loads
+from pathlib import Path
+
+from pytest import fixture, raises
+
+from model import Accident
+from parse.accident import AccidentsJsonlFormatter
+from parse.index import AccidentsReader, JsonlIndex
+
+
+@fixture
+def path(accidents: list[Accident], tmp_path: Path) -> Path:
+    AccidentsJsonlFormatter().format(accidents, tmp_path)
+    return tmp_path / "accidents.jsonl"
+
+
+def test_get(path: Path):
+    lines = path.read_bytes().splitlines()
+    with AccidentsReader(path) as reader:
+        assert len(reader) == len(lines)
+        for line in lines:
+            accident = loads(line)
+            accident_id = accident["accident_id"]
+            assert reader.get_line(accident_id) == line
+            assert reader.get(accident_id) == accident
+        assert reader.get(0) is None
+        assert reader.get(10 ** 12) is None
+
+
+def test_range(accidents: list[Accident], path: Path):
+    ids = sorted(accident.accident_id for accident in accidents)
+    start_id, end_id = ids[len(ids) // 4], ids[len(ids) // 2]
+    with AccidentsReader(path) as reader:
+        assert [
+            accident["accident_id"]
+            for accident in reader.range(start_id, end_id)
+        ] == [
+            accident_id
+            for accident_id in ids
+            if start_id <= accident_id < end_id
+        ]
+        assert list(reader.range(end_id, start_id)) == []
+
+
+def test_between(accidents: list[Accident], path: Path):
+    start, end = datetime(2010, 1, 1), datetime(2015, 7, 1, 12)
+    with AccidentsReader(path) as reader:
+        found = [
+            (accident["timestamp"], accident["accident_id"])
+            for accident in reader.between(start, end)
+        ]
+    timestamps = [timestamp for timestamp, _ in found]
+    assert timestamps == sorted(timestamps)
+    assert sorted(accident_id for _, accident_id in found) == sorted(
+        accident.accident_id
+        for accident in accidents
+        if start <= accident.timestamp < end
+    )
+
+
+def test_empty(tmp_path: Path):
+    AccidentsJsonlFormatter().format([], tmp_path)
+    with AccidentsReader(tmp_path / "accidents.jsonl") as reader:
+        assert len(reader) == 0
+        assert reader.get(200500000001) is None
+        assert list(reader.between(datetime.min, datetime.max)) == []
+
+
+def test_duplicate_ids(tmp_path: Path):
+    index = JsonlIndex()
+    index.add(200500000001, datetime(2005, 1, 1), 0, 10)
+    index.add(200500000001, datetime(2005, 1, 1), 10, 10)
+    with raises(ValueError):
+        index.write(tmp_path / "accidents.jsonl.index")
@@ -0,0 +1,80 @@
+from pathlib import Path
+from typing import Optional
+
+from pytest import mark, raises
+
+from conftest import parse
+from join import join_streaming, join_sqlite, accident_year
+from model import Accident
+from parse.encode import encode_accident
+from parse.parallel import parse_parallel
+from preprocess import _PARSERS, main
+from synthetic import YEARS
+
+
+def _encode(accidents: list[Accident]) -> list[str]:
+    # Also compare the order of the persons' safety equipment sets.
+    return [encode_accident(accident) for accident in accidents]
+
+
+def test_in_memory_join(
+        input_paths: list[list[Path]],
+        accidents: list[Accident],
+):
+    assert len(accidents) == 20 * len(YEARS)
+    years = {accident_year(accident.accident_id) for accident in accidents}
+    assert years == set(YEARS)
+    # Persons of missing vehicles are assigned to repaired vehicles.
+    *_, persons = parse(input_paths)
+    assert sum(
+        len(vehicle.persons)
+        for accident in accidents
+        for vehicle in accident.vehicles
+    ) == sum(1 for _ in persons)
+    assert any(
+        vehicle.vehicle_name == "Z99"
+        for accident in accidents
+        for vehicle in accident.vehicles
+    )
+
+
+def test_streaming_join(
+        input_paths: list[list[Path]],
+        accidents: list[Accident],
+):
+    joined = list(join_streaming(*parse(input_paths)))
+    assert _encode(joined) == _encode(accidents)
+
+
+@mark.parametrize("prefetch", [None, 1])
+def test_parallel_streaming_join(
+        input_paths: list[list[Path]],
+        accidents: list[Accident],
+        prefetch: Optional[int],
+):
+    jobs = [
+        (parser_type(), paths)
+        for parser_type, paths in zip(_PARSERS, input_paths)
+    ]
+    with parse_parallel(jobs, max_workers=2, prefetch=prefetch) as parsed:
+        joined = list(join_streaming(*parsed))
+    assert _encode(joined) == _encode(accidents)
+
+
+def test_sqlite_join(
+        input_paths: list[list[Path]],
+        accidents: list[Accident],
+        tmp_path: Path,
+):
+    joined = list(join_sqlite(
+        *parse(input_paths),
+        memory_budget=1 << 20,
+        directory=tmp_path,
+    ))
+    assert _encode(joined) == _encode(accidents)
+
+
+def test_sqlite_join_workers():
+    # Rejected before downloading anything.
+    with raises(ValueError, match="multiple workers"):
+        main(workers=2, join="sqlite")
@@ -0,0 +1,19 @@
+from pickle import dumps, loads
+
+from model import Accident, AccidentTable, RecordTable, VehicleId
+
+
+def test_accident_table(accidents: list[Accident]):
+    table = AccidentTable(accidents)
+    assert len(table) == len(accidents)
+    assert list(table) == accidents
+    assert table[-1] == accidents[-1]
+    assert table[3:7] == accidents[3:7]
+    # Tables are sent to and from worker processes.
+    assert list(loads(dumps(table))) == accidents
+
+
+def test_record_table_none():
+    vehicle_ids = [VehicleId("A01", None), VehicleId("", 1 << 40)]
+    table = RecordTable(VehicleId, vehicle_ids)
+    assert list(loads(dumps(table))) == vehicle_ids
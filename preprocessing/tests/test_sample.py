@@ -0,0 +1,21 @@
+from pathlib import Path
+
+from pytest import mark
+
+from model import Accident
+from parse.accident import AccidentsJsonlFormatter
+from parse.index import JsonlIndex, index_path
+from parse.sample import sample_path, write_samples
+
+
+@mark.parametrize("seed", [0, 1, -1, 1 << 63])
+def test_samples(accidents: list[Accident], tmp_path: Path, seed: int):
+    AccidentsJsonlFormatter().format(accidents, tmp_path)
+    path = tmp_path / "accidents.jsonl"
+    write_samples(path, JsonlIndex.read(index_path(path)), [10, 50], seed)
+    small = sample_path(path, 10).read_bytes()
+    large = sample_path(path, 50).read_bytes()
+    # Smaller samples are the first lines of larger samples.
+    assert len(large.splitlines()) == 50
+    assert large.startswith(small)
+    assert set(large.splitlines()) <= set(path.read_bytes().splitlines())
@@ -0,0 +1,29 @@
+from csv import Sniffer
+from pathlib import Path
+from shutil import copy
+
+from pytest import mark, raises
+
+from preprocess import _PARSERS
+
+
+@mark.parametrize("extra_fields", [-1, 1])
+def test_ragged_row(
+        input_paths: list[list[Path]],
+        tmp_path: Path,
+        extra_fields: int,
+):
+    for parser_type, paths in zip(_PARSERS, input_paths):
+        path = Path(copy(paths[-1], tmp_path))
+        lines = path.read_text(encoding="latin-1").splitlines()
+        delimiter = Sniffer().sniff(lines[0]).delimiter
+        fields = lines[-1].split(delimiter)
+        fields = fields + ["1"] if extra_fields > 0 else fields[:-1]
+        lines.append(delimiter.join(fields))
+        path.write_text("\n".join(lines), encoding="latin-1")
+        with raises(
+                ValueError,
+                match=rf"{path.name} at line {len(lines)}: "
+                      rf"Expected \d+ fields, got \d+\.",
+        ):
+            list(parser_type().parse([path]))
@@ -0,0 +1,123 @@
+from asyncio import open_connection, run, start_server
+from gzip import decompress
+from json import load, loads
+from pathlib import Path
+from typing import Tuple
+
+from pytest import fixture
+
+from model import Accident
+from parse.accident import AccidentsJsonlFormatter
+from parse.time_series import AGGREGATES, GROUPS, TimeSeriesFormatter
+from serve import AccidentsIndex, AggregateServer
+
+
+@fixture
+def output_dir(accidents: list[Accident], tmp_path: Path) -> Path:
+    AccidentsJsonlFormatter().format(accidents, tmp_path)
+    TimeSeriesFormatter().format(accidents, tmp_path)
+    return tmp_path
+
+
+@fixture
+def index(output_dir: Path) -> AccidentsIndex:
+    return AccidentsIndex(output_dir / "accidents.jsonl")
+
+
+def _get(
+        server: AggregateServer,
+        target: str,
+        method: str = "GET",
+) -> Tuple[int, dict]:
+    status, body, gzip = run(server._respond(method, target, {}))
+    assert not gzip
+    return status, loads(body)
+
+
+def test_time_series(index: AccidentsIndex, output_dir: Path):
+    with (output_dir / "time-series.json").open("r") as file:
+        expected = load(file)
+    server = AggregateServer(index)
+    for aggregate in AGGREGATES.keys():
+        for group in GROUPS:
+            status, result = _get(
+                server,
+                f"/time-series?aggregate={aggregate}&group={group}",
+            )
+            assert status == 200
+            assert result["dimensions"] == expected["dimensions"]
+            assert result["buckets"] == \
+                   expected["aggregates"][aggregate][group]
+
+
+def test_filters(accidents: list[Accident], index: AccidentsIndex):
+    server = AggregateServer(index)
+    status, result = _get(
+        server, "/grid?zoom=0&start=2010-01-01&end=2015-07-01T12:00"
+    )
+    assert status == 200
+    assert sum(tile["accidents"] for tile in result["tiles"]) == sum(
+        1
+        for accident in accidents
+        if accident.latitude is not None and accident.longitude is not None
+        and "2010-01-01" <= accident.timestamp.isoformat() < "2015-07-01T12"
+    )
+    # Accidents without coordinates are outside any bounds.
+    status, result = _get(server, "/partitions?bounds=40,-5,52,10")
+    assert status == 200
+    assert result["count"] == sum(
+        1
+        for accident in accidents
+        if accident.latitude is not None and accident.longitude is not None
+        and 40 <= accident.latitude <= 52 and -5 <= accident.longitude <= 10
+    )
+
+
+def test_errors(index: AccidentsIndex):
+    server = AggregateServer(index)
+    assert _get(server, "/time-series?start=2010-01-01T00:00+01:00")[0] == 400
+    assert _get(server, "/time-series?aggregate=hour")[0] == 400
+    assert _get(server, "/grid?zoom=21")[0] == 400
+    assert _get(server, "/unknown")[0] == 404
+    assert _get(server, "/time-series", method="POST")[0] == 405
+
+
+def test_internal_error(index: AccidentsIndex, monkeypatch):
+    server = AggregateServer(index)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError()
+
+    with monkeypatch.context() as patch:
+        patch.setattr(index, "time_series", fail)
+        assert _get(server, "/time-series") == (
+            500, {"error": "Internal server error."}
+        )
+    # Failed responses are not cached.
+    assert _get(server, "/time-series")[0] == 200
+
+
+def test_connection(index: AccidentsIndex):
+    server = AggregateServer(index)
+
+    async def request() -> Tuple[bytes, bytes]:
+        async with await start_server(server.handle, "127.0.0.1", 0) as tcp:
+            port = tcp.sockets[0].getsockname()[1]
+            reader, writer = await open_connection("127.0.0.1", port)
+            writer.write(
+                b"GET /time-series HTTP/1.1\r\n"
+                b"Accept-Encoding: gzip\r\n"
+                b"Connection: close\r\n"
+                b"\r\n"
+            )
+            await writer.drain()
+            head, _, body = (await reader.read()).partition(b"\r\n\r\n")
+            writer.close()
+            return head, body
+
+    head, body = run(request())
+    lines = head.decode("latin-1").split("\r\n")
+    assert lines[0] == "HTTP/1.1 200 OK"
+    assert "Content-Encoding: gzip" in lines
+    assert f"Content-Length: {len(body)}" in lines
+    assert loads(decompress(body)) == _get(server, "/time-series")[1]
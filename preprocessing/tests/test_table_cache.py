@@ -0,0 +1,40 @@
+from pathlib import Path
+
+from pytest import mark
+
+from conftest import parse
+from parse.table_cache import TableCache
+from preprocess import _PARSERS
+
+
+def _parse(input_paths: list[list[Path]], cache: TableCache) -> list[list]:
+    return [
+        list(parser_type(cache).parse(paths))
+        for parser_type, paths in zip(_PARSERS, input_paths)
+    ]
+
+
+def test_table_cache(input_paths: list[list[Path]], tmp_path: Path):
+    cache = TableCache(max_bytes=1 << 30, cache_dir=tmp_path)
+    parsed = [list(records) for records in parse(input_paths)]
+    assert _parse(input_paths, cache) == parsed
+    assert len(list(tmp_path.glob("*.pickle"))) == \
+           sum(len(paths) for paths in input_paths)
+    # Loaded from the cache.
+    assert _parse(input_paths, cache) == parsed
+
+
+@mark.parametrize("content", [b"", b"\x80\x05garbage", b"not a pickle"])
+def test_table_cache_corrupted(
+        input_paths: list[list[Path]],
+        tmp_path: Path,
+        content: bytes,
+):
+    cache = TableCache(max_bytes=1 << 30, cache_dir=tmp_path)
+    parsed = _parse(input_paths, cache)
+    for entry_path in tmp_path.glob("*.pickle"):
+        entry_path.write_bytes(content)
+    # Corrupted entries are parsed and cached again.
+    assert _parse(input_paths, cache) == parsed
+    for entry_path in tmp_path.glob("*.pickle"):
+        assert entry_path.read_bytes() != content